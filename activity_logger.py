@@ -1,142 +1,465 @@
 """
 Activity logger helper functions for tracking user actions
+
+In 'buffered' mode (the default) log_activity() does not write to the
+database: rows go into a bounded in-memory queue per worker process, and
+a background thread writes them with one multi-row INSERT per batch once
+ACTIVITY_LOG_BATCH_SIZE rows are waiting or ACTIVITY_LOG_FLUSH_SECONDS
+have passed, and again at interpreter exit. When the queue is full the
+caller writes a batch itself, so a stalled writer slows requests down
+instead of growing memory. Rows still queued when a worker is killed are
+lost, which is acceptable for an audit trail but not for anything a
+request depends on. 'sync' mode writes each row in the request's session
+as before, which tests use.
 """
 
-from datetime import datetime
-from flask import request
-from models import db, ActivityLog
+import os
+import queue
+import atexit
+import threading
+from datetime import datetime, timedelta, date
+from flask import request, current_app, has_app_context
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import joinedload
+from cache_backends import create_cache
+from feed import encode_cursor, decode_cursor
+from models import db, ActivityLog, ActivityDailyCount
+
+class ActivityBuffer:
+    """Queue of ActivityLog rows written in batches outside the request's session"""
+
+    def __init__(self, app, max_size=10000, batch_size=500, flush_interval=2.0, background=True):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self.flushed = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        # Held while rows are taken off the queue and written, so flush() returns
+        # only once earlier rows are in the database
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Set when a full batch is waiting, to wake the writer before flush_interval is up
+        self._batch_ready = threading.Event()
+        self._writer = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def put(self, row):
+        """Queue a row (a dict of ActivityLog columns); writes a batch first if the queue is full"""
+        self._ensure_writer()
+        while True:
+            try:
+                self._queue.put_nowait(row)
+                if self._queue.qsize() >= self.batch_size:
+                    self._batch_ready.set()
+                return
+            except queue.Full:
+                self.flush(limit=self.batch_size)
+
+    def flush(self, limit=None):
+        """
+        Write queued rows now
+
+        Args:
+            limit: Write at most this many rows; None drains the queue
+
+        Returns:
+            Number of rows taken off the queue
+        """
+        taken = 0
+        with self._write_lock:
+            while limit is None or taken < limit:
+                rows = self._take(min(self.batch_size, limit - taken) if limit is not None else self.batch_size)
+                if not rows:
+                    break
+                self._write(rows)
+                taken += len(rows)
+        return taken
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _take(self, count):
+        rows = []
+        while len(rows) < count:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _ensure_writer(self):
+        # A forked worker inherits the queue's contents but not the thread, so each process starts its own
+        if not self.background or (self._writer is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._writer is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._writer = threading.Thread(target=self._write_forever, name='activity-log-writer', daemon=True)
+                self._writer.start()
+
+    def _write_forever(self):
+        # Rows stay on the queue while the writer waits, so callers are never
+        # blocked behind the wait and flush() at exit sees every unwritten row
+        while True:
+            self._batch_ready.wait(self.flush_interval)
+            self._batch_ready.clear()
+            self.flush()
+
+    def _write(self, rows):
+        """Insert rows in one statement, falling back to one row at a time if the batch fails"""
+        table = ActivityLog.__table__
+        with self.app.app_context():
+            try:
+                db.session.execute(table.insert().values(rows))
+                db.session.commit()
+                self.flushed += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                # One bad row (e.g. a user deleted meanwhile) must not lose the rest of the batch
+                for row in rows:
+                    try:
+                        db.session.execute(table.insert().values(row))
+                        db.session.commit()
+                        self.flushed += 1
+                    except Exception as row_error:
+                        db.session.rollback()
+                        self.dropped += 1
+                        print(f"Error logging activity: {row_error}")
+            finally:
+                db.session.remove()
+
+def init_app(app):
+    """Create the activity log buffer ('buffered' mode) or leave writes synchronous ('sync')"""
+    if app.config.get('ACTIVITY_LOG_MODE', 'buffered') == 'sync':
+        buffer = None
+    else:
+        buffer = ActivityBuffer(
+            app,
+            max_size=app.config.get('ACTIVITY_LOG_QUEUE_SIZE', 10000),
+            batch_size=app.config.get('ACTIVITY_LOG_BATCH_SIZE', 500),
+            flush_interval=app.config.get('ACTIVITY_LOG_FLUSH_SECONDS', 2.0)
+        )
+    app.extensions['activity_logger'] = buffer
+    app.extensions['activity_log_counts'] = create_cache(
+        'memory', max_bytes=1024 * 1024, default_ttl=app.config.get('ACTIVITY_LOG_COUNT_TTL', 300)
+    )
+    app.jinja_env.globals['describe_activity'] = describe_activity
+
+def get_buffer():
+    return current_app.extensions.get('activity_logger') if has_app_context() else None
 
-def log_activity(user_id, activity_type, description, target_user_id=None, activity_data=None):
+# Text shown for each activity type. {target} is the target user's current
+# name; other fields come from activity_data. A ':ai' entry is used instead
+# when activity_data has is_ai set.
+ACTIVITY_TEMPLATES = {
+    'login': 'User logged in',
+    'logout': 'User logged out',
+    'signup': 'User created an account',
+    'create_profile': 'User created their profile',
+    'profile_updated': 'Profile information was updated',
+    'friend_request_sent': 'Sent friend request to {target}',
+    'friend_request_received': 'Received friend request from {target}',
+    'friend_request_accepted': 'Accepted friend request from {target}',
+    'friend_request_declined': 'Declined friend request from {target}',
+    'send_message': 'Sent message to {target}',
+    'receive_message': 'Received message from {target}',
+    'create_post': 'Created a {category} post',
+    'like_post': 'Liked a post',
+    'dislike_post': 'Disliked a post',
+    'create_comment': 'Commented on a post',
+    'create_comment:ai': 'AI commented on a post',
+    'like_comment': 'Liked a comment',
+    'dislike_comment': 'Disliked a comment',
+    'delete_post': 'Deleted a post',
+    'delete_comment': 'Deleted a comment',
+    'chatbot_interaction': 'Interacted with Swift chatbot',
+    'delete_user': 'Deleted user {name} ({email})',
+}
+
+def describe_activity(activity):
+    """
+    Render an activity's description from its type and structured fields
+
+    Reads activity.target_user, so load it with the page (joinedload) to
+    keep this from issuing a query per row.
+
+    Args:
+        activity: ActivityLog row
+
+    Returns:
+        The description text; the stored description when the type has no
+        template or the template needs a field the row lacks (older rows)
+    """
+    data = activity.activity_data or {}
+    template = None
+    if data.get('is_ai'):
+        template = ACTIVITY_TEMPLATES.get(f'{activity.activity_type}:ai')
+    template = template or ACTIVITY_TEMPLATES.get(activity.activity_type)
+    if template is None:
+        return activity.description or activity.activity_type.replace('_', ' ').capitalize()
+
+    fields = dict(data)
+    if activity.target_user_id is not None:
+        fields['target'] = activity.target_user.name if activity.target_user else 'Unknown user'
+    try:
+        return template.format_map(fields)
+    except (KeyError, IndexError, ValueError):
+        return activity.description or activity.activity_type.replace('_', ' ').capitalize()
+
+# Time windows of the activity log page's filter
+ACTIVITY_WINDOWS = {
+    'days': timedelta(days=7),
+    'weeks': timedelta(weeks=4),
+    'months': timedelta(days=30),
+    'years': timedelta(days=365),
+}
+
+# Activity counts stop at this many rows and show as "10,000+"
+COUNT_CAP = 10000
+
+def _activity_query(user_id, window):
+    query = ActivityLog.query.filter(ActivityLog.user_id == user_id)
+    if window in ACTIVITY_WINDOWS:
+        query = query.filter(ActivityLog.created_at >= datetime.utcnow() - ACTIVITY_WINDOWS[window])
+    return query
+
+def activity_page(user_id, window='all', before=None, after=None, page_size=20):
+    """
+    One page of a user's activity log, newest first, by keyset on (created_at, id)
+
+    The user, the window's lower bound and the cursor are all bounds of one
+    range of ix_activity_logs_user_created_id: the cursor is a row-value
+    comparison on (created_at, id), which PostgreSQL uses as a start key,
+    where the equivalent OR of two conditions would only be a filter and
+    make every page read all the rows newer than it.
+
+    Args:
+        user_id: ID of the user whose log is shown
+        window: Key of ACTIVITY_WINDOWS, or 'all'
+        before: Cursor of the oldest row on the previous page, to page back in time
+        after: Cursor of the newest row on the next page, to page forward again
+        page_size: Number of activities per page
+
+    Returns:
+        (activities, newer_cursor, older_cursor); a cursor is None when there
+        is no page in that direction
+    """
+    query = _activity_query(user_id, window).options(joinedload(ActivityLog.target_user))
+    newer = decode_cursor(after)
+    older = decode_cursor(before)
+
+    if newer:
+        created_at, activity_id = newer
+        query = query.filter(tuple_(ActivityLog.created_at, ActivityLog.id) > (created_at, activity_id))
+        query = query.order_by(ActivityLog.created_at.asc(), ActivityLog.id.asc())
+    else:
+        if older:
+            created_at, activity_id = older
+            query = query.filter(tuple_(ActivityLog.created_at, ActivityLog.id) < (created_at, activity_id))
+        query = query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc())
+
+    # Fetch one extra row to know whether another page exists in the direction of travel
+    activities = query.limit(page_size + 1).all()
+    has_more = len(activities) > page_size
+    activities = activities[:page_size]
+    if newer:
+        activities.reverse()
+    if not activities:
+        return [], None, None
+
+    has_newer = has_more if newer else bool(older)
+    has_older = True if newer else has_more
+    return (activities,
+            encode_cursor(activities[0]) if has_newer else None,
+            encode_cursor(activities[-1]) if has_older else None)
+
+def activity_count(user_id, window='all'):
+    """
+    Number of activities in a user's log, capped at COUNT_CAP and cached
+
+    The count only reads up to COUNT_CAP + 1 index entries and is kept for
+    ACTIVITY_LOG_COUNT_TTL seconds, so paging through a long log does not
+    recount it on every page; it lags new activity by up to that long.
+
+    Returns:
+        (count, capped) where capped means there are more than COUNT_CAP
+    """
+    cache = current_app.extensions.get('activity_log_counts')
+    key = f"activity-count:{user_id}:{window}"
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached
+
+    ids = _activity_query(user_id, window).with_entities(ActivityLog.id).limit(COUNT_CAP + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(ids)).scalar()
+    result = (min(count, COUNT_CAP), count > COUNT_CAP)
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+def daily_activity_counts(since, until=None, user_id=None):
+    """
+    Activity totals per day and type, from the raw log and the daily rollups
+
+    Days whose partitions were dropped by `activity_partitions.py retain`
+    only exist in activity_daily_counts; the rows of a partition are moved
+    there in the transaction that drops it (legacy rows in the one that
+    deletes them), so no row is counted twice.
+
+    Args:
+        since: First day (date) to include
+        until: Day (date) to stop before, or None for up to now
+        user_id: Only count this user's activities
+
+    Returns:
+        {(day, activity_type): count}
+    """
+    day = func.date(ActivityLog.created_at)
+    raw = db.session.query(day, ActivityLog.activity_type, func.count()).filter(
+        ActivityLog.created_at >= datetime.combine(since, datetime.min.time()))
+    rolled_up = db.session.query(ActivityDailyCount.day, ActivityDailyCount.activity_type,
+                                 ActivityDailyCount.count).filter(ActivityDailyCount.day >= since)
+    if until is not None:
+        raw = raw.filter(ActivityLog.created_at < datetime.combine(until, datetime.min.time()))
+        rolled_up = rolled_up.filter(ActivityDailyCount.day < until)
+    if user_id is not None:
+        raw = raw.filter(ActivityLog.user_id == user_id)
+        rolled_up = rolled_up.filter(ActivityDailyCount.user_id == user_id)
+
+    counts = {}
+    for row_day, activity_type, count in rolled_up.all() + raw.group_by(day, ActivityLog.activity_type).all():
+        # SQLite returns date() as text
+        if isinstance(row_day, str):
+            row_day = date.fromisoformat(row_day)
+        counts[(row_day, activity_type)] = counts.get((row_day, activity_type), 0) + count
+    return counts
+
+def log_activity(user_id, activity_type, description=None, target_user_id=None, activity_data=None, commit=True):
     """
     Log a user activity to the database
 
     Args:
         user_id: ID of the user performing the action
         activity_type: Type of activity (e.g., 'login', 'create_post', 'send_message')
-        description: Human-readable description of the activity
+        description: Fixed text for types without an entry in ACTIVITY_TEMPLATES;
+            leave it out for the others, whose text is rendered when read
         target_user_id: ID of the target user (if applicable)
         activity_data: Dictionary with additional activity details
+        commit: Commit right away; pass False to add the record to the caller's
+            transaction, which then flushes and commits it with its own writes.
+            Only applies in 'sync' mode: buffered rows are always written
+            by the buffer, independently of the caller's transaction
     """
+    buffer = get_buffer()
+    if buffer is not None:
+        buffer.put({
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'description': description,
+            'target_user_id': target_user_id,
+            'activity_data': activity_data or {},
+            'created_at': datetime.utcnow()
+        })
+        return
+
+    activity = ActivityLog(
+        user_id=user_id,
+        activity_type=activity_type,
+        description=description,
+        target_user_id=target_user_id,
+        activity_data=activity_data or {}
+    )
+    if not commit:
+        db.session.add(activity)
+        return
+
     try:
-        activity = ActivityLog(
-            user_id=user_id,
-            activity_type=activity_type,
-            description=description,
-            target_user_id=target_user_id,
-            activity_data=activity_data or {}
-        )
         db.session.add(activity)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         print(f"Error logging activity: {e}")
 
-# Specific logging functions for common activities
+# Specific logging functions for common activities. They store only
+# structured fields; the text is rendered from ACTIVITY_TEMPLATES when the
+# log is read, so no user lookup happens on the write path.
 
 def log_login(user_id):
     """Log user login"""
-    log_activity(user_id, 'login', 'User logged in')
+    log_activity(user_id, 'login')
 
 def log_logout(user_id):
     """Log user logout"""
-    log_activity(user_id, 'logout', 'User logged out')
+    log_activity(user_id, 'logout')
 
 def log_signup(user_id):
     """Log user signup"""
-    log_activity(user_id, 'signup', 'User created an account')
+    log_activity(user_id, 'signup')
 
 def log_profile_creation(user_id):
     """Log profile creation"""
-    log_activity(user_id, 'create_profile', 'User created their profile')
+    log_activity(user_id, 'create_profile')
 
 def log_friend_request_sent(sender_id, receiver_id):
     """Log friend request sent"""
-    from models import User
-    receiver = User.query.get(receiver_id)
-    description = f"Sent friend request to {receiver.name if receiver else 'Unknown user'}"
-    log_activity(sender_id, 'friend_request_sent', description, target_user_id=receiver_id)
+    log_activity(sender_id, 'friend_request_sent', target_user_id=receiver_id)
 
 def log_friend_request_received(sender_id, receiver_id):
     """Log friend request received"""
-    from models import User
-    sender = User.query.get(sender_id)
-    description = f"Received friend request from {sender.name if sender else 'Unknown user'}"
-    log_activity(receiver_id, 'friend_request_received', description, target_user_id=sender_id)
+    log_activity(receiver_id, 'friend_request_received', target_user_id=sender_id)
 
 def log_friend_request_accepted(sender_id, receiver_id):
     """Log friend request accepted"""
-    from models import User
-    sender = User.query.get(sender_id)
-    description = f"Accepted friend request from {sender.name if sender else 'Unknown user'}"
-    log_activity(receiver_id, 'friend_request_accepted', description, target_user_id=sender_id)
+    log_activity(receiver_id, 'friend_request_accepted', target_user_id=sender_id)
 
 def log_friend_request_declined(sender_id, receiver_id):
     """Log friend request declined"""
-    from models import User
-    sender = User.query.get(sender_id)
-    description = f"Declined friend request from {sender.name if sender else 'Unknown user'}"
-    log_activity(receiver_id, 'friend_request_declined', description, target_user_id=sender_id)
-
-def log_message_sent(sender_id, receiver_id):
-    """Log message sent"""
-    from models import User
-    receiver = User.query.get(receiver_id)
-    description = f"Sent message to {receiver.name if receiver else 'Unknown user'}"
-    log_activity(sender_id, 'send_message', description, target_user_id=receiver_id)
-
-def log_message_received(sender_id, receiver_id):
-    """Log message received"""
-    from models import User
-    sender = User.query.get(sender_id)
-    description = f"Received message from {sender.name if sender else 'Unknown user'}"
-    log_activity(receiver_id, 'receive_message', description, target_user_id=sender_id)
+    log_activity(receiver_id, 'friend_request_declined', target_user_id=sender_id)
+
+def log_message_sent(sender_id, receiver_id, receiver_name=None, commit=True):
+    """Log message sent (receiver_name is accepted for compatibility; the name is resolved when read)"""
+    log_activity(sender_id, 'send_message', target_user_id=receiver_id, commit=commit)
+
+def log_message_received(sender_id, receiver_id, sender_name=None, commit=True):
+    """Log message received (sender_name is accepted for compatibility; the name is resolved when read)"""
+    log_activity(receiver_id, 'receive_message', target_user_id=sender_id, commit=commit)
 
 def log_post_created(user_id, post_id, category):
     """Log post creation"""
-    description = f"Created a {category} post"
-    log_activity(user_id, 'create_post', description, activity_data={'post_id': post_id, 'category': category})
+    log_activity(user_id, 'create_post', activity_data={'post_id': post_id, 'category': category})
 
 def log_post_liked(user_id, post_id):
     """Log post like"""
-    description = "Liked a post"
-    log_activity(user_id, 'like_post', description, activity_data={'post_id': post_id})
+    log_activity(user_id, 'like_post', activity_data={'post_id': post_id})
 
 def log_post_disliked(user_id, post_id):
     """Log post dislike"""
-    description = "Disliked a post"
-    log_activity(user_id, 'dislike_post', description, activity_data={'post_id': post_id})
+    log_activity(user_id, 'dislike_post', activity_data={'post_id': post_id})
 
 def log_comment_created(user_id, post_id, comment_id, is_ai=False):
     """Log comment creation"""
-    if is_ai:
-        description = "AI commented on a post"
-    else:
-        description = "Commented on a post"
-    log_activity(user_id, 'create_comment', description,
+    log_activity(user_id, 'create_comment',
                 activity_data={'post_id': post_id, 'comment_id': comment_id, 'is_ai': is_ai})
 
 def log_comment_liked(user_id, comment_id):
     """Log comment like"""
-    description = "Liked a comment"
-    log_activity(user_id, 'like_comment', description, activity_data={'comment_id': comment_id})
+    log_activity(user_id, 'like_comment', activity_data={'comment_id': comment_id})
 
 def log_comment_disliked(user_id, comment_id):
     """Log comment dislike"""
-    description = "Disliked a comment"
-    log_activity(user_id, 'dislike_comment', description, activity_data={'comment_id': comment_id})
+    log_activity(user_id, 'dislike_comment', activity_data={'comment_id': comment_id})
 
 def log_post_deleted(user_id, post_id):
     """Log post deletion"""
-    description = "Deleted a post"
-    log_activity(user_id, 'delete_post', description, activity_data={'post_id': post_id})
+    log_activity(user_id, 'delete_post', activity_data={'post_id': post_id})
 
 def log_comment_deleted(user_id, comment_id):
     """Log comment deletion"""
-    description = "Deleted a comment"
-    log_activity(user_id, 'delete_comment', description, activity_data={'comment_id': comment_id})
+    log_activity(user_id, 'delete_comment', activity_data={'comment_id': comment_id})
 
 def log_chatbot_interaction(user_id, session_id):
     """Log chatbot interaction"""
-    description = "Interacted with Swift chatbot"
-    log_activity(user_id, 'chatbot_interaction', description,
-                activity_data={'session_id': session_id})
\ No newline at end of file
+    log_activity(user_id, 'chatbot_interaction', activity_data={'session_id': session_id})
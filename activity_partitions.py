@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Monthly partitions and retention of the activity_logs table (PostgreSQL)
+
+Migration 0014 range-partitions `activity_logs` by created_at, one
+partition per month named activity_logs_yYYYYmMM, like messages (see
+message_partitions.py, whose helpers this script uses):
+
+    python activity_partitions.py ensure [--months-ahead 2]
+        Create the partitions for this month and the next ones. Run daily.
+
+    python activity_partitions.py retain [--keep-months 12] [--batch-size 5000] [--dry-run]
+        Roll up partitions whose month ended more than N months ago into
+        activity_daily_counts and drop them. Run monthly (or daily; it is
+        a no-op until a partition ages out). --keep-months defaults to
+        ACTIVITY_LOG_RETENTION_MONTHS.
+
+The activity_logs_legacy partition holds every row from before the
+migration, up to the end of the month it ran in, so it can only be
+dropped once that month has aged out. Until then `retain` rolls up and
+deletes its rows older than the cutoff in batches of --batch-size rows,
+each in its own short transaction, so those rows follow the retention
+setting too and the final drop has little left to roll up.
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db
+from sqlalchemy import text
+from message_partitions import ensure_partitions, cold_partitions, list_partitions, month_start, DETACH_LOCK_TIMEOUT
+
+TABLE = 'activity_logs'
+LEGACY = f'{TABLE}_legacy'
+
+def rollup_and_drop(name):
+    """
+    Add a partition's rows to activity_daily_counts and drop it, in one transaction
+
+    Dropping a partition is a catalog change, so it takes the same time
+    for a month of a few rows as for one with millions. It needs a brief
+    exclusive lock on activity_logs; under lock_timeout it gives up (to
+    be retried on the next run) rather than queueing writes behind a
+    long-running query, and the rollup is rolled back with it.
+
+    Returns:
+        Number of (user, type, day) rows added to or updated in activity_daily_counts
+    """
+    try:
+        db.session.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+        rolled_up = db.session.execute(text(f"""
+            INSERT INTO activity_daily_counts (user_id, activity_type, day, count)
+            SELECT user_id, activity_type, created_at::date, COUNT(*)
+            FROM {name}
+            GROUP BY user_id, activity_type, created_at::date
+            ON CONFLICT (user_id, activity_type, day)
+            DO UPDATE SET count = activity_daily_counts.count + EXCLUDED.count
+        """)).rowcount
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+        return rolled_up
+    except Exception:
+        db.session.rollback()
+        raise
+
+def trim_legacy(cutoff, batch_size=5000, dry_run=False):
+    """
+    Roll up and delete the legacy partition's rows from before cutoff, in batches
+
+    The partition is walked in primary key order, batch_size ids at a
+    time; each batch deletes its aged rows and adds them to
+    activity_daily_counts in one statement and commits, so a row is
+    counted exactly once and no lock is held for long.
+
+    Returns:
+        Number of rows rolled up and deleted (or that would be, with dry_run)
+    """
+    if dry_run:
+        return db.session.scalar(text(f"SELECT COUNT(*) FROM {LEGACY} WHERE created_at < :cutoff"),
+                                 {'cutoff': cutoff})
+
+    trimmed = 0
+    last_id = 0
+    while True:
+        upper_id = db.session.scalar(text(f"""
+            SELECT MAX(id) FROM (
+                SELECT id FROM {LEGACY} WHERE id > :last_id ORDER BY id LIMIT :batch_size
+            ) batch
+        """), {'last_id': last_id, 'batch_size': batch_size})
+        if upper_id is None:
+            db.session.commit()
+            return trimmed
+
+        try:
+            trimmed += db.session.scalar(text(f"""
+                WITH aged AS (
+                    DELETE FROM {LEGACY}
+                    WHERE id > :last_id AND id <= :upper_id AND created_at < :cutoff
+                    RETURNING user_id, activity_type, created_at
+                ), rolled_up AS (
+                    INSERT INTO activity_daily_counts (user_id, activity_type, day, count)
+                    SELECT user_id, activity_type, created_at::date, COUNT(*)
+                    FROM aged
+                    GROUP BY user_id, activity_type, created_at::date
+                    ON CONFLICT (user_id, activity_type, day)
+                    DO UPDATE SET count = activity_daily_counts.count + EXCLUDED.count
+                )
+                SELECT COUNT(*) FROM aged
+            """), {'last_id': last_id, 'upper_id': upper_id, 'cutoff': cutoff})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        last_id = upper_id
+
+def retain(keep_months, batch_size=5000, dry_run=False, now=None):
+    """
+    Roll up and drop the partitions older than keep_months, and trim the legacy partition's aged rows
+
+    Returns:
+        (names of the partitions dropped, number of legacy rows trimmed), or
+        what would be with dry_run
+    """
+    now = now or datetime.utcnow()
+    names = cold_partitions(keep_months, now=now, table=TABLE)
+    legacy_attached = LEGACY in dict(list_partitions(TABLE))
+    db.session.commit()
+
+    trimmed = 0
+    if legacy_attached and LEGACY not in names:
+        cutoff = month_start(now.year, now.month - keep_months)
+        trimmed = trim_legacy(cutoff, batch_size, dry_run=dry_run)
+        if not dry_run:
+            print(f"Rolled up and deleted {trimmed} rows of {LEGACY} from before {cutoff:%Y-%m-%d}")
+    if dry_run:
+        return names, trimmed
+
+    for name in names:
+        rolled_up = rollup_and_drop(name)
+        print(f"Rolled up {name} into {rolled_up} daily counts and dropped it")
+    return names, trimmed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    ensure_parser = commands.add_parser('ensure', help='create the upcoming monthly partitions')
+    ensure_parser.add_argument('--months-ahead', type=int, default=2)
+    retain_parser = commands.add_parser('retain', help='roll up and drop partitions past the retention period')
+    retain_parser.add_argument('--keep-months', type=int, default=app.config['ACTIVITY_LOG_RETENTION_MONTHS'])
+    retain_parser.add_argument('--batch-size', type=int, default=5000,
+                               help='legacy partition rows rolled up per transaction')
+    retain_parser.add_argument('--dry-run', action='store_true', help='only list the partitions')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("[FAILED] activity_partitions.py needs a PostgreSQL DATABASE_URL")
+            return False
+        try:
+            if args.command == 'ensure':
+                created = ensure_partitions(args.months_ahead, table=TABLE)
+                print(f"[SUCCESS] Created {len(created)} partitions: {', '.join(created) or 'none needed'}")
+            else:
+                names, trimmed = retain(args.keep_months, batch_size=args.batch_size, dry_run=args.dry_run)
+                action = 'Would drop' if args.dry_run else 'Dropped'
+                print(f"[SUCCESS] {action} {len(names)} partitions: {', '.join(names) or 'none'} "
+                      f"and {trimmed} aged rows of {LEGACY}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAILED] Error maintaining activity log partitions: {e}")
+            return False
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
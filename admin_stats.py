@@ -0,0 +1,88 @@
+"""
+Per-user statistics for the admin panel
+
+Each statistic is one grouped aggregate over its table (posts per author,
+messages per sender, ...), outer-joined to users on user_id, so a page
+of the user table costs the same few queries however many users there
+are, and can be sorted by any statistic in the database.
+"""
+
+from sqlalchemy import select, func, union_all, distinct
+from sqlalchemy.orm import joinedload
+from models import db, User, Post, Comment, Message, Friendship, ChatHistory
+
+def _per_user(user_column, count, name):
+    return select(user_column.label('user_id'), count.label(name)).group_by(user_column).subquery()
+
+def _stat_subqueries():
+    friend_ids = union_all(
+        select(Friendship.user1_id.label('user_id')),
+        select(Friendship.user2_id.label('user_id'))
+    ).subquery()
+    return {
+        'posts_count': _per_user(Post.author_id, func.count(), 'posts_count'),
+        'comments_count': _per_user(Comment.author_id, func.count(), 'comments_count'),
+        'messages_sent': _per_user(Message.sender_id, func.count(), 'messages_sent'),
+        'messages_received': _per_user(Message.receiver_id, func.count(), 'messages_received'),
+        'friends_count': _per_user(friend_ids.c.user_id, func.count(), 'friends_count'),
+        'chat_sessions': _per_user(ChatHistory.user_id, func.count(distinct(ChatHistory.session_id)), 'chat_sessions'),
+    }
+
+# Columns the user table can be sorted by
+SORT_KEYS = ['name', 'email', 'joined', 'posts_count', 'comments_count', 'messages', 'friends_count', 'chat_sessions']
+
+def user_stats_page(exclude_user_id=None, sort='joined', direction='desc', page=1, per_page=50):
+    """
+    One page of users with their statistics
+
+    Args:
+        exclude_user_id: User left out of the table (the admin viewing it)
+        sort: One of SORT_KEYS; 'messages' sorts by messages sent plus received
+        direction: 'asc' or 'desc'
+        page: 1-based page number
+        per_page: Users per page
+
+    Returns:
+        (users_with_stats, total_users) where users_with_stats is a list of
+        dicts with the user and one key per statistic
+    """
+    stats = _stat_subqueries()
+    columns = {name: func.coalesce(subquery.c[name], 0).label(name) for name, subquery in stats.items()}
+
+    stmt = select(User, *columns.values()).options(joinedload(User.profile))
+    for subquery in stats.values():
+        stmt = stmt.outerjoin(subquery, subquery.c.user_id == User.id)
+    if exclude_user_id is not None:
+        stmt = stmt.where(User.id != exclude_user_id)
+
+    sort_expressions = {
+        'name': User.name,
+        'email': User.email,
+        'joined': User.created_at,
+        'messages': columns['messages_sent'] + columns['messages_received'],
+        **columns,
+    }
+    sort_expression = sort_expressions.get(sort, User.created_at)
+    if direction == 'asc':
+        stmt = stmt.order_by(sort_expression.asc(), User.id.asc())
+    else:
+        stmt = stmt.order_by(sort_expression.desc(), User.id.desc())
+
+    rows = db.session.execute(stmt.limit(per_page).offset((max(page, 1) - 1) * per_page)).unique().all()
+    users_with_stats = [{'user': row[0], **{name: row[i + 1] for i, name in enumerate(columns)}} for row in rows]
+
+    count = select(func.count()).select_from(User)
+    if exclude_user_id is not None:
+        count = count.where(User.id != exclude_user_id)
+    return users_with_stats, db.session.execute(count).scalar()
+
+def platform_totals():
+    """Totals for the admin panel's summary cards, in one query"""
+    chat_sessions = select(ChatHistory.user_id, ChatHistory.session_id).distinct().subquery()
+    row = db.session.execute(select(
+        select(func.count()).select_from(User).scalar_subquery().label('users'),
+        select(func.count()).select_from(Post).scalar_subquery().label('posts'),
+        select(func.count()).select_from(Message).scalar_subquery().label('messages'),
+        select(func.count()).select_from(chat_sessions).scalar_subquery().label('chat_sessions'),
+    )).one()
+    return row._asdict()
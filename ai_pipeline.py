@@ -0,0 +1,260 @@
+"""
+Background AI enrichment for new posts
+
+create_post only commits the post and an `ai_jobs` row. Worker threads
+(see ai_worker.py) claim queued jobs from the database, run the optional
+rewrite, the analysis and Swift's comment through the LLM gateway, and
+store the results. Failed jobs are retried with exponential backoff up to
+`max_attempts`; Post.ai_status tracks progress so the UI can show that
+Swift is still thinking.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from models import db, Comment, AIJob
+import counters
+import fragment_cache
+import llm_gateway
+
+# A running job whose worker has not finished after this long is assumed dead and re-queued
+LOCK_TIMEOUT = timedelta(minutes=5)
+
+# Base delay for retries; attempt n waits RETRY_DELAY * 2**(n-1)
+RETRY_DELAY = timedelta(seconds=10)
+
+def rewrite_messages(category, content):
+    prompt = f"""
+            Generate a {category} post for a social media platform.
+            The user's input is: "{content}"
+
+            Please rewrite this as an engaging {category} post. Keep it concise and appropriate for social media.
+            Just return the post content, no additional text.
+            """
+    return [
+        {"role": "system", "content": "You are a helpful social media content generator."},
+        {"role": "user", "content": prompt}
+    ]
+
+def analysis_messages(category, content):
+    prompt = f"""
+        Analyze this {category} social media post:
+
+        "{content}"
+
+        Provide a brief analysis of:
+        1. Does the content match the {category} category?
+        2. What kind of sentiment does it convey?
+        3. Any notable aspects?
+        Keep it concise.
+        """
+    return [
+        {"role": "system", "content": "You are analyzing a social media post."},
+        {"role": "user", "content": prompt}
+    ]
+
+def comment_messages(category, content):
+    prompt = f"""
+        As Swift (an AI assistant), write a brief, helpful comment on this {category} post:
+
+        "{content}"
+
+        Guidelines:
+        - If it's a personal post about struggles (job loss, bad day, etc.), be empathetic
+        - If it's a professional post, be supportive and possibly add value
+        - If the content doesn't match the category, gently point it out
+        - Be friendly and concise
+        - Write as if you're a helpful AI assistant named Swift
+        """
+    return [
+        {"role": "system", "content": "You are Swift, an AI assistant commenting on social media posts."},
+        {"role": "user", "content": prompt}
+    ]
+
+def enqueue_post_enrichment(post, rewrite=False, max_attempts=3):
+    """Queue the AI enrichment of a flushed post in the current transaction"""
+    post.ai_status = 'pending'
+    job = AIJob(
+        post_id=post.id,
+        kind='enrich_post',
+        payload={'rewrite': rewrite},
+        max_attempts=max_attempts
+    )
+    db.session.add(job)
+    return job
+
+def claim_jobs(limit):
+    """
+    Atomically claim up to `limit` runnable jobs for this worker
+
+    On PostgreSQL the job rows are locked with FOR UPDATE SKIP LOCKED, so
+    concurrent workers never claim the same job. Jobs stuck in 'running'
+    longer than LOCK_TIMEOUT are claimed again if they have attempts
+    left, and marked failed otherwise, so a job that keeps killing its
+    worker is not retried forever.
+
+    Returns:
+        List of claimed job IDs
+    """
+    now = datetime.utcnow()
+    stale = (AIJob.status == 'running') & (AIJob.locked_at < now - LOCK_TIMEOUT)
+
+    exhausted = AIJob.query.options(joinedload(AIJob.post, innerjoin=True)).filter(
+        stale & (AIJob.attempts >= AIJob.max_attempts)
+    ).with_for_update(skip_locked=True, of=AIJob).all()
+    for job in exhausted:
+        job.status = 'failed'
+        job.last_error = f"Worker did not finish within {LOCK_TIMEOUT}"
+        job.post.ai_status = 'failed'
+        fragment_cache.bump_version(job.post_id)
+
+    jobs = AIJob.query.options(joinedload(AIJob.post, innerjoin=True)).filter(
+        ((AIJob.status == 'queued') & (AIJob.run_after <= now)) |
+        (stale & (AIJob.attempts < AIJob.max_attempts))
+    ).order_by(AIJob.run_after, AIJob.id).limit(limit).with_for_update(skip_locked=True, of=AIJob).all()
+
+    for job in jobs:
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+        job.post.ai_status = 'thinking'
+
+    db.session.commit()
+    return [job.id for job in jobs]
+
+def _enrich_post(post, payload, gateway):
+    """Run the LLM calls for one post and stage the results in the session"""
+    if payload.get('rewrite'):
+        post.content = gateway.complete(rewrite_messages(post.category, post.content),
+                                        call_site='post_rewrite', max_tokens=200, temperature=0.7,
+                                        cache=False)
+
+    post.ai_analysis = gateway.complete(analysis_messages(post.category, post.content),
+                                        call_site='post_analysis', max_tokens=100, temperature=0.3)
+
+    ai_comment_content = gateway.complete(comment_messages(post.category, post.content),
+                                          call_site='post_swift_comment', max_tokens=150, temperature=0.7)
+
+    db.session.add(Comment(
+        post_id=post.id,
+        author_id=None,  # AI doesn't have a user ID
+        content=ai_comment_content,
+        is_ai_comment=True
+    ))
+    counters.adjust_comment_count(post.id, 1)
+
+def process_job(job_id, gateway=None):
+    """
+    Run one claimed job and record the outcome
+
+    Returns:
+        The job's final status for this attempt ('done', 'queued' for a retry, or 'failed')
+    """
+    gateway = gateway or llm_gateway.get_gateway()
+    job = db.session.get(AIJob, job_id)
+    if job is None:
+        return None
+
+    try:
+        _enrich_post(job.post, job.payload or {}, gateway)
+        job.status = 'done'
+        job.last_error = None
+        job.post.ai_status = 'done'
+        fragment_cache.bump_version(job.post_id)
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(AIJob, job_id)
+        job.last_error = str(e)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + RETRY_DELAY * (2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.post.ai_status = 'failed'
+            fragment_cache.bump_version(job.post_id)
+            print(f"AI analysis failed for post {job.post_id}: {e}")
+        db.session.commit()
+
+    return job.status
+
+class WorkerPool:
+    """Polls the job table and runs jobs on a bounded number of threads"""
+
+    def __init__(self, app, concurrency=4, poll_interval=1.0, gateway=None):
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.gateway = gateway
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-worker')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                process_job(job_id, self.gateway)
+            except Exception as e:
+                print(f"AI worker error on job {job_id}: {e}")
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._in_flight.discard(job_id)
+
+    def poll_once(self):
+        """Claim as many jobs as there are free threads and start them; returns how many were started"""
+        with self._lock:
+            free = self.concurrency - len(self._in_flight)
+        if free <= 0:
+            return 0
+
+        with self.app.app_context():
+            try:
+                job_ids = claim_jobs(free)
+            finally:
+                db.session.remove()
+
+        for job_id in job_ids:
+            with self._lock:
+                self._in_flight.add(job_id)
+            self._executor.submit(self._run, job_id)
+        return len(job_ids)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def run_forever(self):
+        """Poll until stop() is called"""
+        while not self._stop.is_set():
+            started = self.poll_once()
+            if not started:
+                self._stop.wait(self.poll_interval)
+        self._executor.shutdown(wait=True)
+
+    def drain(self):
+        """
+        Process jobs until none are queued or running, then shut down (for tests and benchmarks)
+
+        Retries waiting for their run_after count as queued, so a drain that
+        hits failures takes at least the retry delays.
+        """
+        while True:
+            started = self.poll_once()
+            if not started and not self.in_flight():
+                with self.app.app_context():
+                    try:
+                        pending = AIJob.query.filter(AIJob.status.in_(['queued', 'running'])).count()
+                    finally:
+                        db.session.remove()
+                if not pending:
+                    break
+            time.sleep(0.01)
+        self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Background worker that processes queued AI enrichment jobs
+
+Run alongside the web process (see Procfile). Concurrency is bounded by
+AI_WORKER_CONCURRENCY; several worker processes can run at once since jobs
+are claimed with row locks.
+"""
+
+import os
+import sys
+import signal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from ai_pipeline import WorkerPool
+
+def main():
+    pool = WorkerPool(app, concurrency=app.config['AI_WORKER_CONCURRENCY'])
+
+    # Finish in-flight jobs on shutdown instead of dropping them
+    signal.signal(signal.SIGTERM, lambda signum, frame: pool.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: pool.stop())
+
+    print(f"AI worker started with concurrency {pool.concurrency}")
+    pool.run_forever()
+    print("AI worker stopped")
+
+if __name__ == '__main__':
+    main()
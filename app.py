@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -7,15 +7,27 @@ import os
 import requests
 from requests_oauthlib import OAuth2Session
 from email_validator import validate_email, EmailNotValidError
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import secrets
 import cloudinary
 import cloudinary.uploader
 from werkzeug.utils import secure_filename
-import openai
 from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
 import uuid
 from chroma_integration import chroma_manager
+from feed import load_feed_page, feed_posts_query
+import timeline
+import counters
+import fragment_cache
+import ai_pipeline
+import llm_gateway
+import friend_graph
+import realtime
+import messaging
+import activity_logger
+import activity_export
+import admin_stats
 from activity_logger import (
     log_login, log_logout, log_signup, log_profile_creation,
     log_friend_request_sent, log_friend_request_received,
@@ -43,6 +55,32 @@ app.config['SESSION_TYPE'] = 'filesystem'
 app.config['GITHUB_CLIENT_ID'] = os.getenv('GITHUB_CLIENT_ID')
 app.config['GITHUB_CLIENT_SECRET'] = os.getenv('GITHUB_CLIENT_SECRET')
 app.config['ADMIN_EMAIL'] = os.getenv('ADMIN_EMAIL', '')
+app.config['FEED_PAGE_SIZE'] = int(os.getenv('FEED_PAGE_SIZE', '20'))
+app.config['FEED_FANOUT'] = os.getenv('FEED_FANOUT', 'read')  # 'read' or 'write' (materialized timelines)
+app.config['INBOX_PAGE_SIZE'] = int(os.getenv('INBOX_PAGE_SIZE', '50'))
+app.config['CHAT_PAGE_SIZE'] = int(os.getenv('CHAT_PAGE_SIZE', '50'))
+app.config['MESSAGE_SEARCH_PAGE_SIZE'] = int(os.getenv('MESSAGE_SEARCH_PAGE_SIZE', '20'))
+app.config['FRAGMENT_CACHE_BACKEND'] = os.getenv('FRAGMENT_CACHE_BACKEND', 'memory')  # 'memory', 'filesystem' or 'none'
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+app.config['FRAGMENT_CACHE_DIR'] = os.getenv('FRAGMENT_CACHE_DIR')
+app.config['FRIEND_GRAPH_CACHE_BACKEND'] = os.getenv('FRIEND_GRAPH_CACHE_BACKEND', 'memory')  # 'memory', 'filesystem' or 'none'
+app.config['FRIEND_GRAPH_CACHE_MAX_BYTES'] = int(os.getenv('FRIEND_GRAPH_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+app.config['FRIEND_GRAPH_CACHE_DIR'] = os.getenv('FRIEND_GRAPH_CACHE_DIR')
+app.config['FRIEND_GRAPH_CACHE_TTL'] = int(os.getenv('FRIEND_GRAPH_CACHE_TTL', '300'))  # Bounds staleness if an invalidation is missed
+app.config['REALTIME_BACKEND'] = os.getenv('REALTIME_BACKEND', 'auto')  # 'postgres' (LISTEN/NOTIFY), 'memory', 'none' or 'auto'
+app.config['REALTIME_STREAM_SECONDS'] = int(os.getenv('REALTIME_STREAM_SECONDS', '300'))  # Streams reconnect after this long
+# Each open stream holds a gthread thread; by default half of a worker's threads may serve streams
+app.config['REALTIME_MAX_STREAMS'] = int(os.getenv('REALTIME_MAX_STREAMS', str(max(int(os.getenv('WEB_THREADS', '16')) // 2, 1))))
+app.config['ACTIVITY_LOG_MODE'] = os.getenv('ACTIVITY_LOG_MODE', 'buffered')  # 'buffered' (batched write-behind) or 'sync'
+app.config['ACTIVITY_LOG_QUEUE_SIZE'] = int(os.getenv('ACTIVITY_LOG_QUEUE_SIZE', '10000'))
+app.config['ACTIVITY_LOG_BATCH_SIZE'] = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', '500'))
+app.config['ACTIVITY_LOG_FLUSH_SECONDS'] = float(os.getenv('ACTIVITY_LOG_FLUSH_SECONDS', '2'))
+app.config['ACTIVITY_LOG_PAGE_SIZE'] = int(os.getenv('ACTIVITY_LOG_PAGE_SIZE', '20'))
+app.config['ACTIVITY_LOG_COUNT_TTL'] = int(os.getenv('ACTIVITY_LOG_COUNT_TTL', '300'))  # Seconds the capped total is cached
+app.config['ACTIVITY_LOG_RETENTION_MONTHS'] = int(os.getenv('ACTIVITY_LOG_RETENTION_MONTHS', '12'))  # Raw rows kept; older months become daily counts
+app.config['ADMIN_PAGE_SIZE'] = int(os.getenv('ADMIN_PAGE_SIZE', '50'))  # Users per admin panel page
+app.config['AI_WORKER_CONCURRENCY'] = int(os.getenv('AI_WORKER_CONCURRENCY', '4'))
+app.config['AI_JOB_MAX_ATTEMPTS'] = int(os.getenv('AI_JOB_MAX_ATTEMPTS', '3'))
 
 # Configure Cloudinary
 cloudinary.config(
@@ -56,6 +94,10 @@ from models import db
 
 # Initialize extensions
 db.init_app(app)
+fragment_cache.init_app(app)
+realtime.init_app(app)
+friend_graph.init_app(app)
+activity_logger.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'signin'
@@ -264,25 +306,10 @@ def profile():
     if not current_user.profile:
         return render_template('profile.html', has_profile=False)
 
-    # Get friend counts for current user
+    # Get friends with their profiles in one query
     from models import Friendship, FriendRequest, User
-    friends_count = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).count()
-
-    # Get actual friends list
-    friends = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
-
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friend = User.query.get(friend_id)
-        if friend:
-            friends.append(friend)
+    friends = friend_graph.friends_with_profiles(current_user.id)
+    friends_count = len(friends)
 
     pending_requests_count = FriendRequest.query.filter_by(
         receiver_id=current_user.id,
@@ -300,7 +327,7 @@ def profile():
         from models import User
         profile_user = User.query.get_or_404(user_id)
         is_own_profile = profile_user.id == current_user.id
-        is_friend = are_friends(current_user.id, profile_user.id)
+        is_friend = friend_graph.are_friends(current_user.id, profile_user.id)
         has_pending_request = has_friend_request(current_user.id, profile_user.id)
         received_request = has_friend_request(profile_user.id, current_user.id)
     else:
@@ -480,7 +507,6 @@ def edit_profile():
             log_activity(
                 user_id=current_user.id,
                 activity_type='profile_updated',
-                description='Profile information was updated',
                 activity_data={'updated_fields': ['phone', 'education', 'work', 'website', 'github', 'linkedin', 'profile_picture']}
             )
 
@@ -518,7 +544,7 @@ def send_friend_request(user_id):
         return redirect(url_for('profile', user_id=user_id))
 
     # Check if already friends
-    if are_friends(current_user.id, user_id):
+    if friend_graph.are_friends(current_user.id, user_id):
         flash('You are already friends', 'error')
         return redirect(url_for('profile', user_id=user_id))
 
@@ -557,6 +583,8 @@ def respond_friend_request(request_id, response):
         )
         db.session.add(friendship)
         friend_request.status = 'accepted'
+        timeline.add_friendship(friend_request.sender_id, friend_request.receiver_id)
+        friend_graph.invalidate(friend_request.sender_id, friend_request.receiver_id)
 
         # Log friend request acceptance
         log_friend_request_accepted(friend_request.sender_id, friend_request.receiver_id)
@@ -579,24 +607,9 @@ def search_users():
     query = request.args.get('q', '')
     from models import User, Friendship, FriendRequest
 
-    # Get friend counts for current user
-    friends_count = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).count()
-
-    # Get actual friends list
-    friends = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
-
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friend = User.query.get(friend_id)
-        if friend:
-            friends.append(friend)
+    # Get friends with their profiles in one query
+    friends = friend_graph.friends_with_profiles(current_user.id)
+    friends_count = len(friends)
 
     pending_requests_count = FriendRequest.query.filter_by(
         receiver_id=current_user.id,
@@ -605,15 +618,23 @@ def search_users():
 
     if query:
         # Search for users by username or name
-        users = User.query.filter(
+        users = User.query.options(joinedload(User.profile)).filter(
             (User.username.ilike(f'%{query}%') | User.name.ilike(f'%{query}%')) &
             (User.id != current_user.id)
         ).limit(10).all()
     else:
         users = []
 
+    # Relationship state for every result, instead of two lookups per result in the template
+    friend_ids = {friend.id for friend in friends}
+    requested_ids = {row[0] for row in db.session.query(FriendRequest.receiver_id).filter(
+        FriendRequest.sender_id == current_user.id,
+        FriendRequest.status == 'pending',
+        FriendRequest.receiver_id.in_([user.id for user in users])
+    )} if users else set()
+
     return render_template('search.html', users=users, query=query,
-                         are_friends=are_friends, has_friend_request=has_friend_request,
+                         friend_ids=friend_ids, requested_ids=requested_ids,
                          friends_count=friends_count, pending_requests_count=pending_requests_count,
                          friends=friends)
 
@@ -622,17 +643,8 @@ def search_users():
 def friends_list():
     from models import Friendship, User, FriendRequest
 
-    # Get all friends
-    friends = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
-
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friend = User.query.get(friend_id)
-        friends.append(friend)
+    # Get all friends with their profiles in one query
+    friends = friend_graph.friends_with_profiles(current_user.id)
 
     # Get pending requests
     pending_requests = FriendRequest.query.filter_by(
@@ -666,12 +678,36 @@ def regenerate_secret_key():
     return jsonify({'success': True, 'new_key': new_secret_key})
 
 # Helper functions
-def are_friends(user1_id, user2_id):
-    from models import Friendship
-    return Friendship.query.filter(
-        ((Friendship.user1_id == user1_id) & (Friendship.user2_id == user2_id)) |
-        ((Friendship.user1_id == user2_id) & (Friendship.user2_id == user1_id))
-    ).first() is not None
+def message_to_dict(msg, sender_name):
+    """JSON shape of a chat message for the polling endpoint and the event stream"""
+    return {
+        'id': msg.id,
+        'content': msg.content,
+        'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'sender_id': msg.sender_id,
+        'receiver_id': msg.receiver_id,
+        'sender_name': sender_name
+    }
+
+def conditional_json(etag, build):
+    """
+    JSON response validated by an ETag
+
+    Args:
+        etag: Version stamp of the response, computed without building it
+        build: Callable returning the JSON body, only called when the client's copy is stale
+
+    Returns:
+        304 if the request's If-None-Match matches etag, otherwise the JSON body
+    """
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Private to the user, and revalidated on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 def has_friend_request(sender_id, receiver_id):
     from models import FriendRequest
@@ -687,24 +723,9 @@ def has_friend_request(sender_id, receiver_id):
 def messages():
     from models import User, Friendship, Message, FriendRequest
 
-    # Get friend counts for current user
-    friends_count = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).count()
-
-    # Get actual friends list
-    friends = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
-
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friend = User.query.get(friend_id)
-        if friend:
-            friends.append(friend)
+    # Get friends with their profiles in one query
+    friends = friend_graph.friends_with_profiles(current_user.id)
+    friends_count = len(friends)
 
     pending_requests_count = FriendRequest.query.filter_by(
         receiver_id=current_user.id,
@@ -720,18 +741,35 @@ def messages():
     else:
         search_friends = friends
 
+    # Search message contents in the user's own conversations too
+    page = max(request.args.get('page', 1, type=int), 1)
+    message_results, has_more_results = [], False
+    if query:
+        message_results, has_more_results = messaging.search_messages(
+            current_user.id, query, page=page, per_page=app.config['MESSAGE_SEARCH_PAGE_SIZE']
+        )
+
     # Get unread message count for notification
-    unread_count = Message.query.filter_by(
-        receiver_id=current_user.id,
-        is_read=False
-    ).count() if hasattr(Message, 'is_read') else 0
+    unread_count = current_user.unread_message_count
+
+    # Recent conversations from the summary table, newest first
+    conversations, next_cursor = messaging.inbox(
+        current_user.id,
+        limit=app.config['INBOX_PAGE_SIZE'],
+        before_message_id=request.args.get('before', type=int)
+    )
 
     return render_template('messages.html',
                          friends=search_friends,
                          query=query,
                          friends_count=friends_count,
                          pending_requests_count=pending_requests_count,
-                         unread_count=unread_count)
+                         unread_count=unread_count,
+                         conversations=conversations,
+                         next_cursor=next_cursor,
+                         message_results=message_results,
+                         has_more_results=has_more_results,
+                         page=page)
 
 @app.route('/messages/<int:user_id>')
 @login_required
@@ -739,55 +777,45 @@ def chat_with_user(user_id):
     from models import User, Friendship, Message, FriendRequest
 
     # Check if users are friends
-    if not are_friends(current_user.id, user_id):
+    if not friend_graph.are_friends(current_user.id, user_id):
         flash('You can only message your friends', 'warning')
         return redirect(url_for('messages'))
 
-    other_user = User.query.get_or_404(user_id)
-
-    # Get friend counts
-    friends_count = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).count()
-
-    # Get friends list
-    friends = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
-
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friend = User.query.get(friend_id)
-        if friend:
-            friends.append(friend)
+    # Get friends with their profiles in one query; the other user is one of them
+    friends = friend_graph.friends_with_profiles(current_user.id)
+    friends_count = len(friends)
+    other_user = next((friend for friend in friends if friend.id == user_id), None)
+    if other_user is None:
+        other_user = User.query.get_or_404(user_id)
 
     pending_requests_count = FriendRequest.query.filter_by(
         receiver_id=current_user.id,
         status='pending'
     ).count()
 
-    # Get message history
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).all()
-
-    # Mark messages as read (if is_read column exists)
-    for msg in messages:
-        if msg.receiver_id == current_user.id and hasattr(msg, 'is_read'):
-            msg.is_read = True
+    # Get the most recent messages; older ones are loaded on scroll-back. A search
+    # result opens the chat at its message instead, with a page on either side
+    page_size = app.config['CHAT_PAGE_SIZE']
+    focus_message_id = request.args.get('message_id', type=int)
+    if focus_message_id:
+        messages, has_more = messaging.recent_messages(current_user.id, user_id, page_size,
+                                                       before_id=focus_message_id + 1)
+        messages += messaging.messages_after(current_user.id, user_id, focus_message_id, limit=page_size,
+                                             after_time=messages[-1].timestamp if messages else None)
+    else:
+        messages, has_more = messaging.recent_messages(current_user.id, user_id, page_size)
 
-    try:
+    # Mark the other user's messages as read in one statement
+    marked, unread_count = messaging.mark_conversation_read(current_user.id, user_id)
+    if marked:
+        realtime.publish(current_user.id, 'unread', {'count': unread_count})
         db.session.commit()
-    except:
-        pass  # Ignore if is_read column doesn't exist
 
     return render_template('chat.html',
                          other_user=other_user,
                          messages=messages,
+                         has_more=has_more,
+                         focus_message_id=focus_message_id,
                          friends=friends,
                          friends_count=friends_count,
                          pending_requests_count=pending_requests_count)
@@ -798,7 +826,7 @@ def send_message(user_id):
     from models import User, Message
 
     # Check if users are friends
-    if not are_friends(current_user.id, user_id):
+    if not friend_graph.are_friends(current_user.id, user_id):
         if request.is_json:
             return jsonify({'success': False, 'message': 'You can only message your friends'})
         flash('You can only message your friends', 'warning')
@@ -820,13 +848,20 @@ def send_message(user_id):
         content=content.strip()
     )
 
+    # The message and both activity records go out in one flush and one commit (with
+    # ACTIVITY_LOG_MODE=buffered the records are queued and written in a later batch)
     db.session.add(message)
+    log_message_sent(current_user.id, user_id, receiver_name=receiver.name, commit=False)
+    log_message_received(current_user.id, user_id, sender_name=current_user.name, commit=False)
+    db.session.flush()
+
+    # Push the message to both users' open streams and the receiver's new unread count
+    message_data = message_to_dict(message, current_user.name)
+    realtime.publish(user_id, 'message', message_data)
+    realtime.publish(current_user.id, 'message', message_data)
+    realtime.publish(user_id, 'unread', {'count': messaging.record_message_sent(message)})
     db.session.commit()
 
-    # Log message activities
-    log_message_sent(current_user.id, user_id)
-    log_message_received(current_user.id, user_id)
-
     if request.is_json:
         return jsonify({
             'success': True,
@@ -847,87 +882,114 @@ def get_latest_messages(user_id):
     from models import Message
 
     # Check if users are friends
-    if not are_friends(current_user.id, user_id):
+    if not friend_graph.are_friends(current_user.id, user_id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     last_id = request.args.get('last_id', 0, type=int)
+    # Timestamp of the client's last message, so the query can skip older partitions
+    last_timestamp = request.args.get('last_timestamp',
+                                      type=lambda value: datetime.strptime(value, '%Y-%m-%d %H:%M:%S'))
+
+    def build():
+        # Ordered by id so the last_id cursor and the ordering agree
+        messages = messaging.messages_after(current_user.id, user_id, last_id, after_time=last_timestamp)
+        return {'messages': [message_to_dict(msg, msg.sender.name) for msg in messages]}
+
+    # Versioned by the poll's cursor and the conversation's last message id, so a poll with
+    # nothing new is answered from the conversations row without touching messages. The
+    # cursor must be part of it: messages_after() returns at most 200 rows, and the poll
+    # that continues after a truncated answer has to get the rest rather than a 304
+    last_message_id = messaging.last_message_id(current_user.id, user_id)
+    return conditional_json(f"messages-{current_user.id}-{user_id}-{last_id}-{last_message_id}", build)
+
+@app.route('/api/messages/<int:user_id>/history')
+@login_required
+def get_message_history(user_id):
+    """Older messages for scroll-back, before the before_id cursor"""
+    # Check if users are friends
+    if not friend_graph.are_friends(current_user.id, user_id):
+        return jsonify({'error': 'Unauthorized'}), 403
 
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).filter(Message.id > last_id).order_by(Message.timestamp.asc()).all()
+    before_id = request.args.get('before_id', type=int)
+    messages, has_more = messaging.recent_messages(
+        current_user.id, user_id, app.config['CHAT_PAGE_SIZE'], before_id=before_id
+    )
 
     return jsonify({
-        'messages': [{
-            'id': msg.id,
-            'content': msg.content,
-            'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'sender_id': msg.sender_id,
-            'sender_name': msg.sender.name
-        } for msg in messages]
+        'messages': [message_to_dict(msg, msg.sender.name) for msg in messages],
+        'has_more': has_more
     })
 
 @app.route('/api/unread-count')
 @login_required
 def get_unread_count():
-    from models import Message
+    # Cached counter column, no scan of messages; the count itself is the version
+    count = current_user.unread_message_count
 
-    count = Message.query.filter_by(
-        receiver_id=current_user.id,
-        is_read=False
-    ).count() if hasattr(Message, 'is_read') else 0
+    return conditional_json(f"unread-{current_user.id}-{count}", lambda: {'count': count})
 
-    return jsonify({'count': count})
+@app.route('/api/stream')
+@login_required
+def event_stream():
+    """Server-Sent Events with new messages and unread-count changes for the current user"""
+    broker = realtime.get_broker()
+    # 204 tells EventSource not to reconnect, so the page falls back to polling; that is
+    # also the answer once this worker's stream threads (REALTIME_MAX_STREAMS) are taken
+    if broker is None or not broker.reserve_stream():
+        return '', 204
+
+    initial_events = [('unread', {'count': current_user.unread_message_count})]
+    response = Response(
+        realtime.stream(broker, current_user.id, initial_events,
+                        duration=app.config['REALTIME_STREAM_SECONDS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(broker.release_stream)
+    return response
 
 # Posts routes
+def load_home_feed(before=None):
+    """One page of the current user's home feed as (posts_data, next_cursor)"""
+    from models import TimelineEntry
+
+    if timeline.fanout_on_write():
+        # Fan-out-on-write: one range scan over the user's materialized timeline
+        return load_feed_page(
+            current_user.id,
+            timeline.timeline_posts_query(current_user.id),
+            before=before,
+            page_size=app.config['FEED_PAGE_SIZE'],
+            order_columns=(TimelineEntry.created_at, TimelineEntry.post_id)
+        )
+
+    # Fan-out-on-read: posts from friends and current user
+    return load_feed_page(
+        current_user.id,
+        feed_posts_query(list(friend_graph.friend_ids(current_user.id)) + [current_user.id]),
+        before=before,
+        page_size=app.config['FEED_PAGE_SIZE']
+    )
+
 @app.route('/posts')
 @login_required
 def posts():
-    from models import Post, Comment, User, Friendship, PostLike, CommentLike
+    # Posts from friends and current user, first page only
+    posts_data, next_cursor = load_home_feed(request.args.get('before'))
 
-    # Get all friends' IDs
-    friends_ids = []
-    friendships = Friendship.query.filter(
-        (Friendship.user1_id == current_user.id) |
-        (Friendship.user2_id == current_user.id)
-    ).all()
+    return render_template('posts.html', posts_data=posts_data, next_cursor=next_cursor)
 
-    for friendship in friendships:
-        friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-        friends_ids.append(friend_id)
-
-    # Include current user's posts
-    friends_ids.append(current_user.id)
-
-    # Get posts from friends and current user
-    posts_query = Post.query.filter(
-        Post.author_id.in_(friends_ids)
-    ).order_by(Post.created_at.desc()).all()
-
-    posts_data = []
-    for post in posts_query:
-        # Get like counts
-        likes = PostLike.query.filter_by(post_id=post.id, vote_type=1).count()
-        dislikes = PostLike.query.filter_by(post_id=post.id, vote_type=-1).count()
-        user_like = PostLike.query.filter_by(post_id=post.id, user_id=current_user.id).first()
-
-        # Get comments count
-        comments_count = Comment.query.filter_by(post_id=post.id).count()
-
-        # Get recent comments (first 3 for preview)
-        recent_comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.created_at.asc()).limit(3).all()
-
-        posts_data.append({
-            'post': post,
-            'author': post.author,
-            'likes': likes,
-            'dislikes': dislikes,
-            'user_vote_type': user_like.vote_type if user_like else 0,
-            'comments_count': comments_count,
-            'recent_comments': recent_comments
-        })
+@app.route('/api/posts/feed')
+@login_required
+def posts_feed_page():
+    """Next page of the feed as rendered post cards, for infinite scroll"""
+    posts_data, next_cursor = load_home_feed(request.args.get('before'))
 
-    return render_template('posts.html', posts_data=posts_data)
+    return jsonify({
+        'html': render_template('post_cards.html', posts_data=posts_data),
+        'next_cursor': next_cursor
+    })
 
 @app.route('/create_post', methods=['GET', 'POST'])
 @login_required
@@ -947,36 +1009,7 @@ def create_post():
         flash('Invalid category selected', 'error')
         return render_template('create_post.html')
 
-    # If AI generation is requested
-    if ai_generate:
-        try:
-            client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-            prompt = f"""
-            Generate a {category} post for a social media platform.
-            The user's input is: "{content}"
-
-            Please rewrite this as an engaging {category} post. Keep it concise and appropriate for social media.
-            Just return the post content, no additional text.
-            """
-
-            response = client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-4o'),
-                messages=[
-                    {"role": "system", "content": "You are a helpful social media content generator."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
-
-            generated_content = response.choices[0].message.content.strip()
-            content = generated_content
-
-        except Exception as e:
-            flash(f'AI generation failed: {str(e)}. Using your original content.', 'warning')
-
-    # Create the post
+    # Create the post; the AI rewrite, analysis and Swift's comment run in the background worker
     from models import Post
     post = Post(
         author_id=current_user.id,
@@ -986,78 +1019,10 @@ def create_post():
     )
 
     db.session.add(post)
-    db.session.commit()
-
-    # Analyze with AI and create AI comment
-    try:
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-        # Analyze the post
-        analysis_prompt = f"""
-        Analyze this {category} social media post:
-
-        "{content}"
-
-        Provide a brief analysis of:
-        1. Does the content match the {category} category?
-        2. What kind of sentiment does it convey?
-        3. Any notable aspects?
-        Keep it concise.
-        """
-
-        analysis_response = client.chat.completions.create(
-            model=os.getenv('OPENAI_MODEL', 'gpt-4o'),
-            messages=[
-                {"role": "system", "content": "You are analyzing a social media post."},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            max_tokens=100,
-            temperature=0.3
-        )
-
-        post.ai_analysis = analysis_response.choices[0].message.content.strip()
-
-        # Generate AI comment
-        comment_prompt = f"""
-        As Swift (an AI assistant), write a brief, helpful comment on this {category} post:
-
-        "{content}"
-
-        Guidelines:
-        - If it's a personal post about struggles (job loss, bad day, etc.), be empathetic
-        - If it's a professional post, be supportive and possibly add value
-        - If the content doesn't match the category, gently point it out
-        - Be friendly and concise
-        - Write as if you're a helpful AI assistant named Swift
-        """
-
-        comment_response = client.chat.completions.create(
-            model=os.getenv('OPENAI_MODEL', 'gpt-4o'),
-            messages=[
-                {"role": "system", "content": "You are Swift, an AI assistant commenting on social media posts."},
-                {"role": "user", "content": comment_prompt}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-
-        ai_comment_content = comment_response.choices[0].message.content.strip()
-
-        # Create AI comment
-        from models import Comment
-        ai_comment = Comment(
-            post_id=post.id,
-            author_id=None,  # AI doesn't have a user ID
-            content=ai_comment_content,
-            is_ai_comment=True
-        )
-
-        db.session.add(ai_comment)
-
-    except Exception as e:
-        print(f"AI analysis failed: {str(e)}")
-        # Post is still created even if AI analysis fails
-
+    db.session.flush()
+    timeline.add_post(post)
+    ai_pipeline.enqueue_post_enrichment(post, rewrite=ai_generate,
+                                        max_attempts=app.config['AI_JOB_MAX_ATTEMPTS'])
     db.session.commit()
 
     # Log post creation
@@ -1074,18 +1039,22 @@ def view_post(post_id):
 
     # Check if user can view this post (only friends and post author)
     if post.author_id != current_user.id:
-        if not are_friends(current_user.id, post.author_id):
+        if not friend_graph.are_friends(current_user.id, post.author_id):
             flash('You can only view posts from friends', 'error')
             return redirect(url_for('posts'))
 
     # Get post details
-    likes = PostLike.query.filter_by(post_id=post.id, vote_type=1).count()
-    dislikes = PostLike.query.filter_by(post_id=post.id, vote_type=-1).count()
     user_like = PostLike.query.filter_by(post_id=post.id, user_id=current_user.id).first()
 
     # Get all comments
     comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.created_at.asc()).all()
 
+    # The viewer's votes on these comments, in one query
+    user_comment_votes = dict(db.session.query(CommentLike.comment_id, CommentLike.vote_type).filter(
+        CommentLike.user_id == current_user.id,
+        CommentLike.comment_id.in_([comment.id for comment in comments])
+    ).all()) if comments else {}
+
     # Process comments with like info
     comments_data = []
     for comment in comments:
@@ -1096,10 +1065,9 @@ def view_post(post_id):
             user_comment_like = 0
         else:
             comment_author = comment.author
-            comment_likes = CommentLike.query.filter_by(comment_id=comment.id, vote_type=1).count()
-            comment_dislikes = CommentLike.query.filter_by(comment_id=comment.id, vote_type=-1).count()
-            user_comment_like = CommentLike.query.filter_by(comment_id=comment.id, user_id=current_user.id).first()
-            user_comment_like = user_comment_like.vote_type if user_comment_like else 0
+            comment_likes = comment.like_count
+            comment_dislikes = comment.dislike_count
+            user_comment_like = user_comment_votes.get(comment.id, 0)
 
         comments_data.append({
             'comment': comment,
@@ -1112,8 +1080,8 @@ def view_post(post_id):
     return render_template('view_post.html',
                          post=post,
                          author=post.author,
-                         likes=likes,
-                         dislikes=dislikes,
+                         likes=post.like_count,
+                         dislikes=post.dislike_count,
                          user_vote_type=user_like.vote_type if user_like else 0,
                          comments_data=comments_data)
 
@@ -1126,7 +1094,7 @@ def add_comment(post_id):
 
     # Check if user can comment (only friends and post author)
     if post.author_id != current_user.id:
-        if not are_friends(current_user.id, post.author_id):
+        if not friend_graph.are_friends(current_user.id, post.author_id):
             flash('You can only comment on posts from friends', 'error')
             return redirect(url_for('posts'))
 
@@ -1143,6 +1111,7 @@ def add_comment(post_id):
     )
 
     db.session.add(comment)
+    counters.adjust_comment_count(post_id, 1)
     db.session.commit()
 
     # Log comment creation
@@ -1160,12 +1129,14 @@ def toggle_post_like(post_id):
 
     # Check if user can like (only friends and post author)
     if post.author_id != current_user.id:
-        if not are_friends(current_user.id, post.author_id):
+        if not friend_graph.are_friends(current_user.id, post.author_id):
             return jsonify({'error': 'Unauthorized'}), 403
 
     vote_type = request.json.get('vote_type', 1)  # 1 for like, -1 for dislike
 
-    existing_like = PostLike.query.filter_by(post_id=post_id, user_id=current_user.id).first()
+    # Lock the vote row so concurrent toggles by the same user apply their deltas one after another
+    existing_like = PostLike.query.filter_by(post_id=post_id, user_id=current_user.id).with_for_update().first()
+    old_vote = existing_like.vote_type if existing_like else 0
 
     if existing_like:
         if existing_like.vote_type == vote_type:
@@ -1181,18 +1152,18 @@ def toggle_post_like(post_id):
         new_like = PostLike(post_id=post_id, user_id=current_user.id, vote_type=vote_type)
         db.session.add(new_like)
         action = 'added'
-        # Log like/dislike
+
+    # Update the stored counts in the same transaction as the vote
+    likes, dislikes = counters.apply_post_vote(post_id, old_vote, vote_type if action != 'removed' else 0)
+    db.session.commit()
+
+    # Log like/dislike
+    if action == 'added':
         if vote_type == 1:
             log_post_liked(current_user.id, post_id)
         else:
             log_post_disliked(current_user.id, post_id)
 
-    db.session.commit()
-
-    # Get updated counts
-    likes = PostLike.query.filter_by(post_id=post_id, vote_type=1).count()
-    dislikes = PostLike.query.filter_by(post_id=post_id, vote_type=-1).count()
-
     return jsonify({
         'action': action,
         'likes': likes,
@@ -1209,17 +1180,21 @@ def toggle_comment_like(comment_id):
 
     # Check if user can like comment
     post = comment.post
-    if post.author_id != current_user.id and not are_friends(current_user.id, post.author_id):
+    if post.author_id != current_user.id and not friend_graph.are_friends(current_user.id, post.author_id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     vote_type = request.json.get('vote_type', 1)  # 1 for like, -1 for dislike
 
-    existing_like = CommentLike.query.filter_by(comment_id=comment_id, user_id=current_user.id).first()
+    # Lock the vote row so concurrent toggles by the same user apply their deltas one after another
+    existing_like = CommentLike.query.filter_by(comment_id=comment_id, user_id=current_user.id).with_for_update().first()
+    old_vote = existing_like.vote_type if existing_like else 0
+    new_vote = vote_type
 
     if existing_like:
         if existing_like.vote_type == vote_type:
             # Remove like/dislike if same vote type
             db.session.delete(existing_like)
+            new_vote = 0
         else:
             # Change vote type
             existing_like.vote_type = vote_type
@@ -1228,12 +1203,10 @@ def toggle_comment_like(comment_id):
         new_like = CommentLike(comment_id=comment_id, user_id=current_user.id, vote_type=vote_type)
         db.session.add(new_like)
 
+    # Update the stored counts in the same transaction as the vote
+    likes, dislikes = counters.apply_comment_vote(comment_id, old_vote, new_vote)
     db.session.commit()
 
-    # Get updated counts
-    likes = CommentLike.query.filter_by(comment_id=comment_id, vote_type=1).count()
-    dislikes = CommentLike.query.filter_by(comment_id=comment_id, vote_type=-1).count()
-
     return jsonify({
         'likes': likes,
         'dislikes': dislikes
@@ -1253,6 +1226,7 @@ def delete_comment(comment_id):
 
     post_id = comment.post_id
     db.session.delete(comment)
+    counters.adjust_comment_count(post_id, -1)
     db.session.commit()
 
     flash('Comment deleted successfully', 'success')
@@ -1270,6 +1244,8 @@ def delete_post(post_id):
         flash('You can only delete your own posts', 'error')
         return redirect(url_for('view_post', post_id=post_id))
 
+    timeline.remove_post(post.id)
+    fragment_cache.forget_post(post, ['post_card_header.html', 'post_card_comments.html', 'post_detail_header.html'])
     db.session.delete(post)  # This will cascade delete comments due to the relationship
     db.session.commit()
 
@@ -1290,9 +1266,6 @@ def swift_chat():
         return jsonify({'success': False, 'error': 'Message cannot be empty'}), 400
 
     try:
-        # Initialize OpenAI client
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
         # Build context based on user type
         if current_user.is_admin:
             # Admin context - can access site-wide information
@@ -1313,15 +1286,7 @@ def swift_chat():
         else:
             # Regular user context - privacy-focused
             # Get user's friends and their posts
-            friends_ids = []
-            friendships = Friendship.query.filter(
-                (Friendship.user1_id == current_user.id) |
-                (Friendship.user2_id == current_user.id)
-            ).all()
-
-            for friendship in friendships:
-                friend_id = friendship.user2_id if friendship.user1_id == current_user.id else friendship.user1_id
-                friends_ids.append(friend_id)
+            friends_ids = list(friend_graph.friend_ids(current_user.id))
 
             # Get recent posts from friends
             recent_posts = []
@@ -1377,18 +1342,17 @@ def swift_chat():
             print(f"Error fetching chat history from Chroma: {e}")
 
         # Generate response
-        response = client.chat.completions.create(
-            model=os.getenv('OPENAI_MODEL', 'gpt-4o'),
-            messages=[
+        ai_response = llm_gateway.get_gateway().complete(
+            [
                 {"role": "system", "content": context_prompt},
                 {"role": "user", "content": user_message}
             ],
+            call_site='swift_chat',
             max_tokens=500,
-            temperature=0.7
+            temperature=0.7,
+            cache=False  # Conversational replies should not repeat
         )
 
-        ai_response = response.choices[0].message.content.strip()
-
         # Save to database
         chat_entry = ChatHistory(
             user_id=current_user.id,
@@ -1583,42 +1547,19 @@ def logout():
 @app.route('/activity-log')
 @login_required
 def activity_log():
-    from models import ActivityLog, User
-    from datetime import datetime, timedelta
+    from models import User
 
     # Get filter parameters
     filter_type = request.args.get('filter', 'all')  # all, days, weeks, months, years
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-
-    # Calculate date range based on filter
-    end_date = datetime.utcnow()
-    if filter_type == 'days':
-        start_date = end_date - timedelta(days=7)
-    elif filter_type == 'weeks':
-        start_date = end_date - timedelta(weeks=4)
-    elif filter_type == 'months':
-        start_date = end_date - timedelta(days=30)
-    elif filter_type == 'years':
-        start_date = end_date - timedelta(days=365)
-    else:  # all
-        start_date = None
-
-    # Build query
-    query = ActivityLog.query.filter_by(user_id=current_user.id)
-
-    if start_date:
-        query = query.filter(ActivityLog.created_at >= start_date)
-
-    # Order by most recent first
-    query = query.order_by(ActivityLog.created_at.desc())
-
-    # Paginate results
-    activities = query.paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
+    before = request.args.get('before')
+    after = request.args.get('after')
+
+    # Keyset pages on (created_at, id); the window filter narrows the same index range
+    activities, newer_cursor, older_cursor = activity_logger.activity_page(
+        current_user.id, filter_type, before=before, after=after,
+        page_size=app.config['ACTIVITY_LOG_PAGE_SIZE']
     )
+    activity_total, total_capped = activity_logger.activity_count(current_user.id, filter_type)
 
     # Get total user count for admin
     total_users = 0
@@ -1628,6 +1569,10 @@ def activity_log():
     return render_template(
         'activity_log.html',
         activities=activities,
+        newer_cursor=newer_cursor,
+        older_cursor=older_cursor,
+        activity_total=activity_total,
+        total_capped=total_capped,
         filter_type=filter_type,
         total_users=total_users
     )
@@ -1640,35 +1585,91 @@ def admin_panel():
         flash('You are not authorized to access the admin panel', 'error')
         return redirect(url_for('profile'))
 
-    from models import User, Post, Message, Comment, FriendRequest, Friendship, ChatHistory
-
-    # Get all users except current admin
-    users = User.query.filter(User.id != current_user.id).order_by(User.created_at.desc()).all()
-
-    # Add statistics for each user
-    users_with_stats = []
-    for user in users:
-        # Get user statistics
-        posts_count = Post.query.filter_by(author_id=user.id).count()
-        comments_count = Comment.query.filter_by(author_id=user.id).count()
-        messages_sent = Message.query.filter_by(sender_id=user.id).count()
-        messages_received = Message.query.filter_by(receiver_id=user.id).count()
-        friends_count = Friendship.query.filter(
-            (Friendship.user1_id == user.id) | (Friendship.user2_id == user.id)
-        ).count()
-        chat_sessions = ChatHistory.query.filter_by(user_id=user.id).distinct(ChatHistory.session_id).count()
-
-        users_with_stats.append({
-            'user': user,
-            'posts_count': posts_count,
-            'comments_count': comments_count,
-            'messages_sent': messages_sent,
-            'messages_received': messages_received,
-            'friends_count': friends_count,
-            'chat_sessions': chat_sessions
-        })
+    # Grouped aggregates joined on user_id: a fixed number of queries for any number of users
+    sort = request.args.get('sort', 'joined')
+    if sort not in admin_stats.SORT_KEYS:
+        sort = 'joined'
+    direction = 'asc' if request.args.get('direction') == 'asc' else 'desc'
+    page = request.args.get('page', 1, type=int)
+    per_page = app.config['ADMIN_PAGE_SIZE']
+
+    users_with_stats, total_users = admin_stats.user_stats_page(
+        exclude_user_id=current_user.id, sort=sort, direction=direction, page=page, per_page=per_page
+    )
+    pages = max((total_users + per_page - 1) // per_page, 1)
+
+    return render_template('admin.html', users_with_stats=users_with_stats, totals=admin_stats.platform_totals(),
+                           sort=sort, direction=direction, page=page, pages=pages)
+
+@app.route('/admin/llm-metrics')
+@login_required
+def admin_llm_metrics():
+    """LLM gateway call counts, latency and token usage for this worker"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(llm_gateway.get_gateway().metrics())
+
+@app.route('/admin/activity-stats')
+@login_required
+def admin_activity_stats():
+    """Activity counts per day and type, including days whose raw logs were rolled up and dropped"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = date.fromisoformat(since) if since else datetime.utcnow().date() - timedelta(days=30)
+        until = date.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO dates'}), 400
+
+    counts = activity_logger.daily_activity_counts(since, until, user_id=request.args.get('user_id', type=int))
+    return jsonify({
+        'since': since.isoformat(),
+        'until': until.isoformat() if until else None,
+        'days': [{'day': day.isoformat(), 'activity_type': activity_type, 'count': count}
+                 for (day, activity_type), count in sorted(counts.items())]
+    })
+
+@app.route('/admin/activity-logs/export')
+@login_required
+def admin_export_activity_logs():
+    """Stream activity logs as NDJSON or CSV, filtered by user_id, type, since and until"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
 
-    return render_template('admin.html', users_with_stats=users_with_stats)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in activity_export.EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(activity_export.EXPORT_FORMATS)}"}), 400
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        stmt = activity_export.export_query(
+            user_id=request.args.get('user_id', type=int),
+            activity_type=request.args.get('type'),
+            since=datetime.fromisoformat(since) if since else None,
+            until=datetime.fromisoformat(until) if until else None
+        )
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO dates or datetimes'}), 400
+
+    # Compress on the fly for clients that accept it (browsers and curl --compressed decode it transparently)
+    compress = 'gzip' in request.accept_encodings
+    headers = {
+        'Content-Disposition': f'attachment; filename=activity_logs.{fmt}',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no'
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(
+        stream_with_context(activity_export.export_chunks(stmt, fmt, compress=compress)),
+        mimetype=activity_export.EXPORT_FORMATS[fmt],
+        headers=headers
+    )
 
 @app.route('/admin/user/<int:user_id>')
 @login_required
@@ -1678,6 +1679,7 @@ def admin_view_user(user_id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     from models import User, Post, Message, Comment, FriendRequest, Friendship, ChatHistory, Profile
+    from sqlalchemy import func, distinct
 
     # Get user details
     user = User.query.get_or_404(user_id)
@@ -1689,12 +1691,11 @@ def admin_view_user(user_id):
         'comments_count': Comment.query.filter_by(author_id=user_id).count(),
         'messages_sent': Message.query.filter_by(sender_id=user_id).count(),
         'messages_received': Message.query.filter_by(receiver_id=user_id).count(),
-        'friends_count': Friendship.query.filter(
-            (Friendship.user1_id == user_id) | (Friendship.user2_id == user_id)
-        ).count(),
+        'friends_count': friend_graph.friend_count(user_id),
         'pending_requests_sent': FriendRequest.query.filter_by(sender_id=user_id, status='pending').count(),
         'pending_requests_received': FriendRequest.query.filter_by(receiver_id=user_id, status='pending').count(),
-        'chat_sessions': ChatHistory.query.filter_by(user_id=user_id).distinct(ChatHistory.session_id).count()
+        'chat_sessions': db.session.query(func.count(distinct(ChatHistory.session_id))).filter(
+            ChatHistory.user_id == user_id).scalar()
     }
 
     return render_template('admin_user_details.html', user=user, profile=profile, stats=stats)
@@ -1711,7 +1712,7 @@ def admin_delete_user(user_id):
         flash('You cannot delete your own account', 'error')
         return redirect(url_for('admin_panel'))
 
-    from models import User, Post, Message, Comment, FriendRequest, Friendship, ChatHistory, Profile, PostLike, CommentLike, ActivityLog
+    from models import User, Post, Message, Comment, FriendRequest, Friendship, ChatHistory, Profile, PostLike, CommentLike, ActivityLog, ActivityDailyCount, Conversation
 
     try:
         # Get user before deletion
@@ -1720,7 +1721,10 @@ def admin_delete_user(user_id):
         user_name = user_to_delete.name
 
         # Log the deletion
-        log_activity(current_user.id, 'delete_user', f'Deleted user {user_name} ({user_email})', target_user_id=user_id)
+        # No target_user_id: the row may be written after the user row is gone,
+        # so the id, name and email are kept in activity_data instead
+        log_activity(current_user.id, 'delete_user',
+                     activity_data={'user_id': user_id, 'name': user_name, 'email': user_email})
 
         # Delete from Chroma Cloud first (chat history)
         try:
@@ -1730,12 +1734,16 @@ def admin_delete_user(user_id):
         except Exception as e:
             print(f"Error deleting from Chroma: {e}")
 
+        # Delete timeline entries owned by or pointing at the user
+        timeline.remove_user(user_id)
+
         # Delete friendships (both sides)
         friendships = Friendship.query.filter(
             (Friendship.user1_id == user_id) | (Friendship.user2_id == user_id)
         ).all()
         for friendship in friendships:
             db.session.delete(friendship)
+        friend_graph.invalidate(user_id, *(f.user1_id for f in friendships), *(f.user2_id for f in friendships))
 
         # Delete friend requests (both sent and received)
         friend_requests = FriendRequest.query.filter(
@@ -1744,6 +1752,11 @@ def admin_delete_user(user_id):
         for req in friend_requests:
             db.session.delete(req)
 
+        # Remember which other posts/comments the user touched so their counters can be fixed
+        touched_post_ids = {row[0] for row in db.session.query(Comment.post_id).filter_by(author_id=user_id)}
+        touched_post_ids |= {row[0] for row in db.session.query(PostLike.post_id).filter_by(user_id=user_id)}
+        touched_comment_ids = {row[0] for row in db.session.query(CommentLike.comment_id).filter_by(user_id=user_id)}
+
         # Delete all posts (comments will be deleted automatically due to CASCADE)
         Post.query.filter_by(author_id=user_id).delete()
 
@@ -1752,10 +1765,20 @@ def admin_delete_user(user_id):
         CommentLike.query.filter_by(user_id=user_id).delete()
         PostLike.query.filter_by(user_id=user_id).delete()
 
-        # Delete messages (both sent and received)
+        # Recount the posts and comments that lost votes or comments
+        counters.reconcile_posts(touched_post_ids)
+        counters.reconcile_comments(touched_comment_ids)
+
+        # Delete messages (both sent and received), then recount the receivers who lose unread ones
+        unread_receiver_ids = {row[0] for row in db.session.query(Message.receiver_id).filter(
+            Message.sender_id == user_id, ~Message.is_read)}
         Message.query.filter(
             (Message.sender_id == user_id) | (Message.receiver_id == user_id)
         ).delete()
+        messaging.reconcile_unread_counts(unread_receiver_ids)
+        Conversation.query.filter(
+            (Conversation.user_low_id == user_id) | (Conversation.user_high_id == user_id)
+        ).delete()
 
         # Delete chat history
         ChatHistory.query.filter_by(user_id=user_id).delete()
@@ -1763,6 +1786,7 @@ def admin_delete_user(user_id):
         # Delete activity logs (both as user and as target_user)
         ActivityLog.query.filter_by(user_id=user_id).delete()
         ActivityLog.query.filter_by(target_user_id=user_id).delete()
+        ActivityDailyCount.query.filter_by(user_id=user_id).delete()
 
         # Delete profile
         Profile.query.filter_by(user_id=user_id).delete()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Rebuild the materialized home timelines from the posts and friendships tables
+
+Run this once before switching FEED_FANOUT to 'write', and again any time
+the timeline_entries table needs to be repaired.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, TimelineEntry
+import timeline
+
+def backfill_timelines():
+    """Create the timeline table if needed and rebuild every timeline in bulk"""
+    with app.app_context():
+        try:
+            TimelineEntry.__table__.create(db.engine, checkfirst=True)
+
+            print("Rebuilding home timelines...")
+            count = timeline.rebuild_all()
+            print(f"[SUCCESS] Wrote {count} timeline entries")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAILED] Error rebuilding timelines: {e}")
+            return False
+
+if __name__ == "__main__":
+    if not backfill_timelines():
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the AI enrichment pipeline
+
+Queues enrichment jobs for a batch of posts and drains them with the fake
+LLM backend at different worker concurrencies, printing jobs per second.
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+
+    python bench_ai_pipeline.py --posts 200 --latency 0.05 --concurrency 1 4 16
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=200, help='number of posts to enrich per run')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per LLM call')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of LLM calls that fail')
+    parser.add_argument('--retry-delay', type=float, default=0.1,
+                        help='base seconds before a failed job is retried (the worker uses 10)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench_ai_pipeline.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from app import app
+    from models import db, User, Post, AIJob
+    from datetime import timedelta
+    import ai_pipeline
+    from ai_pipeline import WorkerPool, enqueue_post_enrichment
+    from llm_backends import FakeLLMBackend
+    from llm_gateway import LLMGateway
+
+    # drain() waits for queued retries, so keep their backoff short
+    ai_pipeline.RETRY_DELAY = timedelta(seconds=args.retry_delay)
+
+    with app.app_context():
+        db.create_all()
+        user = User.query.filter_by(username='bench').first()
+        if not user:
+            user = User(username='bench', email='bench@example.com', name='Bench', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+        user_id = user.id
+
+    print(f"{'concurrency':>12} {'jobs':>6} {'seconds':>8} {'jobs/s':>8} {'failed':>7}")
+    for concurrency in args.concurrency:
+        with app.app_context():
+            for i in range(args.posts):
+                post = Post(author_id=user_id, content=f'Benchmark post {i}', category='personal')
+                db.session.add(post)
+                db.session.flush()
+                enqueue_post_enrichment(post)
+            db.session.commit()
+
+        backend = FakeLLMBackend(latency=args.latency, failure_rate=args.failure_rate, seed=concurrency)
+        gateway = LLMGateway(backend, max_concurrency=concurrency)
+        pool = WorkerPool(app, concurrency=concurrency, poll_interval=0.01, gateway=gateway)
+
+        started = time.perf_counter()
+        pool.drain()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            failed = AIJob.query.filter_by(status='failed').count()
+            AIJob.query.delete()
+            db.session.commit()
+
+        print(f"{concurrency:>12} {args.posts:>6} {elapsed:>8.2f} {args.posts / elapsed:>8.1f} {failed:>7}")
+
+if __name__ == '__main__':
+    main()
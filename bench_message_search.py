@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark of message search on a large seeded messages table
+
+Seeds users and a few million messages whose words follow a skewed
+distribution (a handful of very common words, a long tail of rare ones),
+runs ANALYZE, then times messaging.search_messages() for common, medium
+and rare terms from a sample of users, next to the ILIKE scan it replaces.
+Everything runs in one transaction that is rolled back, but the seed is
+large, so point DATABASE_URL at a scratch PostgreSQL database that has
+been migrated with `alembic upgrade head`.
+
+    python bench_message_search.py --messages 2000000 --users 5000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from sqlalchemy import text, select, or_
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Word k of the vocabulary is "termk"; smaller k is more frequent
+TERMS = [('common', 'term1'), ('medium', 'term60'), ('rare', 'term3000'), ('two words', 'term2 term45')]
+
+def seed(db, users, messages):
+    ids = {
+        table: db.session.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        for table in ('users', 'messages')
+    }
+    params = {'users': users, 'messages': messages, 'u': ids['users'], 'm': ids['messages']}
+    db.session.execute(text("""
+        INSERT INTO users (id, email, password_hash, name, username, created_at, is_admin, role,
+                           unread_message_count)
+        SELECT :u + g, 'search-bench-' || (:u + g) || '@example.com', 'x', 'Search Bench ' || g,
+               'search_bench_' || (:u + g), now(), false, 'User', 0
+        FROM generate_series(1, :users) g
+    """), params)
+    # Twelve words per message; exp(random() * ln(5000)) gives a Zipf-like term frequency
+    db.session.execute(text("""
+        INSERT INTO messages (id, sender_id, receiver_id, content, timestamp, is_read)
+        SELECT :m + g, :u + g % :users + 1, :u + (g + g / :users % 10 + 1) % :users + 1,
+               (SELECT string_agg('term' || floor(exp(random() * ln(5000)))::int, ' ')
+                FROM generate_series(1, 12) w WHERE g > 0),
+               now() - (:messages - g) * interval '1 second', true
+        FROM generate_series(1, :messages) g
+    """), params)
+    db.session.execute(text("ANALYZE users"))
+    db.session.execute(text("ANALYZE messages"))
+    return list(range(ids['users'] + 1, ids['users'] + users + 1))
+
+def ilike_search(user_id, query, per_page):
+    """The scan full-text search replaces: substring match in the user's messages, newest first"""
+    from models import db, Message
+    return db.session.execute(
+        select(Message.id)
+        .where(or_(Message.sender_id == user_id, Message.receiver_id == user_id),
+               Message.content.ilike(f'%{query}%'))
+        .order_by(Message.id.desc())
+        .limit(per_page + 1)
+    ).all()
+
+def timed(fn, samples):
+    durations = []
+    for args in samples:
+        started = time.perf_counter()
+        fn(*args)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations), max(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000000, help='number of messages to seed')
+    parser.add_argument('--users', type=int, default=5000, help='number of users to spread them over')
+    parser.add_argument('--samples', type=int, default=20, help='searching users sampled per term')
+    args = parser.parse_args()
+
+    from app import app
+    from models import db
+    import messaging
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("bench_message_search.py needs a PostgreSQL DATABASE_URL")
+            sys.exit(1)
+
+        try:
+            print(f"Seeding {args.messages:,} messages for {args.users:,} users...")
+            started = time.perf_counter()
+            user_ids = seed(db, args.users, args.messages)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s\n")
+
+            per_page = app.config['MESSAGE_SEARCH_PAGE_SIZE']
+            sample_users = random.Random(0).sample(user_ids, min(args.samples, len(user_ids)))
+
+            print(f"{'term':>10} {'query':>14} {'fts p50 ms':>11} {'fts max ms':>11} "
+                  f"{'ilike p50 ms':>13} {'ilike max ms':>13}")
+            for label, query in TERMS:
+                fts = timed(lambda user_id: messaging.search_messages(user_id, query, per_page=per_page),
+                            [(user_id,) for user_id in sample_users])
+                ilike = timed(lambda user_id: ilike_search(user_id, query, per_page),
+                              [(user_id,) for user_id in sample_users])
+                print(f"{label:>10} {query:>14} {fts[0]:>11.1f} {fts[1]:>11.1f} {ilike[0]:>13.1f} {ilike[1]:>13.1f}")
+        finally:
+            db.session.rollback()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the send_message write path
+
+Sends a batch of chat messages with the old write path (commit the message,
+then commit each activity record after looking up the other user's name)
+and with the single-transaction path send_message uses now, printing
+messages per second for each. Each message runs in a fresh session, like
+a request. Uses a throwaway SQLite database unless DATABASE_URL is set.
+
+    python bench_send_message.py --messages 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def send_separate_commits(sender_id, receiver_id, content):
+    """The write path before: one commit for the message, one per activity record"""
+    from models import db, User, Message
+    from activity_logger import log_message_sent, log_message_received
+    import messaging
+
+    db.session.get(User, sender_id)
+    db.session.get(User, receiver_id)
+    message = Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
+    db.session.add(message)
+    db.session.flush()
+    messaging.record_message_sent(message)
+    db.session.commit()
+
+    log_message_sent(sender_id, receiver_id)
+    log_message_received(sender_id, receiver_id)
+
+def send_single_transaction(sender_id, receiver_id, content):
+    """The write path now: message and both activity records in one flush and one commit"""
+    from models import db, User, Message
+    from activity_logger import log_message_sent, log_message_received
+    import messaging
+
+    sender = db.session.get(User, sender_id)
+    receiver = db.session.get(User, receiver_id)
+    message = Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
+    db.session.add(message)
+    log_message_sent(sender_id, receiver_id, receiver_name=receiver.name, commit=False)
+    log_message_received(sender_id, receiver_id, sender_name=sender.name, commit=False)
+    db.session.flush()
+    messaging.record_message_sent(message)
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='number of messages to send per run')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench_send_message.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        db.create_all()
+        user_ids = []
+        for name in ('bench_sender', 'bench_receiver'):
+            user = User.query.filter_by(username=name).first()
+            if not user:
+                user = User(username=name, email=f'{name}@example.com', name=name, password_hash='x')
+                db.session.add(user)
+                db.session.commit()
+            user_ids.append(user.id)
+        sender_id, receiver_id = user_ids
+
+    print(f"{'write path':>20} {'messages':>9} {'seconds':>8} {'msgs/s':>8}")
+    for label, send in [('separate commits', send_separate_commits),
+                        ('single transaction', send_single_transaction)]:
+        with app.app_context():
+            started = time.perf_counter()
+            for i in range(args.messages):
+                send(sender_id, receiver_id, f'Benchmark message {i}')
+                db.session.remove()
+            elapsed = time.perf_counter() - started
+
+        print(f"{label:>20} {args.messages:>9} {elapsed:>8.2f} {args.messages / elapsed:>8.1f}")
+
+if __name__ == '__main__':
+    main()
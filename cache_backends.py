@@ -0,0 +1,199 @@
+"""
+Pluggable key/value cache backends
+
+MemoryLRUCache keeps values in the worker process and evicts the least
+recently used entries once a byte budget is exceeded. FileSystemCache
+stores pickled values in a directory, so every gunicorn worker on the same
+host shares one cache. Both expose get/set/delete/clear and hit/miss counters.
+"""
+
+import os
+import sys
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+def _size_of(value):
+    """Approximate size of a cached value in bytes"""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+class MemoryLRUCache:
+    """In-process LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, default_ttl=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, size=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = size if size is not None else _size_of(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+
+            # Evict least recently used entries until we are back under budget
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self):
+        return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self.current_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+class FileSystemCache:
+    """Cache stored as pickle files in a directory shared by all workers on the host"""
+
+    def __init__(self, directory, max_entries=10000, default_ttl=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None, size=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.time() + ttl if ttl else None
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _prune(self):
+        """Drop the oldest files once the directory holds more than max_entries"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort()
+        # Remove an extra 10% so pruning does not run on every write
+        for _, path in entries[:len(entries) - int(self.max_entries * 0.9)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'backend': 'filesystem', 'directory': self.directory,
+                'hits': self.hits, 'misses': self.misses}
+
+def create_cache(backend='memory', max_bytes=32 * 1024 * 1024, directory=None,
+                 max_entries=10000, default_ttl=None):
+    """
+    Build a cache backend
+
+    Args:
+        backend: 'memory' for a per-worker LRU, 'filesystem' for a cache shared across workers
+        max_bytes: Byte budget of the memory backend
+        directory: Directory of the filesystem backend
+        max_entries: Entry limit of the filesystem backend
+        default_ttl: Seconds before entries expire (None = never)
+    """
+    if backend == 'filesystem':
+        directory = directory or os.path.join(tempfile.gettempdir(), 'socialmedia-cache')
+        return FileSystemCache(directory, max_entries=max_entries, default_ttl=default_ttl)
+    if backend == 'memory':
+        return MemoryLRUCache(max_bytes=max_bytes, default_ttl=default_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Check that each route's main query is served by an index
+
+Seeds a synthetic dataset into the database from DATABASE_URL, runs
+ANALYZE, calls the same helpers the routes use and EXPLAINs every
+statement they send. A check fails when none of its expected indexes
+appears in the plans, and a keyset check (a page past the first) also
+fails when the scan of that index applies its cursor as a Filter on the
+rows read rather than as a bound of the range it reads. Everything runs
+in one transaction that is rolled back at the end, but the seed is
+large, so point it at a scratch or staging PostgreSQL database that has
+been migrated with `alembic upgrade head`, not at production.
+
+Usage:
+    python check_query_plans.py [scale]
+
+`scale` multiplies the dataset size (default 1: 2,000 users, 40,000
+posts, 200,000 messages).
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, FriendRequest, ChatHistory, TimelineEntry
+from sqlalchemy import event, text
+import activity_logger
+import counters
+import feed
+import friend_graph
+import messaging
+import timeline
+
+SEED_TABLES = ['users', 'profiles', 'friendships', 'friend_requests', 'posts', 'comments', 'post_likes',
+               'messages', 'conversations', 'timeline_entries', 'activity_logs', 'chat_history']
+
+def _next_ids(tables):
+    """First free id of each table, so the seeded rows never collide with real ones"""
+    return {
+        table: db.session.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+        for table in tables
+    }
+
+def seed(scale):
+    """
+    Insert the synthetic dataset with generate_series
+
+    Every user has ten friends, twenty posts and a hundred messages; each
+    post has five comments and five votes.
+
+    Returns:
+        (viewer id, a friend of the viewer's id, a chat session id of the viewer)
+    """
+    users = 2000 * scale
+    ids = _next_ids(['users', 'profiles', 'posts', 'comments', 'messages'])
+    params = {
+        'users': users, 'posts': users * 20, 'messages': users * 100,
+        'u': ids['users'], 'pr': ids['profiles'], 'p': ids['posts'],
+        'c': ids['comments'], 'm': ids['messages']
+    }
+
+    statements = [
+        """INSERT INTO users (id, email, password_hash, name, username, created_at, is_admin, role,
+                              unread_message_count)
+           SELECT :u + g, 'plan-check-' || (:u + g) || '@example.com', 'x', 'Plan Check ' || g,
+                  'plan_check_' || (:u + g), now() - g * interval '1 hour', false, 'User', 0
+           FROM generate_series(1, :users) g""",
+        """INSERT INTO profiles (id, user_id, secret_key, created_at, updated_at)
+           SELECT :pr + g, :u + g, 'plan-check-' || (:pr + g), now(), now()
+           FROM generate_series(1, :users) g""",
+        """INSERT INTO friendships (user1_id, user2_id, created_at)
+           SELECT :u + g, :u + (g + k - 1) % :users + 1, now()
+           FROM generate_series(1, :users) g, generate_series(1, 10) k""",
+        """INSERT INTO friend_requests (sender_id, receiver_id, status, created_at)
+           SELECT :u + (g + 20 + k) % :users + 1, :u + g,
+                  CASE WHEN k = 1 THEN 'pending' ELSE 'declined' END, now()
+           FROM generate_series(1, :users) g, generate_series(1, 3) k""",
+        """INSERT INTO posts (id, author_id, content, category, is_ai_generated, like_count, dislike_count,
+                              comment_count, version, created_at, updated_at)
+           SELECT :p + g, :u + g % :users + 1, 'Post ' || g, 'personal', false, 4, 1, 5, 1,
+                  now() - g * interval '1 minute', now()
+           FROM generate_series(1, :posts) g""",
+        """INSERT INTO comments (id, post_id, author_id, content, is_ai_comment, like_count, dislike_count,
+                                 created_at, updated_at)
+           SELECT :c + (g - 1) * 5 + k, :p + g, :u + (g + k) % :users + 1, 'Comment ' || k, false, 0, 0,
+                  now() - g * interval '1 minute' + k * interval '1 second', now()
+           FROM generate_series(1, :posts) g, generate_series(1, 5) k""",
+        """INSERT INTO post_likes (post_id, user_id, vote_type, created_at)
+           SELECT :p + g, :u + (g + k * 7) % :users + 1, CASE WHEN k = 5 THEN -1 ELSE 1 END, now()
+           FROM generate_series(1, :posts) g, generate_series(1, 5) k""",
+        """INSERT INTO messages (id, sender_id, receiver_id, content, timestamp, is_read)
+           SELECT :m + g, :u + g % :users + 1, :u + (g + (g / :users) % 10 + 1) % :users + 1,
+                  'Message ' || g, now() - (:messages - g) * interval '1 second', g % 7 <> 0
+           FROM generate_series(1, :messages) g""",
+        """INSERT INTO conversations (user_low_id, user_high_id, last_message_id, last_sender_id,
+                                      last_message_snippet, last_message_at, unread_low, unread_high)
+           SELECT DISTINCT ON (pair.low_id, pair.high_id)
+                  pair.low_id, pair.high_id, m.id, m.sender_id, LEFT(m.content, 100), m.timestamp, 0, 0
+           FROM messages m
+           CROSS JOIN LATERAL (
+               SELECT LEAST(m.sender_id, m.receiver_id) AS low_id,
+                      GREATEST(m.sender_id, m.receiver_id) AS high_id
+           ) pair
+           WHERE m.id > :m
+           ORDER BY pair.low_id, pair.high_id, m.id DESC
+           ON CONFLICT (user_low_id, user_high_id) DO NOTHING""",
+        """INSERT INTO timeline_entries (user_id, post_id, author_id, created_at)
+           SELECT f.user2_id, p.id, p.author_id, p.created_at
+           FROM posts p JOIN friendships f ON f.user1_id = p.author_id
+           WHERE p.id > :p
+           ON CONFLICT DO NOTHING""",
+        """INSERT INTO activity_logs (user_id, activity_type, description, created_at)
+           SELECT :u + g % :users + 1, 'post_created', 'Created a post', now() - g * interval '1 minute'
+           FROM generate_series(1, :messages) g""",
+        """INSERT INTO chat_history (user_id, session_id, user_message, ai_response, created_at)
+           SELECT :u + g % :users + 1, 'plan-check-' || (g / :users) % 20, 'Hello', 'Hi!',
+                  now() - g * interval '1 minute'
+           FROM generate_series(1, :posts) g""",
+    ]
+    for statement in statements:
+        db.session.execute(text(statement), params)
+
+    for table in SEED_TABLES:
+        db.session.execute(text(f"ANALYZE {table}"))
+
+    viewer_id = ids['users'] + 1
+    return viewer_id, viewer_id + 1, 'plan-check-0'
+
+def capture_statements(fn):
+    """Run fn and return the (statement, parameters) pairs it sent to the database"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+def _plan_indexes(node):
+    """Names of the indexes used anywhere in an EXPLAIN (FORMAT JSON) plan node"""
+    names = {node['Index Name']} if 'Index Name' in node else set()
+    for child in node.get('Plans', []):
+        names |= _plan_indexes(child)
+    return names
+
+def _plan_filtered_indexes(node):
+    """Names of the indexes whose scan in an EXPLAIN (FORMAT JSON) plan node has a Filter"""
+    names = {node['Index Name']} if 'Index Name' in node and 'Filter' in node else set()
+    for child in node.get('Plans', []):
+        names |= _plan_filtered_indexes(child)
+    return names
+
+def _parent_index(connection, name):
+    """Name of the partitioned index a partition's index belongs to (the name itself otherwise)"""
+    parent = connection.exec_driver_sql("""
+        SELECT p.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relname = %(name)s
+    """, {'name': name}).scalar()
+    return _parent_index(connection, parent) if parent else name
+
+def used_indexes(statements):
+    """
+    Indexes the plans of the statements use
+
+    Returns:
+        (names of the indexes used, names of those scanned with a Filter)
+    """
+    names, filtered = set(), set()
+    connection = db.session.connection()
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+        # Partitions of messages and activity_logs have their own copies of its indexes
+        names |= {_parent_index(connection, name) for name in _plan_indexes(plan[0]['Plan'])}
+        filtered |= {_parent_index(connection, name) for name in _plan_filtered_indexes(plan[0]['Plan'])}
+    return names, filtered
+
+def build_checks(viewer_id, friend_id, session_id):
+    """
+    (description, callable running the route's query, indexes of which at
+    least one must be used, whether that index's scan must have no Filter)
+    """
+    def feed_page():
+        author_ids = list(friend_graph._load_friend_ids(viewer_id)) + [viewer_id]
+        return feed.paginate_posts(feed.feed_posts_query(author_ids))[0]
+
+    post_ids = [post.id for post in feed_page()]
+    timeline_columns = (TimelineEntry.created_at, TimelineEntry.post_id)
+    timeline_cursor = feed.paginate_posts(timeline.timeline_posts_query(viewer_id),
+                                          order_columns=timeline_columns)[1]
+    activity_cursor = activity_logger.activity_page(viewer_id, 'all')[2]
+
+    return [
+        ("Feed posts (/posts)", feed_page,
+         {'ix_posts_author_created'}),
+        ("Timeline posts (/posts, FEED_FANOUT=write)",
+         lambda: feed.paginate_posts(timeline.timeline_posts_query(viewer_id))[0],
+         {'ix_timeline_entries_user_created'}),
+        ("Timeline posts, a later page (/posts?before=, FEED_FANOUT=write)",
+         lambda: feed.paginate_posts(timeline.timeline_posts_query(viewer_id), before=timeline_cursor,
+                                     order_columns=timeline_columns)[0],
+         {'ix_timeline_entries_user_created'}, True),
+        ("Viewer's votes on a feed page", lambda: feed.get_user_votes(post_ids, viewer_id),
+         {'post_likes_post_id_user_id_key', 'ix_post_likes_post_vote'}),
+        ("Comment previews on a feed page", lambda: feed.get_comment_previews(post_ids),
+         {'ix_comments_post_created'}),
+        ("Post vote totals (reconcile_counters.py)", lambda: counters.reconcile_posts(post_ids),
+         {'ix_post_likes_post_vote'}),
+        ("Friend ids (friend_graph)", lambda: friend_graph._load_friend_ids(viewer_id),
+         {'ix_friendships_user2_id'}),
+        ("Pending friend requests (/profile, /friends)",
+         lambda: FriendRequest.query.filter_by(receiver_id=viewer_id, status='pending').all(),
+         {'ix_friend_requests_receiver_status'}),
+        ("Chat history page (/chat/<id>)",
+         lambda: messaging.recent_messages(viewer_id, friend_id, 50),
+         {'ix_messages_pair_id'}),
+        ("Mark conversation read (/chat/<id>)",
+         lambda: messaging.mark_conversation_read(viewer_id, friend_id),
+         {'ix_messages_unread'}),
+        ("Inbox (/messages)", lambda: messaging.inbox(viewer_id),
+         {'ix_conversations_low_last_message', 'ix_conversations_high_last_message'}),
+        ("Activity log (/activity-log)",
+         lambda: activity_logger.activity_page(viewer_id, 'months')[0],
+         {'ix_activity_logs_user_created_id'}),
+        ("Activity log, a later page (/activity-log?before=)",
+         lambda: activity_logger.activity_page(viewer_id, 'all', before=activity_cursor)[0],
+         {'ix_activity_logs_user_created_id'}, True),
+        ("Activity log total (/activity-log)",
+         lambda: activity_logger.activity_count(viewer_id, 'all'),
+         {'ix_activity_logs_user_created_id'}),
+        ("Swift chat session (/api/chat/session/<id>)",
+         lambda: ChatHistory.query.filter_by(user_id=viewer_id, session_id=session_id).order_by(
+             ChatHistory.created_at.asc()).all(),
+         {'ix_chat_history_user_session'}),
+    ]
+
+def check_query_plans(scale=1):
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("[FAILED] check_query_plans.py needs a PostgreSQL DATABASE_URL")
+            return False
+
+        failures = 0
+        try:
+            print(f"Seeding the plan-check dataset (scale {scale})...")
+            viewer_id, friend_id, session_id = seed(scale)
+
+            for description, run_query, expected, *keyset in build_checks(viewer_id, friend_id, session_id):
+                used, filtered = used_indexes(capture_statements(run_query))
+                if keyset and keyset[0] and used & expected & filtered:
+                    failures += 1
+                    print(f"[FAILED] {description}: the scan of {', '.join(sorted(used & expected & filtered))} "
+                          f"filters the rows before the cursor instead of starting at it")
+                elif used & expected:
+                    print(f"[SUCCESS] {description}: {', '.join(sorted(used & expected))}")
+                else:
+                    failures += 1
+                    print(f"[FAILED] {description}: expected one of {', '.join(sorted(expected))}, "
+                          f"plan used {', '.join(sorted(used)) or 'no index'}")
+        finally:
+            db.session.rollback()
+
+        print(f"\n{failures} of the checks failed" if failures else "\nAll queries use an index")
+        return failures == 0
+
+if __name__ == "__main__":
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    sys.exit(0 if check_query_plans(scale) else 1)
@@ -0,0 +1,111 @@
+"""
+Denormalized vote and comment counters for posts and comments
+
+The like/dislike/comment totals are stored on the posts and comments rows
+and adjusted with `col = col + delta` updates in the same transaction as
+the vote or comment write, so reads never have to COUNT(*) the child
+tables. Callers lock the existing vote row (SELECT ... FOR UPDATE) before
+computing the old vote, so concurrent toggles of the same vote cannot
+apply the same delta twice. reconcile_posts()/reconcile_comments()
+recompute the counters from the source tables to repair any drift.
+"""
+
+from sqlalchemy import update, select, func, and_, or_
+from models import db, Post, Comment, PostLike, CommentLike
+
+def _vote_deltas(old_vote, new_vote):
+    """Return (like_delta, dislike_delta) for a vote changing from old_vote to new_vote (0 = no vote)"""
+    like_delta = (new_vote == 1) - (old_vote == 1)
+    dislike_delta = (new_vote == -1) - (old_vote == -1)
+    return like_delta, dislike_delta
+
+def _apply_vote(model, row_id, old_vote, new_vote):
+    like_delta, dislike_delta = _vote_deltas(old_vote, new_vote)
+    result = db.session.execute(
+        update(model)
+        .where(model.id == row_id)
+        .values(like_count=model.like_count + like_delta,
+                dislike_count=model.dislike_count + dislike_delta)
+        .returning(model.like_count, model.dislike_count)
+        .execution_options(synchronize_session='fetch')
+    ).first()
+    return (result.like_count, result.dislike_count) if result else (0, 0)
+
+def apply_post_vote(post_id, old_vote, new_vote):
+    """Adjust a post's counters for a vote change and return the new (likes, dislikes)"""
+    return _apply_vote(Post, post_id, old_vote, new_vote)
+
+def apply_comment_vote(comment_id, old_vote, new_vote):
+    """Adjust a comment's counters for a vote change and return the new (likes, dislikes)"""
+    return _apply_vote(Comment, comment_id, old_vote, new_vote)
+
+def adjust_comment_count(post_id, delta):
+    """Add delta to a post's comment counter"""
+    # Comments are part of the cached post card, so move the post to a new version too
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(comment_count=Post.comment_count + delta, version=Post.version + 1)
+        .execution_options(synchronize_session='fetch')
+    )
+
+def _vote_count(like_model, fk_column, owner_id_column, vote_type):
+    return select(func.count(like_model.id)).where(
+        fk_column == owner_id_column, like_model.vote_type == vote_type
+    ).scalar_subquery()
+
+def reconcile_posts(post_ids=None):
+    """
+    Recompute post counters from post_likes and comments
+
+    Args:
+        post_ids: Only reconcile these posts (default: all posts)
+
+    Returns:
+        Number of posts whose counters were wrong and have been fixed
+    """
+    likes = _vote_count(PostLike, PostLike.post_id, Post.id, 1)
+    dislikes = _vote_count(PostLike, PostLike.post_id, Post.id, -1)
+    comments = select(func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery()
+
+    condition = or_(Post.like_count != likes, Post.dislike_count != dislikes, Post.comment_count != comments)
+    if post_ids is not None:
+        if not post_ids:
+            return 0
+        condition = and_(Post.id.in_(post_ids), condition)
+
+    result = db.session.execute(
+        update(Post)
+        .where(condition)
+        .values(like_count=likes, dislike_count=dislikes, comment_count=comments,
+                version=Post.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def reconcile_comments(comment_ids=None):
+    """
+    Recompute comment counters from comment_likes
+
+    Args:
+        comment_ids: Only reconcile these comments (default: all comments)
+
+    Returns:
+        Number of comments whose counters were wrong and have been fixed
+    """
+    likes = _vote_count(CommentLike, CommentLike.comment_id, Comment.id, 1)
+    dislikes = _vote_count(CommentLike, CommentLike.comment_id, Comment.id, -1)
+
+    condition = or_(Comment.like_count != likes, Comment.dislike_count != dislikes)
+    if comment_ids is not None:
+        if not comment_ids:
+            return 0
+        condition = and_(Comment.id.in_(comment_ids), condition)
+
+    result = db.session.execute(
+        update(Comment)
+        .where(condition)
+        .values(like_count=likes, dislike_count=dislikes)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
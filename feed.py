@@ -0,0 +1,146 @@
+"""
+Feed assembly helpers for the posts page
+
+Loads the per-post extras (the viewer's vote and the comment preview) for a
+whole page of posts in a fixed number of queries instead of several queries
+per post. Vote and comment totals are read from the counter columns kept
+up to date by counters.py.
+"""
+
+from datetime import datetime
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, User, Post, Comment, PostLike
+import fragment_cache
+
+# Number of comments shown under each post in the feed
+PREVIEW_COMMENTS = 3
+
+def feed_posts_query(author_ids):
+    """Query for posts by the given authors, newest first, with authors and profiles eager-loaded"""
+    return Post.query.options(
+        joinedload(Post.author).joinedload(User.profile)
+    ).filter(
+        Post.author_id.in_(author_ids)
+    ).order_by(Post.created_at.desc(), Post.id.desc())
+
+def encode_cursor(post):
+    """Encode the (created_at, id) keyset position of a post as an opaque cursor string"""
+    return f"{post.created_at.isoformat()}_{post.id}"
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, returning (created_at, id) or None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        created_at, post_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except ValueError:
+        return None
+
+def paginate_posts(query, before=None, page_size=20, order_columns=None):
+    """
+    Return one page of a newest-first post query using keyset pagination
+
+    Args:
+        query: Post query ordered by (created_at desc, id desc)
+        before: Cursor of the last post on the previous page, or None for the first page
+        page_size: Number of posts per page
+        order_columns: The (created_at, post id) columns the query is ordered by,
+            defaults to (Post.created_at, Post.id)
+
+    Returns:
+        (posts, next_cursor) where next_cursor is None on the last page
+    """
+    created_col, id_col = order_columns or (Post.created_at, Post.id)
+
+    position = decode_cursor(before)
+    if position:
+        created_at, post_id = position
+        # A row-value comparison is the start of the index range scan; the
+        # equivalent OR would be a filter over every newer row
+        query = query.filter(tuple_(created_col, id_col) < (created_at, post_id))
+
+    # Fetch one extra row to know whether another page exists
+    posts = query.limit(page_size + 1).all()
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        return posts, encode_cursor(posts[-1])
+    return posts, None
+
+def get_user_votes(post_ids, user_id):
+    """Return {post_id: vote_type} for the votes user_id cast on the given posts"""
+    rows = db.session.query(PostLike.post_id, PostLike.vote_type).filter(
+        PostLike.user_id == user_id,
+        PostLike.post_id.in_(post_ids)
+    ).all()
+
+    return dict(rows)
+
+def get_comment_previews(post_ids, limit=PREVIEW_COMMENTS):
+    """Return {post_id: [Comment, ...]} with the first `limit` comments of each post"""
+    ranked = db.session.query(
+        Comment.id.label('comment_id'),
+        func.row_number().over(
+            partition_by=Comment.post_id,
+            order_by=(Comment.created_at.asc(), Comment.id.asc())
+        ).label('position')
+    ).filter(
+        Comment.post_id.in_(post_ids)
+    ).subquery()
+
+    comments = Comment.query.options(
+        joinedload(Comment.author)
+    ).join(
+        ranked, ranked.c.comment_id == Comment.id
+    ).filter(
+        ranked.c.position <= limit
+    ).order_by(Comment.post_id, ranked.c.position).all()
+
+    previews = {}
+    for comment in comments:
+        previews.setdefault(comment.post_id, []).append(comment)
+    return previews
+
+def build_posts_data(posts, viewer_id):
+    """
+    Build the `posts_data` list rendered by posts.html
+
+    Args:
+        posts: List of Post objects, already in display order
+        viewer_id: ID of the user viewing the feed
+
+    Returns:
+        A list of dicts with the post, its author, vote totals, the viewer's
+        vote, the comment count, and either the cached comment preview
+        fragment (comments_html) or the first few comments to render it from
+    """
+    if not posts:
+        return []
+
+    post_ids = [post.id for post in posts]
+    user_votes = get_user_votes(post_ids, viewer_id)
+    # Comments are only loaded for the cards whose preview fragment is not cached
+    comments_html = fragment_cache.cached_fragments('post_card_comments.html', posts)
+    uncached_ids = [post_id for post_id in post_ids if post_id not in comments_html]
+    previews = get_comment_previews(uncached_ids) if uncached_ids else {}
+
+    posts_data = []
+    for post in posts:
+        posts_data.append({
+            'post': post,
+            'author': post.author,
+            'likes': post.like_count,
+            'dislikes': post.dislike_count,
+            'user_vote_type': user_votes.get(post.id, 0),
+            'comments_count': post.comment_count,
+            'comments_html': comments_html.get(post.id),
+            'recent_comments': previews.get(post.id, [])
+        })
+
+    return posts_data
+
+def load_feed_page(viewer_id, query, before=None, page_size=20, order_columns=None):
+    """Load one page of a post query as (posts_data, next_cursor)"""
+    posts, next_cursor = paginate_posts(query, before, page_size, order_columns)
+    return build_posts_data(posts, viewer_id), next_cursor
@@ -0,0 +1,107 @@
+"""
+Versioned fragment cache for rendered post cards
+
+The shared parts of a post card (author header, content, comment preview)
+are rendered once per post version and reused for every viewer. Cache keys
+combine the post id, Post.version and the author's profile update time, so
+bumping the version on a change is all the invalidation needed; stale
+entries simply age out of the backend. Renaming a user bumps the version of
+every post they wrote or commented on, since their name is in the cached
+header and comment preview. Viewer-specific markup (vote state, the delete
+menu) is rendered outside the cached fragments.
+"""
+
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import update, select, event, inspect, or_
+from sqlalchemy.orm import Session
+from cache_backends import create_cache
+from models import db, User, Post, Comment
+
+def init_app(app):
+    """Create the configured cache backend and expose post_fragment() to templates"""
+    backend = app.config.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    if backend == 'none':
+        cache = None
+    else:
+        cache = create_cache(
+            backend,
+            max_bytes=app.config.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+            directory=app.config.get('FRAGMENT_CACHE_DIR')
+        )
+    app.extensions['fragment_cache'] = cache
+    app.jinja_env.globals['post_fragment'] = post_fragment
+
+def get_cache():
+    return current_app.extensions.get('fragment_cache')
+
+def fragment_key(template, post):
+    """Cache key for a fragment of a post at its current version"""
+    profile = post.author.profile if post.author else None
+    author_stamp = int(profile.updated_at.timestamp()) if profile and profile.updated_at else 0
+    return f"fragment:{template}:{post.id}:v{post.version}:a{author_stamp}"
+
+def cached_fragments(template, posts):
+    """
+    Look up a fragment of several posts before rendering them
+
+    Lets callers skip loading what the template needs (e.g. the comment
+    preview) for the posts whose fragment is already cached.
+
+    Returns:
+        {post_id: html} for the posts whose fragment is cached
+    """
+    cache = get_cache()
+    if cache is None:
+        return {}
+    found = {}
+    for post in posts:
+        html = cache.get(fragment_key(template, post))
+        if html is not None:
+            found[post.id] = Markup(html)
+    return found
+
+def post_fragment(template, post, **context):
+    """Render a post fragment template, reusing the cached HTML for this post version"""
+    cache = get_cache()
+    if cache is None:
+        return Markup(render_template(template, post=post, **context))
+
+    key = fragment_key(template, post)
+    html = cache.get(key)
+    if html is None:
+        html = render_template(template, post=post, **context)
+        cache.set(key, html)
+    return Markup(html)
+
+def bump_version(post_id):
+    """Invalidate every cached fragment of a post by moving it to a new version"""
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(version=Post.version + 1)
+        .execution_options(synchronize_session='fetch')
+    )
+
+@event.listens_for(Session, 'before_flush')
+def _bump_renamed_users_posts(session, flush_context, instances):
+    renamed = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and obj.id is not None and inspect(obj).attrs.name.history.has_changes()
+    ]
+    if renamed:
+        session.execute(
+            update(Post)
+            .where(or_(Post.author_id.in_(renamed),
+                       Post.id.in_(select(Comment.post_id).where(Comment.author_id.in_(renamed)))))
+            .values(version=Post.version + 1)
+            .execution_options(synchronize_session='fetch')
+        )
+
+def forget_post(post, templates):
+    """Drop a post's current fragments from the cache (e.g. when the post is deleted)"""
+    cache = get_cache()
+    if cache is None:
+        return
+    for template in templates:
+        cache.delete(fragment_key(template, post))
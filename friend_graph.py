@@ -0,0 +1,129 @@
+"""
+Friend graph service
+
+Every user's set of friend IDs is loaded once (a UNION ALL over both
+directions of `friendships`) and kept in a bounded cache shared across
+requests, so are_friends() is a set lookup and friend lists need no
+Friendship query. Code that creates or deletes friendships calls
+invalidate() with both user IDs; the entries are dropped immediately and
+again after the transaction commits, so a request that reloads the set in
+between cannot keep the pre-commit graph cached.
+
+The 'memory' backend is per worker process. With the postgres realtime
+broker, invalidate() also broadcasts the user IDs over LISTEN/NOTIFY in
+the same transaction and every worker drops them from its own cache when
+it commits; FRIEND_GRAPH_CACHE_TTL only bounds what a lost notification
+(or a worker that reloaded a set just before the commit) can leave
+behind. Without it (SQLite, REALTIME_BACKEND=memory) run a single
+worker, or use the 'filesystem' backend to share the cache across the
+workers on one host.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, union_all
+from sqlalchemy.orm import Session, joinedload
+from cache_backends import create_cache
+from models import db, User, Friendship
+import realtime
+
+# Broadcast topic of invalidated user IDs
+TOPIC = 'friend_graph'
+
+def init_app(app):
+    """Create the configured cache backend; call after realtime.init_app"""
+    backend = app.config.get('FRIEND_GRAPH_CACHE_BACKEND', 'memory')
+    if backend == 'none':
+        cache = None
+    else:
+        cache = create_cache(
+            backend,
+            max_bytes=app.config.get('FRIEND_GRAPH_CACHE_MAX_BYTES', 8 * 1024 * 1024),
+            directory=app.config.get('FRIEND_GRAPH_CACHE_DIR'),
+            default_ttl=app.config.get('FRIEND_GRAPH_CACHE_TTL', 300)
+        )
+    app.extensions['friend_graph'] = cache
+
+    broker = app.extensions.get('realtime')
+    if cache is not None and broker is not None and broker.transactional:
+        broker.add_handler(TOPIC, lambda user_ids: _drop(cache, user_ids))
+
+def _drop(cache, user_ids):
+    """Drop cached friend sets; None (broadcasts may have been missed) drops them all"""
+    if user_ids is None:
+        cache.clear()
+        return
+    for user_id in user_ids:
+        cache.delete(_key(user_id))
+
+def get_cache():
+    return current_app.extensions.get('friend_graph')
+
+def _key(user_id):
+    return f"friends:{user_id}"
+
+def _load_friend_ids(user_id):
+    rows = db.session.execute(union_all(
+        select(Friendship.user2_id).where(Friendship.user1_id == user_id),
+        select(Friendship.user1_id).where(Friendship.user2_id == user_id)
+    ))
+    return frozenset(row[0] for row in rows)
+
+def friend_ids(user_id):
+    """Return the frozenset of a user's friend IDs"""
+    cache = get_cache()
+    if cache is None:
+        return _load_friend_ids(user_id)
+
+    broker = realtime.get_broker()
+    if broker is not None and broker.transactional:
+        # Each forked worker needs its own listener to hear the others' invalidations
+        broker.listen()
+
+    ids = cache.get(_key(user_id))
+    if ids is None:
+        ids = _load_friend_ids(user_id)
+        cache.set(_key(user_id), ids)
+    return ids
+
+def friends_with_profiles(user_id):
+    """
+    Return a user's friends ordered by name, with their profiles loaded
+
+    Friendships are joined to users and profiles in a single query, so
+    templates can read friend.profile without a lazy load per friend.
+    """
+    friend_id_rows = union_all(
+        select(Friendship.user2_id.label('friend_id')).where(Friendship.user1_id == user_id),
+        select(Friendship.user1_id.label('friend_id')).where(Friendship.user2_id == user_id)
+    ).subquery()
+    return User.query.join(friend_id_rows, User.id == friend_id_rows.c.friend_id).options(
+        joinedload(User.profile)
+    ).order_by(User.name, User.id).all()
+
+def are_friends(user1_id, user2_id):
+    """Whether two users are friends"""
+    return user2_id in friend_ids(user1_id)
+
+def friend_count(user_id):
+    return len(friend_ids(user_id))
+
+def invalidate(*user_ids):
+    """Drop the cached friend sets of users whose friendships changed in this transaction"""
+    cache = get_cache()
+    if cache is None:
+        return
+    _drop(cache, user_ids)
+    db.session().info.setdefault('friend_graph_stale', set()).update(user_ids)
+    realtime.broadcast(TOPIC, sorted(set(user_ids)))
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    stale = session.info.pop('friend_graph_stale', None)
+    if stale and has_app_context():
+        cache = get_cache()
+        if cache is not None:
+            _drop(cache, stale)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('friend_graph_stale', None)
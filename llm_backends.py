@@ -0,0 +1,104 @@
+"""
+LLM backends used for the AI features
+
+OpenAIBackend talks to the OpenAI chat completions API through one
+long-lived, connection-pooled client per worker process. FakeLLMBackend
+returns canned, deterministic text after an optional delay so the AI
+pipeline can be exercised and benchmarked without network access.
+Backends are wrapped by llm_gateway.LLMGateway, which is what the rest of
+the app calls.
+"""
+
+import os
+import time
+import random
+import threading
+from collections import namedtuple
+
+# What a backend returns for one completion
+LLMResponse = namedtuple('LLMResponse', ['text', 'prompt_tokens', 'completion_tokens'])
+
+class OpenAIBackend:
+    """Chat completions through the OpenAI API with a pooled, per-process client"""
+
+    name = 'openai'
+
+    def __init__(self, api_key=None, max_retries=0, max_connections=20):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        # Gunicorn forks workers after import, so build the client (and its sockets) per process
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    import httpx
+                    import openai
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        max_retries=self.max_retries,
+                        http_client=httpx.Client(limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections
+                        ))
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def complete(self, messages, model, max_tokens, temperature, timeout=None):
+        response = self._get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout
+        )
+        usage = response.usage
+        return LLMResponse(
+            text=response.choices[0].message.content.strip(),
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0
+        )
+
+class FakeLLMBackend:
+    """Offline backend that echoes the prompt after a simulated latency"""
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def complete(self, messages, model, max_tokens, temperature, timeout=None):
+        with self._lock:
+            self.calls += 1
+            should_fail = self._random.random() < self.failure_rate
+
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError("Simulated LLM timeout")
+            time.sleep(self.latency)
+        if should_fail:
+            raise RuntimeError("Simulated LLM failure")
+
+        prompt = ' '.join(messages[-1]['content'].split())
+        text = f"[{model}] Swift says: {prompt[:max_tokens]}"
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+        return LLMResponse(text=text, prompt_tokens=prompt_tokens, completion_tokens=len(text.split()))
+
+def create_backend(name):
+    """Build a backend by name ('openai' or 'fake')"""
+    if name == 'fake':
+        return FakeLLMBackend(latency=float(os.getenv('FAKE_LLM_LATENCY', '0')))
+    if name == 'openai':
+        # LLMGateway retries within the call's deadline, so the client itself must not
+        return OpenAIBackend(max_connections=int(os.getenv('LLM_MAX_CONCURRENCY', '8')))
+    raise ValueError(f"Unknown LLM backend: {name}")
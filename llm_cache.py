@@ -0,0 +1,114 @@
+"""
+Content-addressed cache for LLM responses
+
+Responses are stored in the llm_cache table under a sha256 of the model,
+messages, max_tokens and temperature, so identical prompts (reposted or
+templated content) are answered without an upstream call. Entries expire
+after a TTL and the table is trimmed to a maximum size by evicting the
+least recently used rows. The cache uses the caller's database session, so
+it only works inside an app context.
+"""
+
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from models import db, LLMCacheEntry
+from sql_helpers import dialect_insert
+
+class LLMResponseCache:
+    """LLM response cache stored in the database"""
+
+    def __init__(self, ttl=7 * 24 * 3600, max_entries=50000, prune_every=200):
+        self.ttl = timedelta(seconds=ttl)
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(messages, model, max_tokens, temperature):
+        """Hash everything that determines the response"""
+        material = json.dumps({
+            'model': model,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature
+        }, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response text for key, or None"""
+        now = datetime.utcnow()
+        entry = LLMCacheEntry.query.filter(
+            LLMCacheEntry.key == key,
+            LLMCacheEntry.expires_at > now
+        ).first()
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        entry.hits += 1
+        entry.last_used_at = now
+        return entry.response
+
+    def put(self, key, call_site, model, response):
+        """Store a response, replacing an expired (or concurrently written) entry for the same key"""
+        now = datetime.utcnow()
+        stmt = dialect_insert(LLMCacheEntry).values(
+            key=key,
+            call_site=call_site,
+            model=model,
+            response=response,
+            hits=0,
+            created_at=now,
+            last_used_at=now,
+            expires_at=now + self.ttl
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={
+                'response': stmt.excluded.response,
+                'hits': 0,
+                'created_at': stmt.excluded.created_at,
+                'last_used_at': stmt.excluded.last_used_at,
+                'expires_at': stmt.excluded.expires_at
+            }
+        ))
+
+        with self._lock:
+            self.stores += 1
+            should_prune = self.stores % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries, then the least recently used ones beyond max_entries"""
+        LLMCacheEntry.query.filter(
+            LLMCacheEntry.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+
+        excess = db.session.scalar(select(func.count()).select_from(LLMCacheEntry)) - self.max_entries
+        if excess > 0:
+            oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_at.asc()).limit(excess)
+            LLMCacheEntry.query.filter(
+                LLMCacheEntry.key.in_(oldest)
+            ).delete(synchronize_session=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'ttl_seconds': int(self.ttl.total_seconds()),
+                'max_entries': self.max_entries
+            }
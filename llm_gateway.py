@@ -0,0 +1,186 @@
+"""
+Single entry point for all LLM calls
+
+Every route and background job calls get_gateway().complete(...) instead of
+building its own OpenAI client. The gateway owns one backend per worker
+process, caps the number of in-flight upstream requests with a semaphore,
+enforces a deadline per call (including time spent waiting for a slot and
+between retries), retries failed requests while the deadline allows, and
+records call counts, errors, latency and token usage per call site.
+Deterministic prompts are answered from an optional llm_cache.LLMResponseCache
+first; call sites whose output should vary pass cache=False.
+"""
+
+import os
+import time
+import threading
+from flask import has_app_context
+from llm_backends import create_backend
+
+class LLMGatewayError(Exception):
+    """Raised when a call cannot be made or does not finish in time"""
+
+class LLMGateway:
+    """Concurrency-limited, instrumented wrapper around an LLM backend"""
+
+    def __init__(self, backend, max_concurrency=8, timeout=30.0, default_model=None, cache=None,
+                 max_retries=2, retry_backoff=0.5):
+        self.backend = backend
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.default_model = default_model or os.getenv('OPENAI_MODEL', 'gpt-4o')
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._in_flight = 0
+
+    def complete(self, messages, call_site, max_tokens, temperature, model=None, timeout=None, cache=True):
+        """
+        Run one chat completion and return its text
+
+        Args:
+            messages: Chat messages for the backend
+            call_site: Name used to group metrics (e.g. 'post_analysis')
+            max_tokens: Completion token limit
+            temperature: Sampling temperature
+            model: Model name (default OPENAI_MODEL)
+            timeout: Deadline in seconds for this call (default LLM_TIMEOUT)
+            cache: Look up and store the response in the response cache (if configured)
+
+        A failed request is retried up to max_retries times, after a backoff
+        of retry_backoff, 2 * retry_backoff, ... seconds, as long as the
+        backoff ends before the deadline. The slot is given back while
+        waiting, so retries do not hold up other calls.
+
+        Raises:
+            LLMGatewayError: No slot freed up before the deadline, or the backend
+                failed and there was no time or retry left
+        """
+        model = model or self.default_model
+
+        # The cache lives in the database, so it is only usable inside an app context
+        cache_key = None
+        if cache and self.cache is not None and has_app_context():
+            cache_key = self.cache.make_key(messages, model, max_tokens, temperature)
+            cached = self.cache.get(cache_key)
+            self._record_cache(call_site, hit=cached is not None)
+            if cached is not None:
+                return cached
+
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = self._attempt(messages, call_site, model, max_tokens, temperature, deadline)
+                break
+            except LLMGatewayError:
+                raise
+            except Exception as e:
+                backoff = self.retry_backoff * 2 ** attempt
+                if attempt >= self.max_retries or time.monotonic() + backoff >= deadline:
+                    self._record(call_site, time.monotonic() - started, error=True)
+                    raise LLMGatewayError(f"LLM call for {call_site} failed: {e}") from e
+                attempt += 1
+                with self._metrics_lock:
+                    self._stats(call_site)['retries'] += 1
+                time.sleep(backoff)
+
+        self._record(call_site, time.monotonic() - started,
+                     prompt_tokens=response.prompt_tokens, completion_tokens=response.completion_tokens)
+        if cache_key is not None:
+            self.cache.put(cache_key, call_site, model, response.text)
+        return response.text
+
+    def _attempt(self, messages, call_site, model, max_tokens, temperature, deadline):
+        # One backend request in a concurrency slot; backend exceptions propagate for retrying
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._record(call_site, 0.0, error=True, rejected=True)
+            raise LLMGatewayError(f"Too many concurrent LLM calls ({self.max_concurrency}) for {call_site}")
+
+        with self._metrics_lock:
+            self._in_flight += 1
+        try:
+            return self.backend.complete(
+                messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                timeout=max(deadline - time.monotonic(), 0.001)
+            )
+        finally:
+            with self._metrics_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _stats(self, call_site):
+        # Caller holds _metrics_lock
+        return self._metrics.setdefault(call_site, {
+            'calls': 0, 'errors': 0, 'rejected': 0, 'retries': 0,
+            'total_latency': 0.0, 'max_latency': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0,
+            'cache_hits': 0, 'cache_misses': 0
+        })
+
+    def _record_cache(self, call_site, hit):
+        with self._metrics_lock:
+            stats = self._stats(call_site)
+            stats['cache_hits' if hit else 'cache_misses'] += 1
+
+    def _record(self, call_site, latency, error=False, rejected=False, prompt_tokens=0, completion_tokens=0):
+        with self._metrics_lock:
+            stats = self._stats(call_site)
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['rejected'] += int(rejected)
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+
+    def metrics(self):
+        """Snapshot of per-call-site metrics for this worker process"""
+        with self._metrics_lock:
+            call_sites = {}
+            for call_site, stats in self._metrics.items():
+                call_sites[call_site] = dict(
+                    stats,
+                    avg_latency=stats['total_latency'] / stats['calls'] if stats['calls'] else 0.0
+                )
+            return {
+                'backend': getattr(self.backend, 'name', type(self.backend).__name__),
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'cache': self.cache.stats() if self.cache is not None else None,
+                'call_sites': call_sites
+            }
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway():
+    """Return the process-wide gateway, built from the LLM_* environment variables"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                cache = None
+                if os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true':
+                    from llm_cache import LLMResponseCache
+                    cache = LLMResponseCache(
+                        ttl=int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600))),
+                        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '50000'))
+                    )
+                _gateway = LLMGateway(
+                    create_backend(os.getenv('LLM_BACKEND', 'openai')),
+                    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '8')),
+                    timeout=float(os.getenv('LLM_TIMEOUT', '30')),
+                    max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+                    cache=cache
+                )
+    return _gateway
+
+def set_gateway(gateway):
+    """Replace the process-wide gateway (e.g. with one using a FakeLLMBackend in tests)"""
+    global _gateway
+    _gateway = gateway
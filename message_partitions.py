@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Monthly partitions of the messages table (PostgreSQL)
+
+Migration 0011 range-partitions `messages` by timestamp, one partition per
+month named messages_yYYYYmMM, with messages_legacy holding everything
+from before the migration and messages_default catching rows no monthly
+partition covers. This script keeps that layout up to date:
+
+    python message_partitions.py ensure [--months-ahead 2]
+        Create the partitions for this month and the next ones. Run daily.
+
+    python message_partitions.py archive --older-than-months 12 [--compact] [--dry-run]
+        Detach partitions whose month ended more than N months ago and move
+        them to the `archive` schema (they can then be dumped and dropped),
+        or with --compact keep them attached but rewrite them in
+        conversation order and freeze them.
+"""
+
+import os
+import re
+import sys
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db
+from sqlalchemy import text
+import messaging
+
+ARCHIVE_SCHEMA = 'archive'
+DETACH_LOCK_TIMEOUT = '5s'
+
+# Range column of each monthly-partitioned table (activity_partitions.py reuses these helpers)
+PARTITION_KEYS = {'messages': 'timestamp', 'activity_logs': 'created_at'}
+
+def month_start(year, month):
+    """First instant of a month, carrying month overflow into the year"""
+    year += (month - 1) // 12
+    return datetime(year, (month - 1) % 12 + 1, 1)
+
+def partition_name(start, table='messages'):
+    return f"{table}_y{start.year:04d}m{start.month:02d}"
+
+def list_partitions(table='messages'):
+    """
+    The partitions attached to a partitioned table
+
+    Returns:
+        List of (name, upper bound or None) ordered by upper bound; the default
+        partition's bound is None
+    """
+    rows = db.session.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = CAST(:table AS regclass)
+    """), {'table': table}).all()
+
+    partitions = []
+    for name, bound in rows:
+        upper = re.search(r"TO \('([^']+)'\)", bound)
+        partitions.append((name, datetime.fromisoformat(upper.group(1)) if upper else None))
+    return sorted(partitions, key=lambda partition: (partition[1] is None, partition[1] or datetime.min))
+
+def ensure_partitions(months_ahead=2, now=None, table='messages'):
+    """
+    Create the monthly partitions from the current month to months_ahead months ahead
+
+    Rows that already landed in the default partition for a new month are
+    moved into it in the same transaction.
+
+    Returns:
+        Names of the partitions created
+    """
+    now = now or datetime.utcnow()
+    key = PARTITION_KEYS[table]
+    partitions = list_partitions(table)
+    existing = {name for name, _ in partitions}
+    # Months before the migration are covered by the legacy partition
+    legacy_upper = dict(partitions).get(f'{table}_legacy') or datetime.min
+    created = []
+
+    for offset in range(months_ahead + 1):
+        start = month_start(now.year, now.month + offset)
+        end = month_start(now.year, now.month + offset + 1)
+        name = partition_name(start, table)
+        if name in existing or start < legacy_upper:
+            continue
+
+        params = {'start': start, 'end': end}
+        db.session.execute(text("""
+            CREATE TEMP TABLE moved_rows ON COMMIT DROP AS
+            WITH moved AS (
+                DELETE FROM {table}_default WHERE {key} >= :start AND {key} < :end RETURNING *
+            )
+            SELECT * FROM moved
+        """.format(table=table, key=key)), params)
+        db.session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        db.session.execute(text(f"INSERT INTO {table} SELECT * FROM moved_rows"))
+        db.session.execute(text("DROP TABLE moved_rows"))
+        created.append(name)
+
+    db.session.commit()
+    return created
+
+def cold_partitions(older_than_months, now=None, table='messages'):
+    """Attached partitions (excluding the default one) whose range ended more than N months ago"""
+    now = now or datetime.utcnow()
+    cutoff = month_start(now.year, now.month - older_than_months)
+    return [name for name, upper in list_partitions(table) if upper is not None and upper <= cutoff]
+
+def _autocommit():
+    # VACUUM cannot run inside a transaction block
+    return db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+def detach_partition(name):
+    """
+    Detach a partition and move it to the archive schema
+
+    DETACH ... CONCURRENTLY is not allowed while a default partition exists,
+    so the plain form is used under a short lock_timeout: it needs a brief
+    exclusive lock on messages, and gives up (to be retried on the next run)
+    rather than queueing writes behind a long-running query.
+    """
+    with _autocommit() as connection:
+        connection.execute(text(f"SET lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+        connection.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+        connection.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+
+def compact_partition(name):
+    """
+    Rewrite a cold partition in (sender_id, receiver_id, id) order and freeze it
+
+    Chat history reads of old conversations then hit consecutive pages, and
+    later vacuums have nothing left to do on it. CLUSTER locks only this
+    partition, which cold traffic barely touches.
+    """
+    with _autocommit() as connection:
+        index = connection.execute(text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_index x ON x.indexrelid = c.oid
+            WHERE i.inhparent = 'ix_messages_pair_id'::regclass AND x.indrelid = CAST(:name AS regclass)
+        """), {'name': name}).scalar()
+        connection.execute(text(f"CLUSTER {name} USING {index}"))
+        connection.execute(text(f"VACUUM (FREEZE, ANALYZE) {name}"))
+
+def archive(older_than_months, compact=False, dry_run=False):
+    """
+    Detach or compact the cold partitions
+
+    Returns:
+        Names of the partitions archived (or that would be, with dry_run)
+    """
+    names = cold_partitions(older_than_months)
+    db.session.commit()
+    if dry_run:
+        return names
+
+    for name in names:
+        if compact:
+            compact_partition(name)
+        else:
+            detach_partition(name)
+
+    if names and not compact:
+        # Unread messages in detached partitions no longer count
+        messaging.reconcile_unread_counts()
+        db.session.commit()
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    ensure_parser = commands.add_parser('ensure', help='create the upcoming monthly partitions')
+    ensure_parser.add_argument('--months-ahead', type=int, default=2)
+    archive_parser = commands.add_parser('archive', help='detach or compact cold partitions')
+    archive_parser.add_argument('--older-than-months', type=int, default=12)
+    archive_parser.add_argument('--compact', action='store_true', help='compact in place instead of detaching')
+    archive_parser.add_argument('--dry-run', action='store_true', help='only list the partitions')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("[FAILED] message_partitions.py needs a PostgreSQL DATABASE_URL")
+            return False
+        try:
+            if args.command == 'ensure':
+                created = ensure_partitions(args.months_ahead)
+                print(f"[SUCCESS] Created {len(created)} partitions: {', '.join(created) or 'none needed'}")
+            else:
+                names = archive(args.older_than_months, compact=args.compact, dry_run=args.dry_run)
+                action = 'Would archive' if args.dry_run else ('Compacted' if args.compact else 'Detached')
+                print(f"[SUCCESS] {action} {len(names)} partitions: {', '.join(names) or 'none'}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAILED] Error maintaining message partitions: {e}")
+            return False
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
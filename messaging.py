@@ -0,0 +1,358 @@
+"""
+Read state, unread counters and conversation summaries for direct messages
+
+Every message row carries is_read/read_at, and unread rows are covered by
+a partial index on (receiver_id, sender_id). Each user's total of unread
+messages is also kept in users.unread_message_count, adjusted in the same
+transaction as the send or the read, so the badge is a column read instead
+of a COUNT(*). reconcile_unread_counts() recomputes it from the messages
+table to repair any drift.
+
+The `conversations` table holds one row per pair of users with the last
+message and each side's unread count. It is upserted with every message,
+so the inbox is a read of that table rather than a scan of `messages`.
+
+On PostgreSQL `messages` is range-partitioned by month on timestamp
+(message_partitions.py); the chat queries add timestamp bounds so only the
+partitions that can hold the page are scanned.
+
+Message contents are searchable through a GIN index on
+to_tsvector('english', content) (PostgreSQL only).
+"""
+
+from datetime import datetime, timedelta
+from markupsafe import Markup, escape
+from sqlalchemy import update, select, func, case, union_all, or_, literal_column
+from sqlalchemy.orm import joinedload
+from models import db, User, Message, Conversation
+from sql_helpers import dialect_insert
+
+SNIPPET_LENGTH = 100
+
+# messages is range-partitioned by timestamp on PostgreSQL (message_partitions.py), so
+# chat queries carry timestamp bounds. Ids and timestamps both grow in insert order but
+# concurrent senders can interleave them by a moment, so bounds taken from an id
+# cursor are widened by CURSOR_CLOCK_SKEW
+CURSOR_CLOCK_SKEW = timedelta(minutes=5)
+# How far back the newest page of a chat is looked for before searching all history
+RECENT_WINDOW = timedelta(days=31)
+
+# Text search configuration; must match the expression of ix_messages_content_search
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+def conversation_pair(user_a_id, user_b_id):
+    """Normalized (low, high) key of the conversation between two users"""
+    return min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+
+def _adjust_unread(user_id, delta):
+    """Add delta to a user's unread counter (never below zero) and return the new value"""
+    new_count = User.unread_message_count + delta
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(unread_message_count=case((new_count < 0, 0), else_=new_count))
+        .returning(User.unread_message_count)
+        .execution_options(synchronize_session='fetch')
+    ).first()
+    return result.unread_message_count if result else 0
+
+def _upsert_conversation(message):
+    low_id, high_id = conversation_pair(message.sender_id, message.receiver_id)
+    unread_low = int(message.receiver_id == low_id)
+    insert = dialect_insert(Conversation).values(
+        user_low_id=low_id,
+        user_high_id=high_id,
+        last_message_id=message.id,
+        last_sender_id=message.sender_id,
+        last_message_snippet=message.content[:SNIPPET_LENGTH],
+        last_message_at=message.timestamp,
+        unread_low=unread_low,
+        unread_high=1 - unread_low
+    )
+    # Two senders in one chat can commit out of id order; only a newer message
+    # replaces the summary, while every message still counts as unread
+    is_newer = insert.excluded.last_message_id > Conversation.last_message_id
+
+    def latest(column):
+        return case((is_newer, insert.excluded[column]), else_=getattr(Conversation, column))
+
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['user_low_id', 'user_high_id'],
+        set_={
+            'last_message_id': latest('last_message_id'),
+            'last_sender_id': latest('last_sender_id'),
+            'last_message_snippet': latest('last_message_snippet'),
+            'last_message_at': latest('last_message_at'),
+            'unread_low': Conversation.unread_low + insert.excluded.unread_low,
+            'unread_high': Conversation.unread_high + insert.excluded.unread_high
+        }
+    ))
+
+def record_message_sent(message):
+    """
+    Update the conversation summary and the receiver's unread counter for a flushed message
+
+    Returns:
+        The receiver's new unread total
+    """
+    _upsert_conversation(message)
+    return _adjust_unread(message.receiver_id, 1)
+
+def mark_conversation_read(reader_id, other_user_id):
+    """
+    Mark every unread message from other_user_id to reader_id as read
+
+    Returns:
+        (messages marked read, the reader's new unread total or None if nothing changed)
+    """
+    marked = db.session.execute(
+        update(Message)
+        .where(Message.receiver_id == reader_id,
+               Message.sender_id == other_user_id,
+               ~Message.is_read)
+        .values(is_read=True, read_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not marked:
+        return 0, None
+
+    low_id, high_id = conversation_pair(reader_id, other_user_id)
+    unread_column = 'unread_low' if reader_id == low_id else 'unread_high'
+    db.session.execute(
+        update(Conversation)
+        .where(Conversation.user_low_id == low_id, Conversation.user_high_id == high_id)
+        .values({unread_column: 0})
+        .execution_options(synchronize_session=False)
+    )
+    return marked, _adjust_unread(reader_id, -marked)
+
+def inbox(user_id, limit=50, before_message_id=None):
+    """
+    A user's conversations, most recently active first
+
+    Each side of the normalized pair is read with its own index range scan
+    (user_low_id or user_high_id, ordered by last_message_id) and the two
+    are merged, so the cost depends on `limit`, not on how many
+    conversations the user has.
+
+    Args:
+        user_id: Inbox owner
+        limit: Number of conversations to return
+        before_message_id: Keyset cursor; only conversations whose last message is older
+
+    Returns:
+        (list of dicts with user, snippet, last_sender_id, last_message_at, unread; next cursor or None)
+    """
+    def side(own_column, other_column, unread_column):
+        query = select(
+            other_column.label('other_id'),
+            Conversation.last_message_id,
+            Conversation.last_sender_id,
+            Conversation.last_message_snippet,
+            Conversation.last_message_at,
+            unread_column.label('unread')
+        ).where(own_column == user_id)
+        if before_message_id is not None:
+            query = query.where(Conversation.last_message_id < before_message_id)
+        return query.order_by(Conversation.last_message_id.desc()).limit(limit + 1).subquery()
+
+    low_side = side(Conversation.user_low_id, Conversation.user_high_id, Conversation.unread_low)
+    high_side = side(Conversation.user_high_id, Conversation.user_low_id, Conversation.unread_high)
+    merged = union_all(select(low_side), select(high_side)).subquery()
+
+    rows = db.session.execute(
+        select(User, merged)
+        .join(User, User.id == merged.c.other_id)
+        .options(joinedload(User.profile))
+        .order_by(merged.c.last_message_id.desc())
+        .limit(limit + 1)
+    ).all()
+
+    next_cursor = rows[limit - 1].last_message_id if len(rows) > limit else None
+    conversations = [{
+        'user': row.User,
+        'snippet': row.last_message_snippet,
+        'last_sender_id': row.last_sender_id,
+        'last_message_at': row.last_message_at,
+        'unread': row.unread
+    } for row in rows[:limit]]
+    return conversations, next_cursor
+
+def _message_time(message_id):
+    """
+    Timestamp of a message, to turn an id cursor into a time bound
+
+    On the partitioned table this is one primary-key probe per partition;
+    the bound it yields lets the page query itself skip partitions.
+    """
+    return db.session.scalar(select(Message.timestamp).where(Message.id == message_id))
+
+def _pair_messages(user_id, other_user_id, limit, newest_first, before_id=None, after_id=None,
+                   since=None, until=None):
+    """
+    Messages between two users in id order: one range scan of
+    ix_messages_pair_id per direction merged with UNION ALL
+
+    since/until bound the timestamp so only the partitions covering that
+    range are scanned.
+    """
+    bounds = []
+    if since is not None:
+        bounds.append(Message.timestamp >= since)
+    if until is not None:
+        bounds.append(Message.timestamp <= until)
+
+    def direction(sender_id, receiver_id):
+        query = select(Message.id).where(Message.sender_id == sender_id, Message.receiver_id == receiver_id, *bounds)
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        if after_id is not None:
+            query = query.where(Message.id > after_id)
+        query = query.order_by(Message.id.desc() if newest_first else Message.id.asc())
+        return select(query.limit(limit).subquery())
+
+    ids = union_all(direction(user_id, other_user_id), direction(other_user_id, user_id)).subquery()
+    return Message.query.filter(Message.id.in_(select(ids.c.id)), *bounds).order_by(
+        Message.id.desc() if newest_first else Message.id.asc()).limit(limit).all()
+
+def recent_messages(user_id, other_user_id, limit, before_id=None):
+    """
+    The newest `limit` messages between two users (older than before_id if given)
+
+    The page is first looked for in the RECENT_WINDOW before the cursor, which
+    touches only the newest partition or two; only when that window doesn't
+    fill the page is the history below the window searched for the rest.
+
+    Returns:
+        (messages oldest first, whether older messages exist)
+    """
+    until = None
+    if before_id is not None:
+        before_time = _message_time(before_id)
+        until = before_time + CURSOR_CLOCK_SKEW if before_time else None
+
+    since = (until or datetime.utcnow()) - RECENT_WINDOW
+    messages = _pair_messages(user_id, other_user_id, limit + 1, newest_first=True,
+                              before_id=before_id, since=since, until=until)
+    if len(messages) <= limit:
+        # A sparse chat: search the older partitions only, not the window again
+        seen = {message.id for message in messages}
+        older = _pair_messages(user_id, other_user_id, limit + 1, newest_first=True,
+                               before_id=before_id, until=since)
+        messages = sorted(messages + [message for message in older if message.id not in seen],
+                          key=lambda message: message.id, reverse=True)[:limit + 1]
+
+    has_more = len(messages) > limit
+    return list(reversed(messages[:limit])), has_more
+
+def messages_after(user_id, other_user_id, after_id, limit=200, after_time=None):
+    """
+    Messages between two users newer than after_id, oldest first
+
+    Args:
+        after_time: Timestamp of message after_id as the caller already has
+            it (the poll's last message); bounds the query to the partitions
+            from then on. The id is not looked up: polls are the hottest path
+    """
+    since = after_time - CURSOR_CLOCK_SKEW if after_id and after_time else None
+    return _pair_messages(user_id, other_user_id, limit, newest_first=False, after_id=after_id, since=since)
+
+def last_message_id(user_id, other_user_id):
+    """Id of the newest message between two users, read from the conversations table (0 if none)"""
+    low_id, high_id = conversation_pair(user_id, other_user_id)
+    return db.session.scalar(
+        select(Conversation.last_message_id)
+        .where(Conversation.user_low_id == low_id, Conversation.user_high_id == high_id)
+    ) or 0
+
+def _highlighted(headline):
+    """Escape a ts_headline() fragment, keeping only its <b> match markers as HTML"""
+    return Markup(str(escape(headline)).replace('&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>'))
+
+def search_messages(user_id, query, page=1, per_page=20):
+    """
+    Search the contents of the messages a user sent or received
+
+    On PostgreSQL the query is parsed with websearch_to_tsquery (quotes,
+    OR and -exclusions work) and matched through the GIN index on
+    to_tsvector(content); results are ranked with ts_rank_cd and the
+    highlighted fragment is only built for the rows of the page. Other
+    databases fall back to a case-insensitive substring match, newest first.
+
+    Args:
+        user_id: Searching user; only their own conversations are searched
+        query: Search terms as typed
+        page: 1-based page number
+        per_page: Results per page
+
+    Returns:
+        (list of dicts with message_id, user (the other participant), sender_id,
+        snippet, timestamp; whether another page exists)
+    """
+    other_id = case((Message.sender_id == user_id, Message.receiver_id), else_=Message.sender_id)
+    own = or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(func.to_tsvector(SEARCH_CONFIG, Message.content), tsquery)
+        matches = select(
+            Message.id, Message.sender_id, Message.content, Message.timestamp,
+            other_id.label('other_id'), rank.label('rank')
+        ).where(
+            own, func.to_tsvector(SEARCH_CONFIG, Message.content).op('@@')(tsquery)
+        ).order_by(rank.desc(), Message.id.desc())
+    else:
+        matches = select(
+            Message.id, Message.sender_id, Message.content, Message.timestamp,
+            other_id.label('other_id'), literal_column('0').label('rank')
+        ).where(own, Message.content.icontains(query, autoescape=True)).order_by(Message.id.desc())
+
+    page_rows = matches.limit(per_page + 1).offset((page - 1) * per_page).subquery()
+    if db.engine.dialect.name == 'postgresql':
+        snippet = func.ts_headline(SEARCH_CONFIG, page_rows.c.content, tsquery, 'MaxWords=25, MinWords=10')
+    else:
+        snippet = func.substr(page_rows.c.content, 1, SNIPPET_LENGTH)
+
+    rows = db.session.execute(
+        select(User, page_rows.c.id, page_rows.c.sender_id, page_rows.c.timestamp, snippet.label('snippet'))
+        .join(User, User.id == page_rows.c.other_id)
+        .options(joinedload(User.profile))
+        .order_by(page_rows.c.rank.desc(), page_rows.c.id.desc())
+    ).all()
+
+    results = [{
+        'message_id': row.id,
+        'user': row.User,
+        'sender_id': row.sender_id,
+        'snippet': _highlighted(row.snippet),
+        'timestamp': row.timestamp
+    } for row in rows[:per_page]]
+    return results, len(rows) > per_page
+
+def reconcile_unread_counts(user_ids=None):
+    """
+    Recompute unread counters from the messages table
+
+    Args:
+        user_ids: Only reconcile these users (default: all users)
+
+    Returns:
+        Number of users whose counter was wrong and has been fixed
+    """
+    unread = select(func.count(Message.id)).where(
+        Message.receiver_id == User.id, ~Message.is_read
+    ).scalar_subquery()
+
+    condition = User.unread_message_count != unread
+    if user_ids is not None:
+        if not user_ids:
+            return 0
+        condition = User.id.in_(user_ids) & condition
+
+    result = db.session.execute(
+        update(User)
+        .where(condition)
+        .values(unread_message_count=unread)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,147 @@
+"""Baseline schema
+
+The tables as they were created by create_all_tables.py and the other
+create_*.py scripts. Every table is created with IF NOT EXISTS, so running
+this on a database those scripts already built is a no-op.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('email', sa.String(120), nullable=False, unique=True),
+        sa.Column('password_hash', sa.String(255), nullable=False),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('username', sa.String(50), nullable=False, unique=True),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('is_admin', sa.Boolean),
+        sa.Column('role', sa.String(20)),
+        if_not_exists=True
+    )
+    op.create_table(
+        'profiles',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False, unique=True),
+        sa.Column('phone', sa.String(20)),
+        sa.Column('education', sa.String(100)),
+        sa.Column('work', sa.String(100)),
+        sa.Column('website', sa.String(200)),
+        sa.Column('github', sa.String(100)),
+        sa.Column('linkedin', sa.String(100)),
+        sa.Column('profile_picture', sa.String(500)),
+        sa.Column('secret_key', sa.String(64), nullable=False, unique=True),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_table(
+        'friend_requests',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('sender_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('receiver_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('status', sa.String(20)),
+        sa.Column('created_at', sa.DateTime),
+        sa.UniqueConstraint('sender_id', 'receiver_id'),
+        if_not_exists=True
+    )
+    op.create_table(
+        'friendships',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user1_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('user2_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('created_at', sa.DateTime),
+        sa.UniqueConstraint('user1_id', 'user2_id'),
+        if_not_exists=True
+    )
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('sender_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('receiver_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('content', sa.Text, nullable=False),
+        sa.Column('timestamp', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_table(
+        'posts',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('author_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('content', sa.Text, nullable=False),
+        sa.Column('category', sa.String(20), nullable=False),
+        sa.Column('ai_comment', sa.Text),
+        sa.Column('ai_analysis', sa.Text),
+        sa.Column('is_ai_generated', sa.Boolean),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_table(
+        'comments',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('author_id', sa.Integer, sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('content', sa.Text, nullable=False),
+        sa.Column('is_ai_comment', sa.Boolean),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_table(
+        'post_likes',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id'), nullable=False),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('vote_type', sa.Integer),
+        sa.Column('created_at', sa.DateTime),
+        sa.UniqueConstraint('post_id', 'user_id'),
+        if_not_exists=True
+    )
+    op.create_table(
+        'comment_likes',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('comment_id', sa.Integer, sa.ForeignKey('comments.id'), nullable=False),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('vote_type', sa.Integer),
+        sa.Column('created_at', sa.DateTime),
+        sa.UniqueConstraint('comment_id', 'user_id'),
+        if_not_exists=True
+    )
+    op.create_table(
+        'chat_history',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('session_id', sa.String(100), nullable=False),
+        sa.Column('user_message', sa.Text, nullable=False),
+        sa.Column('ai_response', sa.Text, nullable=False),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('chroma_id', sa.String(100)),
+        if_not_exists=True
+    )
+    op.create_table(
+        'activity_logs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('activity_type', sa.String(50), nullable=False),
+        sa.Column('description', sa.Text, nullable=False),
+        sa.Column('target_user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('activity_data', sa.JSON),
+        sa.Column('created_at', sa.DateTime),
+        if_not_exists=True
+    )
+
+def downgrade():
+    for table in ['activity_logs', 'chat_history', 'comment_likes', 'post_likes', 'comments',
+                  'posts', 'messages', 'friendships', 'friend_requests', 'profiles', 'users']:
+        op.drop_table(table, if_exists=True)
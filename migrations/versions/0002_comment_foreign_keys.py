@@ -0,0 +1,44 @@
+"""Comment foreign keys cascade and AI comments without an author
+
+Replaces migrate_db.py and update_comment_table.py: comments are deleted
+with their post, and author_id is nullable (SET NULL when the author goes)
+so Swift's comments can be stored.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE comments
+        DROP CONSTRAINT IF EXISTS comments_post_id_fkey,
+        DROP CONSTRAINT IF EXISTS comments_author_id_fkey,
+        ALTER COLUMN author_id DROP NOT NULL
+    """)
+    op.execute("""
+        ALTER TABLE comments
+        ADD CONSTRAINT comments_post_id_fkey
+            FOREIGN KEY (post_id) REFERENCES posts (id) ON DELETE CASCADE,
+        ADD CONSTRAINT comments_author_id_fkey
+            FOREIGN KEY (author_id) REFERENCES users (id) ON DELETE SET NULL
+    """)
+
+def downgrade():
+    op.execute("""
+        ALTER TABLE comments
+        DROP CONSTRAINT IF EXISTS comments_post_id_fkey,
+        DROP CONSTRAINT IF EXISTS comments_author_id_fkey
+    """)
+    op.execute("""
+        ALTER TABLE comments
+        ADD CONSTRAINT comments_post_id_fkey FOREIGN KEY (post_id) REFERENCES posts (id),
+        ADD CONSTRAINT comments_author_id_fkey FOREIGN KEY (author_id) REFERENCES users (id)
+    """)
@@ -0,0 +1,46 @@
+"""Denormalized vote and comment counters
+
+Replaces add_counter_columns.py: like/dislike/comment counters and the
+fragment cache version on posts, like/dislike counters on comments, filled
+from the existing rows.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+def _counter(name, default='0'):
+    return sa.Column(name, sa.Integer, nullable=False, server_default=default)
+
+def upgrade():
+    for column in ['like_count', 'dislike_count', 'comment_count']:
+        op.add_column('posts', _counter(column), if_not_exists=True)
+    op.add_column('posts', _counter('version', default='1'), if_not_exists=True)
+    for column in ['like_count', 'dislike_count']:
+        op.add_column('comments', _counter(column), if_not_exists=True)
+
+    op.execute("""
+        UPDATE posts SET
+            like_count = (SELECT COUNT(*) FROM post_likes WHERE post_id = posts.id AND vote_type = 1),
+            dislike_count = (SELECT COUNT(*) FROM post_likes WHERE post_id = posts.id AND vote_type = -1),
+            comment_count = (SELECT COUNT(*) FROM comments WHERE post_id = posts.id)
+    """)
+    op.execute("""
+        UPDATE comments SET
+            like_count = (SELECT COUNT(*) FROM comment_likes WHERE comment_id = comments.id AND vote_type = 1),
+            dislike_count = (SELECT COUNT(*) FROM comment_likes WHERE comment_id = comments.id AND vote_type = -1)
+    """)
+
+def downgrade():
+    for column in ['like_count', 'dislike_count']:
+        op.drop_column('comments', column, if_exists=True)
+    for column in ['like_count', 'dislike_count', 'comment_count', 'version']:
+        op.drop_column('posts', column, if_exists=True)
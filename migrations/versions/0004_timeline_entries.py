@@ -0,0 +1,33 @@
+"""Materialized home timelines
+
+Table used when FEED_FANOUT=write; fill it with backfill_timelines.py
+before switching the setting on.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'timeline_entries',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('author_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        if_not_exists=True
+    )
+    op.create_index('ix_timeline_entries_user_created', 'timeline_entries',
+                    ['user_id', 'created_at', 'post_id'], if_not_exists=True)
+    op.create_index('ix_timeline_entries_author_id', 'timeline_entries', ['author_id'], if_not_exists=True)
+
+def downgrade():
+    op.drop_table('timeline_entries', if_exists=True)
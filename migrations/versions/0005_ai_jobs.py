@@ -0,0 +1,40 @@
+"""Background AI job queue
+
+Replaces create_ai_jobs_table.py: the ai_jobs table and posts.ai_status.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('posts', sa.Column('ai_status', sa.String(20)), if_not_exists=True)
+    op.create_table(
+        'ai_jobs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('kind', sa.String(50), nullable=False),
+        sa.Column('payload', sa.JSON),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('attempts', sa.Integer, nullable=False),
+        sa.Column('max_attempts', sa.Integer, nullable=False),
+        sa.Column('run_after', sa.DateTime, nullable=False),
+        sa.Column('locked_at', sa.DateTime),
+        sa.Column('last_error', sa.Text),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_index('ix_ai_jobs_status_run_after', 'ai_jobs', ['status', 'run_after'], if_not_exists=True)
+
+def downgrade():
+    op.drop_table('ai_jobs', if_exists=True)
+    op.drop_column('posts', 'ai_status', if_exists=True)
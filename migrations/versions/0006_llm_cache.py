@@ -0,0 +1,35 @@
+"""LLM response cache
+
+Replaces create_llm_cache_table.py.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'llm_cache',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('call_site', sa.String(50), nullable=False),
+        sa.Column('model', sa.String(100), nullable=False),
+        sa.Column('response', sa.Text, nullable=False),
+        sa.Column('hits', sa.Integer, nullable=False),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('last_used_at', sa.DateTime),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+        if_not_exists=True
+    )
+    op.create_index('ix_llm_cache_last_used_at', 'llm_cache', ['last_used_at'], if_not_exists=True)
+    op.create_index('ix_llm_cache_expires_at', 'llm_cache', ['expires_at'], if_not_exists=True)
+
+def downgrade():
+    op.drop_table('llm_cache', if_exists=True)
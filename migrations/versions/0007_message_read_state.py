@@ -0,0 +1,37 @@
+"""Message read state and cached unread counters
+
+Replaces add_message_read_state.py. Messages from before read tracking
+existed start out read; the partial index over unread rows is created
+concurrently in 0009.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('messages', sa.Column('is_read', sa.Boolean, nullable=False, server_default=sa.true()),
+                  if_not_exists=True)
+    op.alter_column('messages', 'is_read', server_default=sa.false())
+    op.add_column('messages', sa.Column('read_at', sa.DateTime), if_not_exists=True)
+    op.add_column('users', sa.Column('unread_message_count', sa.Integer, nullable=False, server_default='0'),
+                  if_not_exists=True)
+
+    op.execute("""
+        UPDATE users SET unread_message_count = (
+            SELECT COUNT(*) FROM messages WHERE receiver_id = users.id AND NOT is_read
+        )
+    """)
+
+def downgrade():
+    op.drop_column('users', 'unread_message_count', if_exists=True)
+    op.drop_column('messages', 'read_at', if_exists=True)
+    op.drop_column('messages', 'is_read', if_exists=True)
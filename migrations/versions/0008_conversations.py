@@ -0,0 +1,57 @@
+"""Conversation summaries for the messages inbox
+
+Replaces create_conversations_table.py: one row per pair of users with the
+last message and each side's unread count, filled from existing messages.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'conversations',
+        sa.Column('user_low_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_high_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('last_message_id', sa.Integer, nullable=False),
+        sa.Column('last_sender_id', sa.Integer, nullable=False),
+        sa.Column('last_message_snippet', sa.String(200), nullable=False),
+        sa.Column('last_message_at', sa.DateTime, nullable=False),
+        sa.Column('unread_low', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('unread_high', sa.Integer, nullable=False, server_default='0'),
+        if_not_exists=True
+    )
+    op.create_index('ix_conversations_low_last_message', 'conversations',
+                    ['user_low_id', 'last_message_id'], if_not_exists=True)
+    op.create_index('ix_conversations_high_last_message', 'conversations',
+                    ['user_high_id', 'last_message_id'], if_not_exists=True)
+
+    op.execute("""
+        INSERT INTO conversations (user_low_id, user_high_id, last_message_id, last_sender_id,
+                                   last_message_snippet, last_message_at, unread_low, unread_high)
+        SELECT DISTINCT ON (pair.low_id, pair.high_id)
+               pair.low_id, pair.high_id, m.id, m.sender_id, LEFT(m.content, 100),
+               COALESCE(m.timestamp, now() AT TIME ZONE 'utc'),
+               COUNT(*) FILTER (WHERE NOT m.is_read AND m.receiver_id = pair.low_id)
+                   OVER (PARTITION BY pair.low_id, pair.high_id),
+               COUNT(*) FILTER (WHERE NOT m.is_read AND m.receiver_id = pair.high_id)
+                   OVER (PARTITION BY pair.low_id, pair.high_id)
+        FROM messages m
+        CROSS JOIN LATERAL (
+            SELECT LEAST(m.sender_id, m.receiver_id) AS low_id,
+                   GREATEST(m.sender_id, m.receiver_id) AS high_id
+        ) pair
+        ORDER BY pair.low_id, pair.high_id, m.id DESC
+        ON CONFLICT (user_low_id, user_high_id) DO NOTHING
+    """)
+
+def downgrade():
+    op.drop_table('conversations', if_exists=True)
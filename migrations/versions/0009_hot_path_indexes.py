@@ -0,0 +1,59 @@
+"""Indexes for the hot query predicates
+
+One index per predicate the routes filter or sort on:
+
+    posts (author_id, created_at)              profile posts, feed fan-in
+    comments (post_id, created_at)             comment previews
+    post_likes (post_id, vote_type)            vote totals per post
+    comment_likes (comment_id, vote_type)      vote totals per comment
+    messages (sender_id, receiver_id, id)      chat history pages
+    messages (receiver_id, sender_id) unread   unread counts, mark as read
+    friend_requests (receiver_id, status)      pending requests
+    friendships (user2_id)                     reverse friend lookup
+    activity_logs (user_id, created_at)        activity log
+    chat_history (user_id, session_id)         Swift chat sessions
+
+They are built with CREATE INDEX CONCURRENTLY outside the migration
+transaction so the tables stay writable while the indexes build. If a
+concurrent build fails it leaves an INVALID index behind; drop it and run
+the upgrade again. The messages (sender_id, receiver_id, id) index replaces
+add_message_history_index.py.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_posts_author_created', 'posts', ['author_id', 'created_at'], {}),
+    ('ix_comments_post_created', 'comments', ['post_id', 'created_at'], {}),
+    ('ix_post_likes_post_vote', 'post_likes', ['post_id', 'vote_type'], {}),
+    ('ix_comment_likes_comment_vote', 'comment_likes', ['comment_id', 'vote_type'], {}),
+    ('ix_messages_pair_id', 'messages', ['sender_id', 'receiver_id', 'id'], {}),
+    ('ix_messages_unread', 'messages', ['receiver_id', 'sender_id'],
+     {'postgresql_where': sa.text('NOT is_read')}),
+    ('ix_friend_requests_receiver_status', 'friend_requests', ['receiver_id', 'status'], {}),
+    ('ix_friendships_user2_id', 'friendships', ['user2_id'], {}),
+    ('ix_activity_logs_user_created', 'activity_logs', ['user_id', 'created_at'], {}),
+    ('ix_chat_history_user_session', 'chat_history', ['user_id', 'session_id'], {}),
+]
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True,
+                            if_not_exists=True, **options)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,28 @@
+"""Full-text search index on message contents
+
+GIN index over to_tsvector('english', content), the expression
+messaging.search_messages() matches on. Built concurrently, like 0009.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_content_search', 'messages', [sa.text("to_tsvector('english', content)")],
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_content_search', table_name='messages',
+                      postgresql_concurrently=True, if_exists=True)
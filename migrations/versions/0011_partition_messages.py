@@ -0,0 +1,118 @@
+"""Range-partition messages by month on timestamp
+
+The existing table is not copied. It is turned into the first partition,
+messages_legacy, covering everything before the start of next month:
+
+1. A unique index on (id, timestamp) is built concurrently; it becomes the
+   legacy table's primary key, since a partitioned table's key must
+   include the partition column.
+2. CHECK constraints prove timestamp is NOT NULL and below the boundary,
+   so ATTACH PARTITION skips its validation scan.
+3. The table is renamed, a partitioned `messages` is created with the
+   same columns, foreign keys and indexes, and the legacy table is
+   attached. Its existing indexes are attached to the parent's instead
+   of being rebuilt.
+4. Monthly partitions are created for the next two months, plus a
+   default partition that catches rows no monthly partition covers.
+
+From then on `python message_partitions.py ensure` (daily) creates the
+upcoming months, and `python message_partitions.py archive` detaches or
+compacts cold ones. Requires PostgreSQL 12 or later.
+
+There is no automatic downgrade: it would have to copy every message
+into a new table under an exclusive lock. To go back to 0010, restore
+the backup taken before this migration, or by hand, with the app
+stopped:
+
+    CREATE TABLE messages_plain (LIKE messages INCLUDING DEFAULTS);
+    INSERT INTO messages_plain SELECT * FROM messages;
+    DROP TABLE messages;  -- drops every partition
+    ALTER TABLE messages_plain RENAME TO messages;
+    ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+    ALTER TABLE messages ADD PRIMARY KEY (id),
+        ADD FOREIGN KEY (sender_id) REFERENCES users (id),
+        ADD FOREIGN KEY (receiver_id) REFERENCES users (id);
+
+then recreate ix_messages_unread, ix_messages_pair_id and
+ix_messages_content_search as above and run `alembic stamp 0010`.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS messages_id_timestamp_key "
+                   "ON messages (id, timestamp)")
+
+    op.execute("""
+        DO $$
+        DECLARE
+            boundary timestamp := date_trunc('month', now() AT TIME ZONE 'utc') + interval '1 month';
+        BEGIN
+            -- Rows without a timestamp (the app always sets one) are dated to the migration
+            UPDATE messages SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL;
+
+            ALTER TABLE messages ADD CONSTRAINT messages_timestamp_not_null
+                CHECK (timestamp IS NOT NULL) NOT VALID;
+            ALTER TABLE messages VALIDATE CONSTRAINT messages_timestamp_not_null;
+            ALTER TABLE messages ALTER COLUMN timestamp SET NOT NULL;
+            EXECUTE format('ALTER TABLE messages ADD CONSTRAINT messages_legacy_range '
+                           'CHECK (timestamp < %L) NOT VALID', boundary);
+            ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_range;
+
+            ALTER TABLE messages DROP CONSTRAINT messages_pkey;
+            ALTER TABLE messages ADD CONSTRAINT messages_legacy_pkey
+                PRIMARY KEY USING INDEX messages_id_timestamp_key;
+            ALTER TABLE messages RENAME TO messages_legacy;
+            ALTER INDEX IF EXISTS ix_messages_unread RENAME TO messages_legacy_unread_idx;
+            ALTER INDEX IF EXISTS ix_messages_pair_id RENAME TO messages_legacy_pair_id_idx;
+            ALTER INDEX IF EXISTS ix_messages_content_search RENAME TO messages_legacy_content_search_idx;
+
+            CREATE TABLE messages (
+                id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+                sender_id integer NOT NULL REFERENCES users (id),
+                receiver_id integer NOT NULL REFERENCES users (id),
+                content text NOT NULL,
+                timestamp timestamp NOT NULL,
+                is_read boolean NOT NULL DEFAULT false,
+                read_at timestamp,
+                CONSTRAINT messages_pkey PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp);
+            ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+            CREATE INDEX ix_messages_unread ON messages (receiver_id, sender_id) WHERE NOT is_read;
+            CREATE INDEX ix_messages_pair_id ON messages (sender_id, receiver_id, id);
+            CREATE INDEX ix_messages_content_search ON messages USING gin (to_tsvector('english', content));
+
+            EXECUTE format('ALTER TABLE messages ATTACH PARTITION messages_legacy '
+                           'FOR VALUES FROM (MINVALUE) TO (%L)', boundary);
+            ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_range;
+            ALTER TABLE messages_legacy DROP CONSTRAINT messages_timestamp_not_null;
+
+            FOR i IN 0..1 LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                               to_char(boundary + i * interval '1 month', '"messages_y"YYYY"m"MM'),
+                               boundary + i * interval '1 month',
+                               boundary + (i + 1) * interval '1 month');
+            END LOOP;
+            CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+        END
+        $$
+    """)
+
+def downgrade():
+    raise RuntimeError(
+        "0011 cannot be downgraded automatically: messages is partitioned and reverting it means "
+        "copying every row. Restore the pre-0011 backup, or follow the steps in the docstring of "
+        "migrations/versions/0011_partition_messages.py and then run `alembic stamp 0010`."
+    )
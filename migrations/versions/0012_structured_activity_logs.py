@@ -0,0 +1,118 @@
+"""Structured activity logs: descriptions rendered at read time
+
+activity_logs.description becomes nullable. Activity types with an entry
+in activity_logger.ACTIVITY_TEMPLATES no longer store text; the
+activity_log page renders it from activity_type, target_user_id and
+activity_data, with the target user's current name.
+
+Existing rows are backfilled:
+
+- friend request and message rows without a target_user_id get it from
+  the name in their description, when exactly one user has that name;
+- create_post rows get their category, AI comments their is_ai flag and
+  delete_user rows the deleted user's name and email from the text;
+- the description is then cleared wherever the structured fields can
+  render it. Rows that cannot be backfilled keep their text, which the
+  page falls back to.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+# Text before the target user's name in the old descriptions
+TARGET_PREFIXES = {
+    'friend_request_sent': 'Sent friend request to ',
+    'friend_request_received': 'Received friend request from ',
+    'friend_request_accepted': 'Accepted friend request from ',
+    'friend_request_declined': 'Declined friend request from ',
+    'send_message': 'Sent message to ',
+    'receive_message': 'Received message from ',
+}
+
+# Types whose text never depended on the row
+FIXED_TEXT = {
+    'login': 'User logged in',
+    'logout': 'User logged out',
+    'signup': 'User created an account',
+    'create_profile': 'User created their profile',
+    'profile_updated': 'Profile information was updated',
+    'like_post': 'Liked a post',
+    'dislike_post': 'Disliked a post',
+    'like_comment': 'Liked a comment',
+    'dislike_comment': 'Disliked a comment',
+    'delete_post': 'Deleted a post',
+    'delete_comment': 'Deleted a comment',
+    'chatbot_interaction': 'Interacted with Swift chatbot',
+}
+
+def _merge_data(fields_sql, where_sql):
+    op.execute(f"""
+        UPDATE activity_logs
+        SET activity_data = (COALESCE(activity_data::jsonb, '{{}}'::jsonb) || {fields_sql})::json
+        WHERE {where_sql}
+    """)
+
+def upgrade():
+    op.alter_column('activity_logs', 'description', existing_type=sa.Text, nullable=True)
+
+    for activity_type, prefix in TARGET_PREFIXES.items():
+        op.execute(sa.text("""
+            UPDATE activity_logs a
+            SET target_user_id = u.id
+            FROM (SELECT MIN(id) AS id, name FROM users GROUP BY name HAVING COUNT(*) = 1) u
+            WHERE a.activity_type = :activity_type AND a.target_user_id IS NULL
+              AND a.description = :prefix || u.name
+        """).bindparams(activity_type=activity_type, prefix=prefix))
+
+    _merge_data("jsonb_build_object('category', substring(description from '^Created a (.*) post$'))",
+                "activity_type = 'create_post' AND description ~ '^Created a .* post$' "
+                "AND (activity_data::jsonb ->> 'category') IS NULL")
+    _merge_data("jsonb_build_object('is_ai', description = 'AI commented on a post')",
+                "activity_type = 'create_comment' AND (activity_data::jsonb ->> 'is_ai') IS NULL")
+    _merge_data("jsonb_build_object('name', substring(description from '^Deleted user (.*) \\(.*\\)$'), "
+                "'email', substring(description from '^Deleted user .* \\((.*)\\)$'))",
+                "activity_type = 'delete_user' AND description ~ '^Deleted user .* \\(.*\\)$' "
+                "AND (activity_data::jsonb ->> 'name') IS NULL")
+
+    op.execute(sa.text("""
+        UPDATE activity_logs SET description = NULL
+        WHERE activity_type IN :fixed
+           OR (activity_type IN :targeted AND target_user_id IS NOT NULL)
+           OR (activity_type = 'create_post' AND (activity_data::jsonb ->> 'category') IS NOT NULL)
+           OR (activity_type = 'create_comment' AND (activity_data::jsonb ->> 'is_ai') IS NOT NULL)
+           OR (activity_type = 'delete_user' AND (activity_data::jsonb ->> 'name') IS NOT NULL)
+    """).bindparams(sa.bindparam('fixed', list(FIXED_TEXT), expanding=True),
+                    sa.bindparam('targeted', list(TARGET_PREFIXES), expanding=True)))
+
+def downgrade():
+    for activity_type, text in FIXED_TEXT.items():
+        op.execute(sa.text(
+            "UPDATE activity_logs SET description = :text WHERE activity_type = :activity_type AND description IS NULL"
+        ).bindparams(activity_type=activity_type, text=text))
+    for activity_type, prefix in TARGET_PREFIXES.items():
+        op.execute(sa.text("""
+            UPDATE activity_logs a SET description = :prefix || COALESCE(u.name, 'Unknown user')
+            FROM activity_logs l LEFT JOIN users u ON u.id = l.target_user_id
+            WHERE a.id = l.id AND a.activity_type = :activity_type AND a.description IS NULL
+        """).bindparams(activity_type=activity_type, prefix=prefix))
+    op.execute("""
+        UPDATE activity_logs SET description = CASE
+            WHEN activity_type = 'create_post' THEN 'Created a ' || (activity_data::jsonb ->> 'category') || ' post'
+            WHEN activity_type = 'create_comment' AND (activity_data::jsonb ->> 'is_ai') = 'true' THEN 'AI commented on a post'
+            WHEN activity_type = 'create_comment' THEN 'Commented on a post'
+            WHEN activity_type = 'delete_user' THEN
+                'Deleted user ' || (activity_data::jsonb ->> 'name') || ' (' || (activity_data::jsonb ->> 'email') || ')'
+            ELSE replace(activity_type, '_', ' ')
+        END
+        WHERE description IS NULL
+    """)
+    op.alter_column('activity_logs', 'description', existing_type=sa.Text, nullable=False)
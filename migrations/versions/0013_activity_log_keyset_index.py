@@ -0,0 +1,34 @@
+"""Activity log index for keyset pagination
+
+Replaces activity_logs (user_id, created_at) with (user_id, created_at,
+id), the full sort key of the activity log page, so the page's user,
+time-window and cursor conditions are one index range scan and the
+capped total an index-only scan. The new index is built before the old
+one is dropped, both concurrently.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_activity_logs_user_created_id', 'activity_logs', ['user_id', 'created_at', 'id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_activity_logs_user_created', table_name='activity_logs',
+                      postgresql_concurrently=True, if_exists=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_activity_logs_user_created', 'activity_logs', ['user_id', 'created_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_activity_logs_user_created_id', table_name='activity_logs',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,121 @@
+"""Range-partition activity_logs by month on created_at, with daily rollups
+
+Done the same way as messages in 0011. The existing table becomes the
+activity_logs_legacy partition, which covers everything before the start
+of next month, so no rows are copied. Partitions are also created for
+the next two months, plus activity_logs_default.
+
+activity_daily_counts holds one row per (user_id, activity_type, day).
+`python activity_partitions.py retain` adds a partition's rows to it
+before dropping the partition, so long-range trends outlive the raw rows.
+activity_logs_legacy cannot be dropped until the month this migration ran
+in has aged out, so until then `retain` rolls up and deletes its rows
+older than ACTIVITY_LOG_RETENTION_MONTHS in small batches instead.
+
+Requires PostgreSQL 12 or later.
+
+There is no automatic downgrade, for the same reason as 0011. To go back
+to 0013, restore the backup taken before this migration, or by hand,
+with the app stopped (rows of partitions already dropped by `retain`
+only survive as daily counts):
+
+    CREATE TABLE activity_logs_plain (LIKE activity_logs INCLUDING DEFAULTS);
+    INSERT INTO activity_logs_plain SELECT * FROM activity_logs;
+    DROP TABLE activity_logs;  -- drops every partition
+    ALTER TABLE activity_logs_plain RENAME TO activity_logs;
+    ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id;
+    ALTER TABLE activity_logs ADD PRIMARY KEY (id),
+        ADD FOREIGN KEY (user_id) REFERENCES users (id),
+        ADD FOREIGN KEY (target_user_id) REFERENCES users (id);
+    CREATE INDEX ix_activity_logs_user_created_id ON activity_logs (user_id, created_at, id);
+    DROP TABLE activity_daily_counts;
+
+then run `alembic stamp 0013`.
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'activity_daily_counts',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('activity_type', sa.String(50), primary_key=True),
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('count', sa.Integer, nullable=False),
+        if_not_exists=True
+    )
+    op.create_index('ix_activity_daily_counts_day', 'activity_daily_counts', ['day', 'activity_type'],
+                    if_not_exists=True)
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS activity_logs_id_created_at_key "
+                   "ON activity_logs (id, created_at)")
+
+    op.execute("""
+        DO $$
+        DECLARE
+            boundary timestamp := date_trunc('month', now() AT TIME ZONE 'utc') + interval '1 month';
+        BEGIN
+            UPDATE activity_logs SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL;
+
+            ALTER TABLE activity_logs ADD CONSTRAINT activity_logs_created_at_not_null
+                CHECK (created_at IS NOT NULL) NOT VALID;
+            ALTER TABLE activity_logs VALIDATE CONSTRAINT activity_logs_created_at_not_null;
+            ALTER TABLE activity_logs ALTER COLUMN created_at SET NOT NULL;
+            EXECUTE format('ALTER TABLE activity_logs ADD CONSTRAINT activity_logs_legacy_range '
+                           'CHECK (created_at < %L) NOT VALID', boundary);
+            ALTER TABLE activity_logs VALIDATE CONSTRAINT activity_logs_legacy_range;
+
+            ALTER TABLE activity_logs DROP CONSTRAINT activity_logs_pkey;
+            ALTER TABLE activity_logs ADD CONSTRAINT activity_logs_legacy_pkey
+                PRIMARY KEY USING INDEX activity_logs_id_created_at_key;
+            ALTER TABLE activity_logs RENAME TO activity_logs_legacy;
+            ALTER INDEX IF EXISTS ix_activity_logs_user_created_id RENAME TO activity_logs_legacy_user_created_id_idx;
+
+            CREATE TABLE activity_logs (
+                id integer NOT NULL DEFAULT nextval('activity_logs_id_seq'),
+                user_id integer NOT NULL REFERENCES users (id),
+                activity_type varchar(50) NOT NULL,
+                description text,
+                target_user_id integer REFERENCES users (id),
+                activity_data json,
+                created_at timestamp NOT NULL,
+                CONSTRAINT activity_logs_pkey PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+            ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id;
+
+            CREATE INDEX ix_activity_logs_user_created_id ON activity_logs (user_id, created_at, id);
+
+            EXECUTE format('ALTER TABLE activity_logs ATTACH PARTITION activity_logs_legacy '
+                           'FOR VALUES FROM (MINVALUE) TO (%L)', boundary);
+            ALTER TABLE activity_logs_legacy DROP CONSTRAINT activity_logs_legacy_range;
+            ALTER TABLE activity_logs_legacy DROP CONSTRAINT activity_logs_created_at_not_null;
+
+            FOR i IN 0..1 LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF activity_logs FOR VALUES FROM (%L) TO (%L)',
+                               to_char(boundary + i * interval '1 month', '"activity_logs_y"YYYY"m"MM'),
+                               boundary + i * interval '1 month',
+                               boundary + (i + 1) * interval '1 month');
+            END LOOP;
+            CREATE TABLE activity_logs_default PARTITION OF activity_logs DEFAULT;
+        END
+        $$
+    """)
+
+def downgrade():
+    raise RuntimeError(
+        "0014 cannot be downgraded automatically: activity_logs is partitioned and reverting it means "
+        "copying every row. Restore the pre-0014 backup, or follow the steps in the docstring of "
+        "migrations/versions/0014_partition_activity_logs.py and then run `alembic stamp 0013`."
+    )
@@ -17,6 +17,7 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
     role = db.Column(db.String(20), default='User')
+    unread_message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by messaging.py
 
     # Relationships
     profile = db.relationship('Profile', backref='user', uselist=False, cascade='all, delete-orphan')
@@ -59,7 +60,10 @@ class FriendRequest(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, accepted, declined
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('sender_id', 'receiver_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('sender_id', 'receiver_id'),
+        db.Index('ix_friend_requests_receiver_status', 'receiver_id', 'status'),
+    )
 
     def __repr__(self):
         return f'<FriendRequest {self.sender.username} -> {self.receiver.username}>'
@@ -72,7 +76,10 @@ class Friendship(db.Model):
     user2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('user1_id', 'user2_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user1_id', 'user2_id'),
+        db.Index('ix_friendships_user2_id', 'user2_id'),  # Reverse direction of the friend-id lookup
+    )
 
     def __repr__(self):
         return f'<Friendship {self.user1.username} <-> {self.user2.username}>'
@@ -84,12 +91,27 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Partition key on PostgreSQL
+    is_read = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    read_at = db.Column(db.DateTime)
 
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+    # On PostgreSQL the table is range-partitioned by month on timestamp (migration 0011,
+    # message_partitions.py) and its primary key there is (id, timestamp)
+    __table_args__ = (
+        # Only unread rows are indexed, so the index stays small as history grows
+        db.Index('ix_messages_unread', 'receiver_id', 'sender_id',
+                 postgresql_where=db.text('NOT is_read'), sqlite_where=db.text('NOT is_read')),
+        # Chat history: each direction of a conversation is one range of ids
+        db.Index('ix_messages_pair_id', 'sender_id', 'receiver_id', 'id'),
+        # Full-text search over message contents (PostgreSQL only, see messaging.search_messages)
+        db.Index('ix_messages_content_search', db.text("to_tsvector('english', content)"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
     def __repr__(self):
         return f'<Message {self.sender.username} -> {self.receiver.username}: {self.content[:20]}...>'
 
@@ -103,6 +125,11 @@ class Post(db.Model):
     ai_comment = db.Column(db.Text)  # AI's first comment
     ai_analysis = db.Column(db.Text)  # AI's analysis of the post
     is_ai_generated = db.Column(db.Boolean, default=False)  # Whether AI helped generate the post
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by counters.py
+    dislike_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped when cached fragments go stale
+    ai_status = db.Column(db.String(20))  # None, 'pending', 'thinking', 'done' or 'failed' for the AI enrichment job
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -111,6 +138,8 @@ class Post(db.Model):
     comments = db.relationship('Comment', backref='post', cascade='all, delete-orphan')
     likes = db.relationship('PostLike', backref='post', cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_posts_author_created', 'author_id', 'created_at'),)
+
     def __repr__(self):
         return f'<Post {self.id} by {self.author.username}: {self.content[:30]}...>'
 
@@ -122,6 +151,8 @@ class Comment(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)  # Can be null for AI comments
     content = db.Column(db.Text, nullable=False)
     is_ai_comment = db.Column(db.Boolean, default=False)  # To identify AI comments
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by counters.py
+    dislike_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -129,6 +160,8 @@ class Comment(db.Model):
     author = db.relationship('User', backref='comments')
     likes = db.relationship('CommentLike', backref='comment', cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_comments_post_created', 'post_id', 'created_at'),)
+
     def __repr__(self):
         return f'<Comment {self.id} by {self.author.username}: {self.content[:30]}...>'
 
@@ -141,7 +174,10 @@ class PostLike(db.Model):
     vote_type = db.Column(db.Integer, default=1)  # 1 for like, -1 for dislike
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('post_id', 'user_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'user_id'),
+        db.Index('ix_post_likes_post_vote', 'post_id', 'vote_type'),
+    )
 
     def __repr__(self):
         return f'<PostLike {self.user.username} {"likes" if self.vote_type == 1 else "dislikes"} post {self.post_id}>'
@@ -155,7 +191,10 @@ class CommentLike(db.Model):
     vote_type = db.Column(db.Integer, default=1)  # 1 for like, -1 for dislike
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('comment_id', 'user_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('comment_id', 'user_id'),
+        db.Index('ix_comment_likes_comment_vote', 'comment_id', 'vote_type'),
+    )
 
     def __repr__(self):
         return f'<CommentLike {self.user.username} {"likes" if self.vote_type == 1 else "dislikes"} comment {self.comment_id}>'
@@ -174,6 +213,8 @@ class ChatHistory(db.Model):
     # Relationships
     user = db.relationship('User', backref='chat_history')
 
+    __table_args__ = (db.Index('ix_chat_history_user_session', 'user_id', 'session_id'),)
+
     def __repr__(self):
         return f'<ChatHistory {self.user.username}: {self.user_message[:30]}...>'
 
@@ -183,14 +224,110 @@ class ActivityLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     activity_type = db.Column(db.String(50), nullable=False)  # Type of activity
-    description = db.Column(db.Text, nullable=False)  # Human-readable description
+    description = db.Column(db.Text)  # Fixed text for types without a template; see activity_logger.ACTIVITY_TEMPLATES
     target_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # For friend-related activities
     activity_data = db.Column(db.JSON)  # Additional details like post_id, count, etc.
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Partition key on PostgreSQL
 
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='activities', passive_deletes=True)
     target_user = db.relationship('User', foreign_keys=[target_user_id], backref='targeted_activities', passive_deletes=True)
 
+    # Keyset pages of the activity log walk (user_id, created_at, id)
+    __table_args__ = (db.Index('ix_activity_logs_user_created_id', 'user_id', 'created_at', 'id'),)
+
+    def __repr__(self):
+        return f'<ActivityLog {self.user_id}: {self.activity_type}>'
+
+class ActivityDailyCount(db.Model):
+    __tablename__ = 'activity_daily_counts'
+
+    # Per-day totals of activity_logs rows, kept after their partition is dropped
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    activity_type = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_activity_daily_counts_day', 'day', 'activity_type'),)
+
+    def __repr__(self):
+        return f'<ActivityDailyCount {self.user_id} {self.activity_type} {self.day}: {self.count}>'
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline_entries'
+
+    # One row per (reader, post) when the home feed is materialized on write
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # Copy of the post's created_at
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_created', 'user_id', 'created_at', 'post_id'),
+        db.Index('ix_timeline_entries_author_id', 'author_id'),
+    )
+
+    def __repr__(self):
+        return f'<TimelineEntry user {self.user_id} post {self.post_id}>'
+
+class AIJob(db.Model):
+    __tablename__ = 'ai_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False, default='enrich_post')
+    payload = db.Column(db.JSON)  # Job options, e.g. {'rewrite': True}
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not picked up before this time
+    locked_at = db.Column(db.DateTime)  # When a worker claimed the job
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_ai_jobs_status_run_after', 'status', 'run_after'),)
+
+    # Relationships
+    post = db.relationship('Post', backref=db.backref('ai_jobs', cascade='all, delete-orphan', passive_deletes=True))
+
+    def __repr__(self):
+        return f'<AIJob {self.id} {self.kind} post {self.post_id}: {self.status}>'
+
+class LLMCacheEntry(db.Model):
+    __tablename__ = 'llm_cache'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of model, messages and sampling parameters
+    call_site = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # For LRU pruning
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<LLMCacheEntry {self.key[:12]} {self.call_site}>'
+
+class Conversation(db.Model):
+    """Summary of the messages between two users, one row per pair"""
+    __tablename__ = 'conversations'
+
+    # The pair is stored normalized: user_low_id < user_high_id
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_sender_id = db.Column(db.Integer, nullable=False)
+    last_message_snippet = db.Column(db.String(200), nullable=False, default='')
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    unread_low = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Unread by user_low_id
+    unread_high = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Unread by user_high_id
+
+    __table_args__ = (
+        # Message ids grow with time, so last_message_id orders a user's inbox by last activity
+        db.Index('ix_conversations_low_last_message', 'user_low_id', 'last_message_id'),
+        db.Index('ix_conversations_high_last_message', 'user_high_id', 'last_message_id'),
+    )
+
     def __repr__(self):
-        return f'<ActivityLog {self.user.username}: {self.description[:50]}...>'
\ No newline at end of file
+        return f'<Conversation {self.user_low_id} <-> {self.user_high_id}>'
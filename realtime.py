@@ -0,0 +1,313 @@
+"""
+Server-Sent Events push channel for chat messages and unread counts
+
+Routes call publish(user_id, event, data) while handling a write; the event
+is delivered once the transaction commits. Each web worker keeps the open
+/api/stream connections of its users as Subscription queues, and a broker
+moves events between workers:
+
+- PostgresBroker sends events with pg_notify() inside the writing
+  transaction (so they are only delivered if it commits) and runs one
+  LISTEN thread per worker process that fans them out to local queues.
+- MemoryBroker delivers within the process after commit, for SQLite,
+  tests and single-worker development.
+
+PostgresBroker also carries broadcast(topic, data) messages to handlers
+registered in every worker, which per-process caches (friend_graph) use
+to drop entries another worker invalidated.
+
+The polling endpoints stay in place; the client falls back to them when
+EventSource is unavailable or the stream keeps failing.
+
+Under gunicorn's gthread workers every open stream holds one of the
+worker's WEB_THREADS threads for REALTIME_STREAM_SECONDS. A broker admits
+at most REALTIME_MAX_STREAMS streams per worker process so the rest of the
+threads stay free for ordinary requests; clients turned away poll instead.
+"""
+
+import os
+import json
+import time
+import queue
+import select
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from models import db
+
+CHANNEL = 'socialmedia_events'
+
+# pg_notify payloads are limited to 8000 bytes; bigger events tell the client to fetch instead
+MAX_NOTIFY_PAYLOAD = 7500
+
+class Subscription:
+    """Queue of events for one open stream"""
+
+    def __init__(self, user_id, max_events=100):
+        self.user_id = user_id
+        self.events = queue.Queue(maxsize=max_events)
+        self.overflowed = False
+
+    def put(self, event_name, data):
+        try:
+            self.events.put_nowait((event_name, data))
+        except queue.Full:
+            # The client is not keeping up; tell it to resync over the polling endpoints
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class _LocalSubscribers:
+    """Per-process registry of open streams by user ID"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def add(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+
+    def remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def deliver(self, user_id, event_name, data):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event_name, data)
+
+    def count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+class MemoryBroker:
+    """Delivers events to streams in this process only"""
+
+    name = 'memory'
+    transactional = False
+
+    def __init__(self, max_streams=None):
+        self.subscribers = _LocalSubscribers()
+        self.max_streams = max_streams
+        self.open_streams = 0
+        self._streams_lock = threading.Lock()
+
+    def reserve_stream(self):
+        """Count a new stream against max_streams; False when this worker is already at the cap"""
+        with self._streams_lock:
+            if self.max_streams is not None and self.open_streams >= self.max_streams:
+                return False
+            self.open_streams += 1
+            return True
+
+    def release_stream(self):
+        with self._streams_lock:
+            self.open_streams -= 1
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.remove(subscription)
+
+    def publish(self, user_id, event_name, data):
+        self.subscribers.deliver(user_id, event_name, data)
+
+class PostgresBroker(MemoryBroker):
+    """Delivers events to streams in every worker through LISTEN/NOTIFY"""
+
+    name = 'postgres'
+    transactional = True
+
+    def __init__(self, engine, max_streams=None):
+        super().__init__(max_streams)
+        self.engine = engine
+        self._handlers = {}
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        self.listen()
+        return super().subscribe(user_id)
+
+    def add_handler(self, topic, handler):
+        """
+        Call handler(data) in this process for every broadcast on topic
+
+        handler(None) is called each time the listener (re)connects, as
+        broadcasts sent while it was not listening are lost. Handlers run
+        on the listener thread, outside any app context.
+        """
+        self._handlers[topic] = handler
+
+    def notify(self, user_id, event_name, data):
+        """Queue a NOTIFY in the current transaction"""
+        payload = json.dumps({'user_id': user_id, 'event': event_name, 'data': data})
+        if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({'user_id': user_id, 'event': 'resync', 'data': {}})
+        db.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                           {'channel': CHANNEL, 'payload': payload})
+
+    def broadcast(self, topic, data):
+        """Queue a NOTIFY for the topic's handlers in every worker in the current transaction"""
+        payload = json.dumps({'topic': topic, 'data': data})
+        if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({'topic': topic, 'data': None})
+        db.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                           {'channel': CHANNEL, 'payload': payload})
+
+    def listen(self):
+        """Start this process's LISTEN thread unless it is running"""
+        # Gunicorn forks workers after import, so every process starts its own listener
+        if self._listener is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._listener = threading.Thread(target=self._listen_forever, name='realtime-listener', daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        delay = 1
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Realtime listener error: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _listen(self):
+        # A dedicated connection outside the pool, held for the life of the worker
+        connection = self.engine.raw_connection()
+        connection.detach()
+        dbapi_connection = connection.dbapi_connection
+        dbapi_connection.autocommit = True
+        try:
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            for topic in list(self._handlers):
+                self._dispatch({'topic': topic, 'data': None})
+            while True:
+                if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    try:
+                        message = json.loads(notification.payload)
+                    except ValueError:
+                        continue
+                    self._dispatch(message)
+        finally:
+            dbapi_connection.close()
+
+    def _dispatch(self, message):
+        if 'topic' not in message:
+            self.subscribers.deliver(message['user_id'], message['event'], message['data'])
+            return
+        handler = self._handlers.get(message['topic'])
+        if handler is not None:
+            try:
+                handler(message['data'])
+            except Exception as e:
+                print(f"Realtime handler error on {message['topic']}: {e}")
+
+def init_app(app):
+    """Create the configured broker ('auto' picks postgres for a PostgreSQL database)"""
+    backend = app.config.get('REALTIME_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'memory'
+    max_streams = app.config.get('REALTIME_MAX_STREAMS')
+
+    if backend == 'none':
+        broker = None
+    elif backend == 'memory':
+        broker = MemoryBroker(max_streams)
+    elif backend == 'postgres':
+        with app.app_context():
+            broker = PostgresBroker(db.engine, max_streams)
+    else:
+        raise ValueError(f"Unknown realtime backend: {backend}")
+    app.extensions['realtime'] = broker
+
+def get_broker():
+    return current_app.extensions.get('realtime')
+
+def publish(user_id, event_name, data):
+    """Send an event to a user's open streams once the current transaction commits"""
+    broker = get_broker()
+    if broker is None:
+        return
+    if broker.transactional:
+        broker.notify(user_id, event_name, data)
+    else:
+        db.session().info.setdefault('realtime_pending', []).append((user_id, event_name, data))
+
+def broadcast(topic, data):
+    """
+    Send data to the topic's handlers in every worker once the current transaction commits
+
+    Only the postgres broker crosses processes; with the others this does
+    nothing, so callers still update their own process's state themselves.
+    """
+    broker = get_broker()
+    if broker is not None and broker.transactional:
+        broker.broadcast(topic, data)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    pending = session.info.pop('realtime_pending', None)
+    if pending and has_app_context():
+        broker = get_broker()
+        if broker is not None:
+            for user_id, event_name, data in pending:
+                broker.publish(user_id, event_name, data)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('realtime_pending', None)
+
+def format_event(event_name, data):
+    """Encode one SSE frame"""
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+def stream(broker, user_id, initial_events=(), duration=300, heartbeat=15):
+    """
+    Generate the SSE frames for one connection
+
+    The stream ends after `duration` seconds so long-lived connections
+    are spread over workers; EventSource reconnects on its own.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        for event_name, data in initial_events:
+            yield format_event(event_name, data)
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield format_event('resync', {})
+            item = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.01)))
+            if item is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_event(*item)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Repair drift in the denormalized post, comment and unread-message counters
+
+Recomputes like/dislike/comment totals from the post_likes, comment_likes
+and comments tables, and unread totals from messages, and rewrites only the
+rows that disagree. Safe to run
+periodically (e.g. from a cron job) while the app is serving traffic.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db
+import counters
+import messaging
+
+def reconcile_counters():
+    """Fix all post, comment and unread counters, returning True on success"""
+    with app.app_context():
+        try:
+            posts_fixed = counters.reconcile_posts()
+            comments_fixed = counters.reconcile_comments()
+            users_fixed = messaging.reconcile_unread_counts()
+            db.session.commit()
+            print(f"[SUCCESS] Fixed counters on {posts_fixed} posts, {comments_fixed} comments and {users_fixed} users")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAILED] Error reconciling counters: {e}")
+            return False
+
+if __name__ == "__main__":
+    if not reconcile_counters():
+        sys.exit(1)
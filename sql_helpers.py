@@ -0,0 +1,16 @@
+"""
+Dialect-aware SQL helpers shared by the data-access modules
+"""
+
+from models import db
+
+def dialect_insert(model):
+    """
+    Return an INSERT construct for the current database that supports
+    on_conflict_do_nothing()/on_conflict_do_update() (PostgreSQL and SQLite)
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
@@ -5,6 +5,34 @@ let lastMessageId = 0;
 let currentChatUserId = null;
 let pollingInterval = null;
 
+let eventStream = null;
+
+// ETags of the last poll responses; the server answers 304 while nothing changed
+let latestEtag = null;
+let unreadEtag = null;
+
+// fetch() with If-None-Match, resolving to the JSON body or null on 304
+function fetchIfChanged(url, etag, storeEtag) {
+    return fetch(url, {headers: etag ? {'If-None-Match': etag} : {}})
+        .then(response => {
+            if (response.status === 304) {
+                return null;
+            }
+            storeEtag(response.headers.get('ETag'));
+            return response.json();
+        });
+}
+
+function fetchLatestMessages(userId) {
+    fetchIfChanged(`/api/messages/${userId}/latest?last_id=${lastMessageId}`, latestEtag, etag => latestEtag = etag)
+        .then(data => {
+            if (data && data.messages && data.messages.length > 0) {
+                appendNewMessages(data.messages);
+            }
+        })
+        .catch(error => console.error('Error fetching messages:', error));
+}
+
 function startPolling(userId) {
     currentChatUserId = userId;
     lastMessageId = document.querySelector('.message')?.lastElementChild?.dataset.messageId || 0;
@@ -15,16 +43,37 @@ function startPolling(userId) {
     }
 
     // Start polling every 3 seconds
-    pollingInterval = setInterval(() => {
-        fetch(`/api/messages/${userId}/latest?last_id=${lastMessageId}`)
-            .then(response => response.json())
-            .then(data => {
-                if (data.messages && data.messages.length > 0) {
-                    appendNewMessages(data.messages);
-                }
-            })
-            .catch(error => console.error('Error fetching messages:', error));
-    }, 3000);
+    pollingInterval = setInterval(() => fetchLatestMessages(userId), 3000);
+}
+
+// Receive messages over Server-Sent Events, falling back to polling
+function startMessageStream(userId) {
+    if (!window.EventSource) {
+        startPolling(userId);
+        return;
+    }
+
+    currentChatUserId = userId;
+    let failures = 0;
+    eventStream = new EventSource('/api/stream');
+    eventStream.addEventListener('open', () => {
+        failures = 0;
+        fetchLatestMessages(userId);
+    });
+    eventStream.addEventListener('message', event => {
+        const msg = JSON.parse(event.data);
+        if ((msg.sender_id == userId || msg.receiver_id == userId) && msg.id > lastMessageId) {
+            appendNewMessages([msg]);
+        }
+    });
+    eventStream.addEventListener('resync', () => fetchLatestMessages(userId));
+    eventStream.addEventListener('error', () => {
+        failures++;
+        if (eventStream.readyState === EventSource.CLOSED || failures >= 3) {
+            eventStream.close();
+            startPolling(userId);
+        }
+    });
 }
 
 function appendNewMessages(messages) {
@@ -75,11 +124,10 @@ function appendNewMessages(messages) {
 
 // Update unread count notification
 function updateUnreadCount() {
-    fetch('/api/unread-count')
-        .then(response => response.json())
+    fetchIfChanged('/api/unread-count', unreadEtag, etag => unreadEtag = etag)
         .then(data => {
             const unreadCount = document.getElementById('unreadCount');
-            if (unreadCount) {
+            if (data && unreadCount) {
                 if (data.count > 0) {
                     unreadCount.textContent = data.count;
                     unreadCount.classList.remove('d-none');
@@ -103,4 +151,7 @@ window.addEventListener('beforeunload', () => {
     if (pollingInterval) {
         clearInterval(pollingInterval);
     }
+    if (eventStream) {
+        eventStream.close();
+    }
 });
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Tests for the LLM gateway, its response cache and the background AI job queue, using fake backends
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['ACTIVITY_LOG_MODE'] = 'sync'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from app import app
+from models import db, Post, Comment, AIJob, LLMCacheEntry
+from test_query_counts import make_user
+from llm_backends import FakeLLMBackend, LLMResponse
+from llm_gateway import LLMGateway, LLMGatewayError
+from llm_cache import LLMResponseCache
+import ai_pipeline
+
+MESSAGES = [{'role': 'user', 'content': 'Hello there'}]
+
+class FlakyBackend:
+    """Backend that fails its first `failures` calls, optionally blocking until released"""
+
+    name = 'flaky'
+
+    def __init__(self, failures=0, release=None):
+        self.failures = failures
+        self.release = release
+        self.calls = 0
+        self.started = threading.Event()
+
+    def complete(self, messages, model, max_tokens, temperature, timeout=None):
+        self.calls += 1
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        if self.calls <= self.failures:
+            raise RuntimeError("upstream 503")
+        return LLMResponse(text='ok', prompt_tokens=3, completion_tokens=1)
+
+def complete(gateway, **kwargs):
+    return gateway.complete(MESSAGES, call_site='test', max_tokens=20, temperature=0.0, **kwargs)
+
+def test_gateway_retries_failed_calls():
+    backend = FlakyBackend(failures=2)
+    gateway = LLMGateway(backend, max_retries=2, retry_backoff=0.01)
+
+    assert complete(gateway) == 'ok'
+    assert backend.calls == 3
+    stats = gateway.metrics()['call_sites']['test']
+    assert (stats['calls'], stats['errors'], stats['retries']) == (1, 0, 2)
+    assert (stats['prompt_tokens'], stats['completion_tokens']) == (3, 1)
+
+def test_gateway_gives_up_after_max_retries():
+    backend = FlakyBackend(failures=5)
+    gateway = LLMGateway(backend, max_retries=2, retry_backoff=0.01)
+
+    with pytest.raises(LLMGatewayError):
+        complete(gateway)
+    assert backend.calls == 3
+    stats = gateway.metrics()['call_sites']['test']
+    assert (stats['calls'], stats['errors'], stats['retries']) == (1, 1, 2)
+
+def test_gateway_does_not_retry_past_the_deadline():
+    backend = FlakyBackend(failures=5)
+    gateway = LLMGateway(backend, max_retries=5, retry_backoff=1.0)
+
+    started = time.monotonic()
+    with pytest.raises(LLMGatewayError):
+        complete(gateway, timeout=0.2)
+    assert time.monotonic() - started < 0.2
+    assert backend.calls == 1
+
+def test_gateway_passes_the_remaining_deadline_to_the_backend():
+    backend = FakeLLMBackend(latency=1.0)
+    gateway = LLMGateway(backend, max_retries=2, retry_backoff=0.01)
+
+    started = time.monotonic()
+    with pytest.raises(LLMGatewayError):
+        complete(gateway, timeout=0.1)
+    assert time.monotonic() - started < 0.5
+    assert backend.calls == 1
+
+def test_gateway_rejects_calls_when_no_slot_frees_up():
+    release = threading.Event()
+    backend = FlakyBackend(release=release)
+    gateway = LLMGateway(backend, max_concurrency=1)
+    results = []
+    holder = threading.Thread(target=lambda: results.append(complete(gateway)))
+    holder.start()
+    try:
+        assert backend.started.wait(5)
+        assert gateway.metrics()['in_flight'] == 1
+        with pytest.raises(LLMGatewayError):
+            complete(gateway, timeout=0.05)
+    finally:
+        release.set()
+        holder.join(5)
+
+    assert results == ['ok']
+    assert backend.calls == 1
+    metrics = gateway.metrics()
+    assert metrics['in_flight'] == 0
+    assert metrics['call_sites']['test']['rejected'] == 1
+    assert metrics['call_sites']['test']['calls'] == 2
+
+@pytest.fixture
+def session():
+    app.config['TESTING'] = True
+    with app.app_context():
+        if app.extensions.get('fragment_cache') is not None:
+            app.extensions['fragment_cache'].clear()
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+def cached_gateway(backend, **kwargs):
+    return LLMGateway(backend, max_retries=0, cache=LLMResponseCache(**kwargs))
+
+def test_cache_answers_repeated_prompts(session):
+    backend = FlakyBackend()
+    gateway = cached_gateway(backend)
+
+    assert complete(gateway) == 'ok'
+    assert complete(gateway) == 'ok'
+    assert backend.calls == 1
+    assert gateway.cache.stats()['hits'] == 1
+    assert gateway.cache.stats()['misses'] == 1
+    assert session.scalar(db.select(LLMCacheEntry.hits)) == 1
+
+    # A different prompt is a miss
+    gateway.complete([{'role': 'user', 'content': 'Something else'}], call_site='test',
+                     max_tokens=20, temperature=0.0)
+    assert backend.calls == 2
+
+def test_cache_opt_out_skips_lookup_and_store(session):
+    backend = FlakyBackend()
+    gateway = cached_gateway(backend)
+
+    complete(gateway, cache=False)
+    complete(gateway, cache=False)
+    assert backend.calls == 2
+    assert gateway.cache.stats()['hits'] + gateway.cache.stats()['misses'] == 0
+    assert LLMCacheEntry.query.count() == 0
+
+def test_expired_entry_is_refreshed(session):
+    backend = FlakyBackend()
+    gateway = cached_gateway(backend)
+    complete(gateway)
+
+    entry = LLMCacheEntry.query.one()
+    entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    entry.response = 'stale'
+    entry.hits = 5
+    session.commit()
+
+    assert complete(gateway) == 'ok'
+    assert backend.calls == 2
+    session.expire_all()
+    entry = LLMCacheEntry.query.one()
+    assert (entry.response, entry.hits) == ('ok', 0)
+    assert entry.expires_at > datetime.utcnow()
+
+    # The refreshed entry answers the next call
+    assert complete(gateway) == 'ok'
+    assert backend.calls == 2
+
+def test_prune_evicts_expired_then_least_recently_used(session):
+    cache = LLMResponseCache(max_entries=2)
+    for key in ('a', 'b', 'c', 'd'):
+        cache.put(key, 'test', 'model', f'response {key}')
+    now = datetime.utcnow()
+    for key, age in (('a', 4), ('b', 3), ('c', 2), ('d', 1)):
+        session.get(LLMCacheEntry, key).last_used_at = now - timedelta(minutes=age)
+    session.get(LLMCacheEntry, 'd').expires_at = now - timedelta(seconds=1)
+    session.commit()
+
+    assert cache.get('a') == 'response a'
+    cache.prune()
+    session.commit()
+    assert sorted(entry.key for entry in LLMCacheEntry.query) == ['a', 'c']
+
+def queue_job(max_attempts=3):
+    author = make_user('author')
+    post = Post(author_id=author.id, content='Lost my job today', category='personal')
+    db.session.add(post)
+    db.session.flush()
+    job = ai_pipeline.enqueue_post_enrichment(post, max_attempts=max_attempts)
+    db.session.commit()
+    return job.id, post.id
+
+def failing_gateway():
+    return LLMGateway(FakeLLMBackend(failure_rate=1.0), max_retries=0, cache=None)
+
+def test_claim_jobs_claims_each_runnable_job_once(session):
+    job_id, post_id = queue_job()
+    later = AIJob(post_id=post_id, run_after=datetime.utcnow() + timedelta(hours=1))
+    session.add(later)
+    session.commit()
+
+    assert ai_pipeline.claim_jobs(10) == [job_id]
+    assert ai_pipeline.claim_jobs(10) == []
+    job = session.get(AIJob, job_id)
+    assert (job.status, job.attempts) == ('running', 1)
+    assert session.get(Post, post_id).ai_status == 'thinking'
+
+def test_stale_running_jobs_are_reclaimed_until_out_of_attempts(session):
+    job_id, post_id = queue_job(max_attempts=2)
+    ai_pipeline.claim_jobs(1)
+    stale = datetime.utcnow() - ai_pipeline.LOCK_TIMEOUT - timedelta(seconds=1)
+    session.get(AIJob, job_id).locked_at = stale
+    session.commit()
+
+    assert ai_pipeline.claim_jobs(1) == [job_id]
+    assert session.get(AIJob, job_id).attempts == 2
+
+    session.get(AIJob, job_id).locked_at = stale
+    session.commit()
+    assert ai_pipeline.claim_jobs(1) == []
+    job = session.get(AIJob, job_id)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert session.get(Post, post_id).ai_status == 'failed'
+
+def test_failed_job_is_retried_with_backoff(session):
+    job_id, post_id = queue_job()
+    gateway = failing_gateway()
+
+    for attempt in (1, 2):
+        job = session.get(AIJob, job_id)
+        job.run_after = datetime.utcnow()
+        session.commit()
+        assert ai_pipeline.claim_jobs(1) == [job_id]
+        before = datetime.utcnow()
+        assert ai_pipeline.process_job(job_id, gateway) == 'queued'
+        job = session.get(AIJob, job_id)
+        delay = ai_pipeline.RETRY_DELAY * 2 ** (attempt - 1)
+        assert before + delay <= job.run_after <= datetime.utcnow() + delay
+        assert 'Simulated LLM failure' in job.last_error
+
+    assert ai_pipeline.claim_jobs(1) == []
+    assert session.get(Post, post_id).ai_status == 'thinking'
+
+def test_job_fails_after_max_attempts(session):
+    job_id, post_id = queue_job(max_attempts=1)
+    version = session.get(Post, post_id).version
+
+    ai_pipeline.claim_jobs(1)
+    assert ai_pipeline.process_job(job_id, failing_gateway()) == 'failed'
+    post = session.get(Post, post_id)
+    assert post.ai_status == 'failed'
+    assert post.version == version + 1
+    assert Comment.query.filter_by(post_id=post_id).count() == 0
+
+class InlineExecutor:
+    """Runs submitted jobs right away; the in-memory SQLite database has one connection for all threads"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self, wait=True):
+        pass
+
+def test_worker_pool_drains_jobs_through_their_retries(session, monkeypatch):
+    monkeypatch.setattr(ai_pipeline, 'RETRY_DELAY', timedelta(seconds=0.05))
+    job_id, post_id = queue_job()
+    backend = FlakyBackend(failures=1)
+    gateway = LLMGateway(backend, max_retries=0, cache=None)
+
+    pool = ai_pipeline.WorkerPool(app, concurrency=2, gateway=gateway)
+    pool._executor = InlineExecutor()
+    pool.drain()
+
+    session.expire_all()
+    job = session.get(AIJob, job_id)
+    assert (job.status, job.attempts) == ('done', 2)
+    post = session.get(Post, post_id)
+    assert post.ai_status == 'done'
+    assert post.ai_analysis == 'ok'
+    assert [comment.content for comment in Comment.query.filter_by(post_id=post_id)] == ['ok']
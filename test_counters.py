@@ -0,0 +1,164 @@
+"""
+Tests for the denormalized vote and comment counters
+
+Every vote and comment route is checked against COUNT(*) over the source
+tables, and reconcile_posts()/reconcile_comments() against drift written
+straight into the counter columns.
+"""
+
+import os
+import sys
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['ACTIVITY_LOG_MODE'] = 'sync'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from app import app
+from models import db, User, Post, Comment, PostLike, CommentLike
+from test_query_counts import make_user, befriend, login
+import counters
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        for name in ('fragment_cache', 'friend_graph', 'activity_log_counts'):
+            if app.extensions.get(name) is not None:
+                app.extensions[name].clear()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def post_counts(post_id):
+    db.session.expire_all()
+    post = db.session.get(Post, post_id)
+    return post.like_count, post.dislike_count, post.comment_count
+
+def comment_counts(comment_id):
+    db.session.expire_all()
+    comment = db.session.get(Comment, comment_id)
+    return comment.like_count, comment.dislike_count
+
+def assert_post_counters_match(post_id):
+    likes = PostLike.query.filter_by(post_id=post_id, vote_type=1).count()
+    dislikes = PostLike.query.filter_by(post_id=post_id, vote_type=-1).count()
+    comments = Comment.query.filter_by(post_id=post_id).count()
+    assert post_counts(post_id) == (likes, dislikes, comments)
+
+def assert_comment_counters_match(comment_id):
+    likes = CommentLike.query.filter_by(comment_id=comment_id, vote_type=1).count()
+    dislikes = CommentLike.query.filter_by(comment_id=comment_id, vote_type=-1).count()
+    assert comment_counts(comment_id) == (likes, dislikes)
+
+@pytest.fixture
+def users_and_post(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    post = Post(author_id=alice.id, content='Counted post', category='personal')
+    db.session.add(post)
+    db.session.commit()
+    return alice.id, bob.id, post.id
+
+def vote(client, user_id, url, vote_type):
+    login(client, db.session.get(User, user_id))
+    response = client.post(url, json={'vote_type': vote_type})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_post_votes_keep_counters_exact(client, users_and_post):
+    alice_id, bob_id, post_id = users_and_post
+    url = f'/post/{post_id}/like'
+
+    steps = [
+        (alice_id, 1, 'added', (1, 0)),
+        (bob_id, -1, 'added', (1, 1)),
+        (bob_id, 1, 'changed', (2, 0)),      # dislike flipped to like
+        (alice_id, -1, 'changed', (1, 1)),   # like flipped to dislike
+        (alice_id, -1, 'removed', (1, 0)),
+        (bob_id, 1, 'removed', (0, 0)),
+    ]
+    for user_id, vote_type, action, expected in steps:
+        body = vote(client, user_id, url, vote_type)
+        assert body['action'] == action
+        assert (body['likes'], body['dislikes']) == expected
+        assert post_counts(post_id)[:2] == expected
+        assert_post_counters_match(post_id)
+
+def test_comment_votes_keep_counters_exact(client, users_and_post):
+    alice_id, bob_id, post_id = users_and_post
+    comment = Comment(post_id=post_id, author_id=bob_id, content='A comment')
+    db.session.add(comment)
+    db.session.commit()
+    url = f'/comment/{comment.id}/like'
+    comment_id = comment.id
+
+    steps = [
+        (alice_id, 1, (1, 0)),
+        (bob_id, -1, (1, 1)),
+        (bob_id, 1, (2, 0)),
+        (alice_id, -1, (1, 1)),
+        (alice_id, -1, (1, 0)),
+        (bob_id, 1, (0, 0)),
+    ]
+    for user_id, vote_type, expected in steps:
+        body = vote(client, user_id, url, vote_type)
+        assert (body['likes'], body['dislikes']) == expected
+        assert comment_counts(comment_id) == expected
+        assert_comment_counters_match(comment_id)
+
+def test_adding_and_deleting_comments_keeps_comment_count_exact(client, users_and_post):
+    alice_id, bob_id, post_id = users_and_post
+    version = db.session.get(Post, post_id).version
+
+    for user_id in (alice_id, bob_id, bob_id):
+        login(client, db.session.get(User, user_id))
+        client.post(f'/post/{post_id}/comment', data={'content': f'Comment by {user_id}'})
+        assert_post_counters_match(post_id)
+    assert post_counts(post_id)[2] == 3
+    assert db.session.get(Post, post_id).version == version + 3
+
+    comment_id = Comment.query.filter_by(post_id=post_id, author_id=bob_id).first().id
+    client.post(f'/comment/{comment_id}/delete')
+    assert post_counts(post_id)[2] == 2
+    assert_post_counters_match(post_id)
+
+def test_reconcile_repairs_drifted_counters(client, users_and_post):
+    alice_id, bob_id, post_id = users_and_post
+    other = Post(author_id=bob_id, content='Untouched post', category='personal')
+    comment = Comment(post_id=post_id, author_id=bob_id, content='A comment')
+    db.session.add_all([other, comment])
+    db.session.flush()
+    db.session.add_all([
+        PostLike(post_id=post_id, user_id=alice_id, vote_type=1),
+        PostLike(post_id=post_id, user_id=bob_id, vote_type=-1),
+        CommentLike(comment_id=comment.id, user_id=alice_id, vote_type=1),
+    ])
+    db.session.commit()
+    counters.reconcile_posts()
+    counters.reconcile_comments()
+    db.session.commit()
+    assert_post_counters_match(post_id)
+    assert_comment_counters_match(comment.id)
+
+    # Drift written straight into the columns, as a lost update would leave it
+    post = db.session.get(Post, post_id)
+    post.like_count, post.dislike_count, post.comment_count = 7, 0, 5
+    db.session.get(Comment, comment.id).dislike_count = 3
+    db.session.commit()
+    version = post.version
+
+    assert counters.reconcile_posts([other.id]) == 0
+    assert counters.reconcile_posts() == 1
+    assert counters.reconcile_comments() == 1
+    db.session.commit()
+    assert post_counts(post_id) == (1, 1, 1)
+    assert comment_counts(comment.id) == (1, 0)
+    assert db.session.get(Post, post_id).version == version + 1
+
+    # Nothing is left to fix
+    assert counters.reconcile_posts() == 0
+    assert counters.reconcile_comments() == 0
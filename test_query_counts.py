@@ -0,0 +1,752 @@
+"""
+Query-count regression tests for the feed and friend pages
+
+Runs the app against an in-memory SQLite database and counts the SQL
+statements each request issues, so N+1 patterns show up as failures.
+"""
+
+import os
+import sys
+import time
+import gzip
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['ACTIVITY_LOG_MODE'] = 'sync'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from flask import g
+
+from app import app
+from models import db, User, Profile, Friendship, Post, Comment, PostLike, Message, ActivityLog, ActivityDailyCount, ChatHistory
+import counters
+import friend_graph
+import messaging
+import activity_logger
+import admin_stats
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        # Every test database starts its ids at 1, so cached fragments, friend sets and counts must not leak between tests
+        for name in ('fragment_cache', 'friend_graph', 'activity_log_counts'):
+            if app.extensions.get(name) is not None:
+                app.extensions[name].clear()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def make_user(name):
+    user = User(username=name, email=f'{name}@example.com', name=name, password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Profile(user_id=user.id, secret_key=f'key-{name}',
+                           profile_picture=f'https://example.com/{name}.jpg'))
+    return user
+
+def befriend(user_a, user_b):
+    db.session.add(Friendship(user1_id=min(user_a.id, user_b.id), user2_id=max(user_a.id, user_b.id)))
+    friend_graph.invalidate(user_a.id, user_b.id)
+
+def login(client, user):
+    # The fixture keeps one app context open, so drop Flask-Login's cached user from g
+    g.pop('_login_user', None)
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+def seed_feed(viewer, friends, posts_per_author):
+    """Give every author posts with votes and a few comments"""
+    for author in [viewer] + friends:
+        for i in range(posts_per_author):
+            post = Post(author_id=author.id, content=f'Post {i} by {author.name}', category='personal')
+            db.session.add(post)
+            db.session.flush()
+            for voter in friends:
+                db.session.add(PostLike(post_id=post.id, user_id=voter.id, vote_type=1 if voter.id % 2 else -1))
+            for commenter in friends + [viewer]:
+                db.session.add(Comment(post_id=post.id, author_id=commenter.id, content='Nice'))
+            db.session.add(Comment(post_id=post.id, content='Swift says hi', is_ai_comment=True))
+    counters.reconcile_posts()
+    db.session.commit()
+
+def feed_query_count(client, viewer):
+    login(client, viewer)
+    # Measure with a cold friend-graph cache so every call counts the same work
+    app.extensions['friend_graph'].clear()
+    # Render every post on one page so the count covers the whole feed
+    app.config['FEED_PAGE_SIZE'] = 1000
+    try:
+        with count_queries() as statements:
+            response = client.get('/posts')
+    finally:
+        app.config['FEED_PAGE_SIZE'] = 20
+    assert response.status_code == 200
+    return len(statements)
+
+def test_feed_query_count_is_independent_of_post_count(client):
+    viewer = make_user('viewer')
+    friends = [make_user(f'friend{i}') for i in range(4)]
+    for friend in friends:
+        befriend(viewer, friend)
+    db.session.commit()
+
+    seed_feed(viewer, friends, posts_per_author=1)
+    small_feed = feed_query_count(client, viewer)
+
+    seed_feed(viewer, friends, posts_per_author=20)
+    large_feed = feed_query_count(client, viewer)
+
+    assert large_feed == small_feed
+
+def test_feed_renders_aggregates(client):
+    viewer = make_user('viewer')
+    friend = make_user('friend')
+    befriend(viewer, friend)
+    db.session.commit()
+
+    post = Post(author_id=friend.id, content='Hello network', category='personal')
+    db.session.add(post)
+    db.session.flush()
+    db.session.add(PostLike(post_id=post.id, user_id=viewer.id, vote_type=1))
+    for i in range(5):
+        db.session.add(Comment(post_id=post.id, author_id=viewer.id, content=f'comment {i}'))
+    counters.reconcile_posts()
+    db.session.commit()
+
+    login(client, viewer)
+    html = client.get('/posts').get_data(as_text=True)
+
+    assert 'Hello network' in html
+    assert 'comment 0' in html and 'comment 2' in html
+    assert 'comment 3' not in html
+    assert 'View all 5 comments' in html
+
+def test_feed_reuses_cached_cards_until_they_change(client):
+    viewer = make_user('viewer')
+    friend = make_user('friend')
+    befriend(viewer, friend)
+    db.session.commit()
+    viewer_id, friend_id = viewer.id, friend.id
+
+    post = Post(author_id=friend_id, content='Hello network', category='personal')
+    db.session.add(post)
+    db.session.flush()
+    post_id = post.id
+    db.session.add(Comment(post_id=post_id, author_id=viewer_id, content='First!'))
+    counters.reconcile_posts()
+    db.session.commit()
+
+    def render_feed():
+        login(client, db.session.get(User, viewer_id))
+        with count_queries() as statements:
+            html = client.get('/posts').get_data(as_text=True)
+        previews = [statement for statement in statements if 'row_number()' in statement]
+        return html, previews
+
+    html, previews = render_feed()
+    assert 'viewer' in html and len(previews) == 1
+
+    # Every fragment is cached, so the comment previews are not loaded again
+    html, previews = render_feed()
+    assert 'First!' in html and previews == []
+
+    # A new comment moves the post to a new version
+    login(client, db.session.get(User, friend_id))
+    client.post(f'/post/{post_id}/comment', data={'content': 'Thanks'})
+    html, previews = render_feed()
+    assert 'Thanks' in html and len(previews) == 1
+
+    # So does renaming the post's author or one of its commenters
+    db.session.get(User, friend_id).name = 'Renamed Friend'
+    db.session.commit()
+    html, _ = render_feed()
+    assert 'Renamed Friend' in html
+
+    db.session.get(User, viewer_id).name = 'Renamed Viewer'
+    db.session.commit()
+    html, previews = render_feed()
+    assert len(previews) == 1
+    assert '<span class="comment-author">Renamed Viewer</span>' in html
+
+def test_feed_keyset_pages_cover_every_post_once(client):
+    viewer = make_user('viewer')
+    db.session.commit()
+    for i in range(5):
+        db.session.add(Post(author_id=viewer.id, content=f'Paged post {i}', category='personal'))
+    db.session.commit()
+
+    app.config['FEED_PAGE_SIZE'] = 2
+    login(client, viewer)
+    try:
+        seen = []
+        cursor = ''
+        while True:
+            data = client.get(f'/api/posts/feed?before={cursor}').get_json()
+            seen += [i for i in range(5) if f'Paged post {i}' in data['html']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+    finally:
+        app.config['FEED_PAGE_SIZE'] = 20
+
+    assert sorted(seen) == list(range(5))
+
+FRIEND_PAGES = ['/friends', '/profile', '/search?q=friend', '/messages', '/messages/{friend_id}']
+# The chat page also loads the message window, with a second query when the recent window is empty
+MAX_PAGE_QUERIES = {'/messages/{friend_id}': 7}
+
+def page_query_count(client, user_id, path):
+    login(client, db.session.get(User, user_id))
+    # Start from an empty identity map and friend-graph cache so earlier requests cannot hide queries
+    app.extensions['friend_graph'].clear()
+    db.session.expunge_all()
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize('path', FRIEND_PAGES)
+def test_friend_list_query_count_is_fixed(client, path):
+    viewer = make_user('viewer')
+    few = make_user('few')
+    friends = [make_user(f'friend{i}') for i in range(500)]
+    befriend(few, viewer)
+    for friend in friends:
+        befriend(viewer, friend)
+    db.session.commit()
+    viewer_id, few_id = viewer.id, few.id
+
+    # The chat page is opened with the one friend the two users share: each other
+    many_friends_count = page_query_count(client, viewer_id, path.format(friend_id=few_id))
+    assert many_friends_count == page_query_count(client, few_id, path.format(friend_id=viewer_id))
+    assert many_friends_count <= MAX_PAGE_QUERIES.get(path, 6)
+
+def test_unread_count_tracks_reads_without_scanning_messages(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    login(client, alice)
+    for i in range(3):
+        client.post(f'/send-message/{bob_id}', data={'message': f'Hello {i}'})
+
+    login(client, db.session.get(User, bob_id))
+    db.session.expunge_all()
+    with count_queries() as statements:
+        assert client.get('/api/unread-count').get_json() == {'count': 3}
+    assert not any('messages' in statement for statement in statements)
+
+    client.get(f'/messages/{alice_id}')
+    assert client.get('/api/unread-count').get_json() == {'count': 0}
+    assert messaging.reconcile_unread_counts() == 0
+
+def test_inbox_lists_conversations_by_recency(client):
+    viewer = make_user('viewer')
+    friends = [make_user(f'friend{i}') for i in range(3)]
+    for friend in friends:
+        befriend(viewer, friend)
+    db.session.commit()
+    viewer_id = viewer.id
+    friend_ids = [friend.id for friend in friends]
+
+    # friend0 writes first, then the viewer writes to friend2, then friend1 writes twice
+    login(client, friends[0])
+    client.post(f'/send-message/{viewer_id}', data={'message': 'Oldest thread'})
+    login(client, db.session.get(User, viewer_id))
+    client.post(f'/send-message/{friend_ids[2]}', data={'message': 'Middle thread'})
+    login(client, db.session.get(User, friend_ids[1]))
+    client.post(f'/send-message/{viewer_id}', data={'message': 'First of two'})
+    client.post(f'/send-message/{viewer_id}', data={'message': 'Newest thread'})
+
+    conversations, next_cursor = messaging.inbox(viewer_id, limit=2)
+    assert [c['user'].id for c in conversations] == [friend_ids[1], friend_ids[2]]
+    assert [c['unread'] for c in conversations] == [2, 0]
+    assert conversations[0]['snippet'] == 'Newest thread'
+
+    older, _ = messaging.inbox(viewer_id, limit=2, before_message_id=next_cursor)
+    assert [c['user'].id for c in older] == [friend_ids[0]]
+
+    login(client, db.session.get(User, viewer_id))
+    client.get(f'/messages/{friend_ids[1]}')
+    html = client.get('/messages').get_data(as_text=True)
+    assert html.index('Newest thread') < html.index('You: Middle thread') < html.index('Oldest thread')
+    assert messaging.inbox(viewer_id)[0][0]['unread'] == 0
+
+def test_conversation_summary_keeps_the_newest_message_when_recorded_out_of_order(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    older = Message(sender_id=alice.id, receiver_id=bob.id, content='Sent first')
+    newer = Message(sender_id=bob.id, receiver_id=alice.id, content='Sent second')
+    db.session.add_all([older, newer])
+    db.session.flush()
+
+    # The newer message's transaction reaches the upsert first
+    messaging.record_message_sent(newer)
+    messaging.record_message_sent(older)
+    db.session.commit()
+
+    conversation = messaging.inbox(alice.id)[0][0]
+    assert conversation['snippet'] == 'Sent second'
+    assert conversation['unread'] == 1
+    assert messaging.inbox(bob.id)[0][0]['unread'] == 1
+
+def test_chat_history_pages_back_by_id(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    app.config['CHAT_PAGE_SIZE'] = 4
+    try:
+        for i in range(10):
+            login(client, db.session.get(User, alice_id if i % 2 else bob_id))
+            client.post(f'/send-message/{bob_id if i % 2 else alice_id}', data={'message': f'msg {i:02d}'})
+
+        login(client, db.session.get(User, alice_id))
+        html = client.get(f'/messages/{bob_id}').get_data(as_text=True)
+        assert 'msg 09' in html and 'msg 06' in html and 'msg 05' not in html
+        assert 'Load earlier messages' in html
+
+        seen = []
+        data = {'messages': [], 'has_more': True}
+        before_id = client.get(f'/api/messages/{bob_id}/latest').get_json()['messages'][-4]['id']
+        while data['has_more']:
+            data = client.get(f'/api/messages/{bob_id}/history?before_id={before_id}').get_json()
+            seen = [m['content'] for m in data['messages']] + seen
+            before_id = data['messages'][0]['id']
+        assert seen == [f'msg {i:02d}' for i in range(6)]
+    finally:
+        app.config['CHAT_PAGE_SIZE'] = 50
+
+def test_send_message_writes_in_one_transaction(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    login(client, alice)
+    commits = []
+
+    def after_commit(session):
+        commits.append(session)
+
+    event.listen(Session, 'after_commit', after_commit)
+    try:
+        with count_queries() as statements:
+            client.post(f'/send-message/{bob_id}', data={'message': 'Hello'})
+    finally:
+        event.remove(Session, 'after_commit', after_commit)
+
+    assert len(commits) == 1
+    inserted = sorted(statement.split()[2] for statement in statements if statement.startswith('INSERT'))
+    assert inserted == ['activity_logs', 'activity_logs', 'conversations', 'messages']
+    assert Message.query.filter_by(sender_id=alice_id, receiver_id=bob_id).count() == 1
+    descriptions = {log.user_id: activity_logger.describe_activity(log) for log in ActivityLog.query.all()}
+    assert descriptions == {alice_id: 'Sent message to bob', bob_id: 'Received message from alice'}
+
+def test_activity_log_renders_current_names_in_one_query(client):
+    viewer = make_user('viewer')
+    friends = [make_user(f'friend{i}') for i in range(10)]
+    db.session.commit()
+    viewer_id = viewer.id
+    for friend in friends:
+        activity_logger.log_friend_request_sent(viewer_id, friend.id)
+    activity_logger.log_post_created(viewer_id, 1, 'tech')
+    activity_logger.log_activity(viewer_id, 'custom_event', 'Did something unusual')
+    friends[0].name = 'Renamed Friend'
+    db.session.commit()
+    assert all(log.description is None for log in ActivityLog.query.filter(ActivityLog.activity_type != 'custom_event'))
+
+    html_count = page_query_count(client, viewer_id, '/activity-log')
+    html = client.get('/activity-log').get_data(as_text=True)
+    assert 'Sent friend request to Renamed Friend' in html and 'Sent friend request to friend9' in html
+    assert 'Created a tech post' in html and 'Did something unusual' in html
+    # Current user, the page with its target users joined in, the page count and the navbar's profile
+    assert html_count <= 4
+
+def test_buffered_activity_log_writes_in_batches(client):
+    alice = make_user('alice')
+    db.session.commit()
+    alice_id = alice.id
+
+    buffer = activity_logger.ActivityBuffer(app, max_size=3, batch_size=2, background=False)
+    app.extensions['activity_logger'] = buffer
+    try:
+        with count_queries() as statements:
+            for i in range(5):
+                activity_logger.log_activity(alice_id, 'login', f'Login {i}')
+            # The fourth row found the queue full, so the caller wrote a batch of two
+            assert buffer.pending() == 3
+            assert buffer.flush() == 3
+    finally:
+        app.extensions['activity_logger'] = None
+
+    inserts = [statement for statement in statements if statement.startswith('INSERT')]
+    assert len(inserts) == 3
+    assert buffer.flushed == 5 and buffer.dropped == 0
+    assert [log.description for log in ActivityLog.query.order_by(ActivityLog.id)] == [f'Login {i}' for i in range(5)]
+
+def test_background_activity_writer_flushes_full_batches_and_the_rest_at_exit(client):
+    alice = make_user('alice')
+    db.session.commit()
+    alice_id = alice.id
+
+    buffer = activity_logger.ActivityBuffer(app, batch_size=2, flush_interval=60)
+    app.extensions['activity_logger'] = buffer
+    try:
+        # A full batch wakes the writer thread
+        for i in range(2):
+            activity_logger.log_activity(alice_id, 'login', f'Login {i}')
+        deadline = time.monotonic() + 5
+        while buffer.flushed < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert buffer.flushed == 2
+
+        # A lone row waits for the flush interval
+        activity_logger.log_activity(alice_id, 'login', 'Login 2')
+        time.sleep(0.05)
+        assert buffer.pending() == 1
+
+        # What the atexit hook runs
+        assert buffer.flush() == 1
+    finally:
+        app.extensions['activity_logger'] = None
+
+    assert buffer.flushed == 3 and buffer.dropped == 0
+    db.session.expire_all()
+    assert sorted(log.description for log in ActivityLog.query) == [f'Login {i}' for i in range(3)]
+
+def test_admin_delete_user_logs_the_deleted_user_without_a_foreign_key(client):
+    admin = make_user('admin')
+    admin.is_admin = True
+    bob = make_user('bob')
+    db.session.commit()
+    admin_id, bob_id = admin.id, bob.id
+
+    login(client, admin)
+    client.post(f'/admin/user/{bob_id}/delete')
+
+    assert db.session.get(User, bob_id) is None
+    log = ActivityLog.query.filter_by(user_id=admin_id, activity_type='delete_user').one()
+    assert log.target_user_id is None
+    assert log.activity_data['user_id'] == bob_id
+    assert activity_logger.describe_activity(log) == 'Deleted user bob (bob@example.com)'
+
+def test_activity_log_keyset_pages_and_cached_total(client):
+    viewer = make_user('viewer')
+    db.session.commit()
+    viewer_id = viewer.id
+    now = datetime.utcnow()
+    # Two rows share each timestamp so the id tie-breaker is exercised; the last ten are outside 'days'
+    for i in range(25):
+        db.session.add(ActivityLog(user_id=viewer_id, activity_type='custom_event', description=f'Event {i}',
+                                   created_at=now - timedelta(hours=i // 2 + (200 if i >= 15 else 0))))
+    db.session.commit()
+
+    pages = []
+    cursor = None
+    while True:
+        activities, newer, older = activity_logger.activity_page(viewer_id, 'all', before=cursor, page_size=10)
+        pages.append(activities)
+        if not older:
+            break
+        cursor = older
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert len({activity.id for page in pages for activity in page}) == 25
+
+    back, newer, older = activity_logger.activity_page(viewer_id, 'all', after=newer, page_size=10)
+    assert [a.id for a in back] == [a.id for a in pages[1]]
+    back, newer, older = activity_logger.activity_page(viewer_id, 'all', after=newer, page_size=10)
+    assert [a.id for a in back] == [a.id for a in pages[0]] and newer is None
+
+    recent = activity_logger.activity_page(viewer_id, 'days', page_size=50)[0]
+    assert sorted(a.description for a in recent) == sorted(f'Event {i}' for i in range(15))
+
+    assert activity_logger.activity_count(viewer_id, 'all') == (25, False)
+    db.session.add(ActivityLog(user_id=viewer_id, activity_type='custom_event', description='Late', created_at=now))
+    db.session.commit()
+    with count_queries() as statements:
+        assert activity_logger.activity_count(viewer_id, 'all') == (25, False)
+    assert statements == []
+
+    login(client, db.session.get(User, viewer_id))
+    html = client.get(f'/activity-log?before={cursor}').get_data(as_text=True)
+    assert 'Event 24' in html and 'Newer' in html and 'Older' not in html
+
+def test_admin_activity_stats_combine_rollups_and_raw_rows(client):
+    admin = make_user('admin')
+    admin.is_admin = True
+    alice = make_user('alice')
+    bob = make_user('bob')
+    db.session.commit()
+    admin_id, alice_id = admin.id, alice.id
+    today = datetime.utcnow().date()
+    old_day = today - timedelta(days=400)
+    # A dropped partition's day lives only in the rollup table
+    db.session.add(ActivityDailyCount(user_id=alice.id, activity_type='login', day=old_day, count=7))
+    db.session.add(ActivityDailyCount(user_id=bob.id, activity_type='login', day=old_day, count=2))
+    for user in (alice, alice, bob):
+        db.session.add(ActivityLog(user_id=user.id, activity_type='login'))
+    db.session.add(ActivityLog(user_id=alice.id, activity_type='like_post'))
+    db.session.commit()
+
+    login(client, db.session.get(User, alice_id))
+    assert client.get('/admin/activity-stats').status_code == 403
+
+    login(client, db.session.get(User, admin_id))
+    stats = client.get(f'/admin/activity-stats?since={old_day.isoformat()}').get_json()
+    assert stats['days'] == [
+        {'day': old_day.isoformat(), 'activity_type': 'login', 'count': 9},
+        {'day': today.isoformat(), 'activity_type': 'like_post', 'count': 1},
+        {'day': today.isoformat(), 'activity_type': 'login', 'count': 3},
+    ]
+    stats = client.get(f'/admin/activity-stats?since={old_day.isoformat()}&until={today.isoformat()}'
+                       f'&user_id={alice_id}').get_json()
+    assert stats['days'] == [{'day': old_day.isoformat(), 'activity_type': 'login', 'count': 7}]
+
+    # The default range is the last 30 days
+    assert [row['count'] for row in client.get('/admin/activity-stats').get_json()['days']] == [1, 3]
+    assert client.get('/admin/activity-stats?since=yesterday').status_code == 400
+
+def test_admin_activity_export_streams_filtered_rows(client):
+    admin = make_user('admin')
+    admin.is_admin = True
+    alice = make_user('alice')
+    db.session.commit()
+    admin_id, alice_id = admin.id, alice.id
+    for i in range(2500):
+        db.session.add(ActivityLog(user_id=alice_id, activity_type='like_post' if i % 2 else 'login',
+                                   activity_data={'post_id': i}, created_at=datetime(2026, 1, 1) + timedelta(minutes=i)))
+    db.session.add(ActivityLog(user_id=admin_id, activity_type='login'))
+    db.session.commit()
+
+    login(client, alice)
+    assert client.get('/admin/activity-logs/export').status_code == 403
+
+    login(client, db.session.get(User, admin_id))
+    response = client.get(f'/admin/activity-logs/export?user_id={alice_id}&type=like_post&since=2026-01-01T10:00')
+    assert response.is_streamed and response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 1250 - 300
+    assert rows[0]['activity_data'] == {'post_id': 601} and rows[0]['created_at'] == '2026-01-01T10:01:00'
+
+    response = client.get('/admin/activity-logs/export?format=csv&until=2026-01-01T00:10',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert lines[0] == 'id,user_id,activity_type,description,target_user_id,activity_data,created_at'
+    assert len(lines) == 11
+
+    assert client.get('/admin/activity-logs/export?since=yesterday').status_code == 400
+
+def admin_panel_query_count(client, admin_id, path='/admin'):
+    login(client, db.session.get(User, admin_id))
+    db.session.expunge_all()
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    return len(statements), response.get_data(as_text=True)
+
+def test_admin_panel_stats_use_a_fixed_number_of_queries(client):
+    admin = make_user('admin')
+    admin.is_admin = True
+    users = [make_user(f'user{i}') for i in range(3)]
+    db.session.commit()
+    admin_id = admin.id
+    few_users, _ = admin_panel_query_count(client, admin_id)
+
+    users = User.query.filter(User.id != admin_id).order_by(User.id).all()
+    users += [make_user(f'more{i}') for i in range(30)]
+    befriend(users[0], users[1])
+    befriend(users[2], users[1])
+    for i in range(3):
+        db.session.add(Post(author_id=users[1].id, content=f'Post {i}', category='personal'))
+    db.session.add(Message(sender_id=users[0].id, receiver_id=users[1].id, content='Hi'))
+    # Three turns in two sessions are two chat sessions
+    for session_id in ('a', 'a', 'b'):
+        db.session.add(ChatHistory(user_id=users[1].id, session_id=session_id, user_message='Hi', ai_response='Hello'))
+    db.session.commit()
+
+    many_users, html = admin_panel_query_count(client, admin_id, '/admin?sort=posts_count&direction=desc')
+    assert many_users == few_users
+    assert html.index('@user1') < html.index('@user0')
+
+    stats = admin_stats.user_stats_page(exclude_user_id=admin_id, sort='posts_count')[0][0]
+    assert stats['user'].username == 'user1'
+    assert (stats['posts_count'], stats['messages_received'], stats['friends_count'], stats['chat_sessions']) == (3, 1, 2, 2)
+    assert admin_stats.platform_totals() == {'users': 34, 'posts': 3, 'messages': 1, 'chat_sessions': 2}
+
+    app.config['ADMIN_PAGE_SIZE'] = 10
+    try:
+        _, html = admin_panel_query_count(client, admin_id, '/admin?sort=name&direction=asc&page=4')
+    finally:
+        app.config['ADMIN_PAGE_SIZE'] = 50
+    assert 'Page 4 of 4' in html and html.count('title="View User Details"') == 3
+
+def test_polling_endpoints_answer_304_until_something_changes(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    login(client, alice)
+    client.post(f'/send-message/{bob_id}', data={'message': 'Hello'})
+
+    login(client, db.session.get(User, bob_id))
+    for path in ('/api/unread-count', f'/api/messages/{alice_id}/latest?last_id=0'):
+        first = client.get(path)
+        assert first.status_code == 200 and first.headers['ETag']
+
+        with count_queries() as statements:
+            repeat = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+        assert repeat.status_code == 304 and repeat.headers['ETag'] == first.headers['ETag']
+        assert not any('FROM messages' in statement for statement in statements)
+
+    etag = client.get(f'/api/messages/{alice_id}/latest?last_id=0').headers['ETag']
+    login(client, db.session.get(User, alice_id))
+    client.post(f'/send-message/{bob_id}', data={'message': 'Again'})
+    login(client, db.session.get(User, bob_id))
+    changed = client.get(f'/api/messages/{alice_id}/latest?last_id=0', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert [m['content'] for m in changed.get_json()['messages']] == ['Hello', 'Again']
+
+def test_truncated_latest_messages_poll_is_not_answered_with_304(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+    for i in range(250):
+        message = Message(sender_id=alice_id, receiver_id=bob_id, content=f'Burst {i}')
+        db.session.add(message)
+        db.session.flush()
+        messaging.record_message_sent(message)
+    db.session.commit()
+
+    login(client, db.session.get(User, bob_id))
+    first = client.get(f'/api/messages/{alice_id}/latest?last_id=0')
+    received = first.get_json()['messages']
+    assert len(received) == 200
+
+    # The client moves its cursor on but still sends the ETag of the truncated answer
+    rest = client.get(f"/api/messages/{alice_id}/latest?last_id={received[-1]['id']}",
+                      headers={'If-None-Match': first.headers['ETag']})
+    assert rest.status_code == 200
+    assert [m['content'] for m in rest.get_json()['messages']] == [f'Burst {i}' for i in range(200, 250)]
+
+    done = client.get(f"/api/messages/{alice_id}/latest?last_id={rest.get_json()['messages'][-1]['id']}",
+                      headers={'If-None-Match': rest.headers['ETag']})
+    assert done.status_code == 200 and done.get_json()['messages'] == []
+
+def test_message_search_is_scoped_paginated_and_links_into_chat(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    carol = make_user('carol')
+    befriend(alice, bob)
+    befriend(bob, carol)
+    db.session.commit()
+    alice_id, bob_id, carol_id = alice.id, bob.id, carol.id
+
+    for i in range(5):
+        db.session.add(Message(sender_id=alice_id if i % 2 else bob_id, receiver_id=bob_id if i % 2 else alice_id,
+                               content=f'Lunch plan {i}'))
+        db.session.add(Message(sender_id=bob_id, receiver_id=carol_id, content=f'Lunch with carol {i}'))
+    db.session.add(Message(sender_id=alice_id, receiver_id=bob_id, content='<script>x</script> lunch'))
+    db.session.commit()
+
+    results, has_more = messaging.search_messages(alice_id, 'LUNCH', per_page=4)
+    assert has_more and len(results) == 4
+    assert all(result['user'].id == bob_id for result in results)
+    assert '<script>' not in results[0]['snippet'] and '&lt;script&gt;' in results[0]['snippet']
+    last_page, has_more = messaging.search_messages(alice_id, 'lunch', page=2, per_page=4)
+    assert not has_more and len(last_page) == 2
+    assert not any('carol' in result['snippet'] for result in results + last_page)
+
+    login(client, db.session.get(User, alice_id))
+    html = client.get('/messages?q=plan').get_data(as_text=True)
+    target_id = Message.query.filter_by(content='Lunch plan 0').one().id
+    assert f'message_id={target_id}#message-{target_id}' in html
+
+    app.config['CHAT_PAGE_SIZE'] = 2
+    try:
+        html = client.get(f'/messages/{bob_id}?message_id={target_id}').get_data(as_text=True)
+    finally:
+        app.config['CHAT_PAGE_SIZE'] = 50
+    assert f'id="message-{target_id}"' in html and 'focused' in html
+    assert 'Lunch plan 2' in html and 'Lunch plan 3' not in html
+
+def test_chat_pages_are_time_bounded_across_months(client):
+    from datetime import datetime, timedelta
+
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    # Six messages a month apart, the two newest sent from clocks a moment out of order
+    now = datetime.utcnow()
+    sent = [now - timedelta(days=30 * (5 - i)) for i in range(6)]
+    sent[5], sent[4] = sent[4] + timedelta(seconds=1), sent[4]
+    for i, timestamp in enumerate(sent):
+        db.session.add(Message(sender_id=alice_id if i % 2 else bob_id, receiver_id=bob_id if i % 2 else alice_id,
+                               content=f'month {i}', timestamp=timestamp))
+    db.session.commit()
+
+    with count_queries() as statements:
+        page, has_more = messaging.recent_messages(alice_id, bob_id, 2)
+    assert [m.content for m in page] == ['month 4', 'month 5'] and has_more
+    # The recent window holds only two messages, so the page falls back to the history below the window
+    assert 'messages.timestamp >=' in statements[0]
+    assert 'messages.timestamp >=' not in statements[1] and 'messages.timestamp <=' in statements[1]
+
+    seen = [m.content for m in page]
+    while has_more:
+        page, has_more = messaging.recent_messages(alice_id, bob_id, 2, before_id=page[0].id)
+        seen = [m.content for m in page] + seen
+    assert seen == [f'month {i}' for i in range(6)]
+
+    first = Message.query.filter_by(content='month 0').one()
+    first_id, first_time = first.id, first.timestamp
+    with count_queries() as statements:
+        newer = messaging.messages_after(alice_id, bob_id, first_id, after_time=first_time)
+    assert [m.content for m in newer] == [f'month {i}' for i in range(1, 6)]
+    # The caller's timestamp bounds the query; the cursor message is not looked up
+    assert len(statements) == 1 and 'messages.timestamp >=' in statements[0]
+
+    # A poll that sends its last message's timestamp gets the same answer in one messages query
+    login(client, db.session.get(User, alice_id))
+    last_timestamp = first_time.strftime('%Y-%m-%d %H:%M:%S')
+    with count_queries() as statements:
+        polled = client.get(f'/api/messages/{bob_id}/latest?last_id={first_id}&last_timestamp={last_timestamp}')
+    assert [m['content'] for m in polled.get_json()['messages']] == [f'month {i}' for i in range(1, 6)]
+    assert len([statement for statement in statements if 'FROM messages' in statement]) == 1
@@ -0,0 +1,160 @@
+"""
+Tests for the Server-Sent Events channel using the in-process broker
+"""
+
+import os
+import sys
+import json
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['ACTIVITY_LOG_MODE'] = 'sync'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask
+
+from app import app
+from models import db, User, FriendRequest
+from test_query_counts import make_user, befriend, login
+import friend_graph
+import realtime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        app.extensions['friend_graph'].clear()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def read_event(frames):
+    """Return the next (event, data) from an SSE frame iterator, skipping keepalives"""
+    for frame in frames:
+        frame = frame.decode() if isinstance(frame, bytes) else frame
+        if frame.startswith('event:'):
+            event_line, data_line = frame.strip().split('\n')
+            return event_line[len('event: '):], json.loads(data_line[len('data: '):])
+
+def test_stream_pushes_new_messages(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    befriend(alice, bob)
+    db.session.commit()
+    alice_id, bob_id = alice.id, bob.id
+
+    broker = app.extensions['realtime']
+    assert isinstance(broker, realtime.MemoryBroker)
+    frames = realtime.stream(broker, bob_id, [('unread', {'count': 0})], duration=5, heartbeat=1)
+    assert read_event(frames) == ('unread', {'count': 0})
+
+    login(client, alice)
+    client.post(f'/send-message/{bob_id}', data={'message': 'Hi Bob'})
+
+    event, data = read_event(frames)
+    assert event == 'message'
+    assert data['content'] == 'Hi Bob'
+    assert data['sender_id'] == alice_id
+    assert read_event(frames)[0] == 'unread'
+    frames.close()
+
+def test_rolled_back_events_are_not_delivered(client):
+    user = make_user('carol')
+    db.session.commit()
+    user_id = user.id
+
+    broker = app.extensions['realtime']
+    subscription = broker.subscribe(user_id)
+    try:
+        realtime.publish(user_id, 'unread', {'count': 1})
+        db.session.rollback()
+        realtime.publish(user_id, 'unread', {'count': 2})
+        db.session.commit()
+
+        assert subscription.get(timeout=0.1) == ('unread', {'count': 2})
+        assert subscription.get(timeout=0.1) is None
+    finally:
+        broker.unsubscribe(subscription)
+
+class RecordingBroker(realtime.PostgresBroker):
+    """Postgres broker that records broadcasts instead of sending NOTIFY"""
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.broadcasts = []
+
+    def broadcast(self, topic, data):
+        self.broadcasts.append((topic, data))
+
+    def listen(self):
+        pass
+
+def test_friend_graph_invalidations_are_broadcast_to_other_workers(client):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    carol = make_user('carol')
+    db.session.commit()
+    alice_id, bob_id, carol_id = alice.id, bob.id, carol.id
+
+    # Another worker process with its own memory cache, registered with its own broker
+    other_broker = RecordingBroker(db.engine)
+    other_worker = Flask('other_worker')
+    other_worker.extensions['realtime'] = other_broker
+    friend_graph.init_app(other_worker)
+    other_cache = other_worker.extensions['friend_graph']
+    for user_id in (alice_id, bob_id, carol_id):
+        other_cache.set(f'friends:{user_id}', frozenset())
+
+    broker = RecordingBroker(db.engine)
+    previous = app.extensions['realtime']
+    app.extensions['realtime'] = broker
+    try:
+        login(client, bob)
+        client.post(f'/send-friend-request/{alice_id}')
+        request_id = FriendRequest.query.filter_by(sender_id=bob_id).one().id
+        login(client, db.session.get(User, alice_id))
+        assert not friend_graph.are_friends(alice_id, bob_id)
+        client.get(f'/respond-friend-request/{request_id}/accept')
+    finally:
+        app.extensions['realtime'] = previous
+
+    # This worker dropped its own entries
+    assert friend_graph.are_friends(alice_id, bob_id)
+    assert broker.broadcasts == [('friend_graph', sorted([alice_id, bob_id]))]
+
+    # What the other worker's listener does with the NOTIFY
+    topic, user_ids = broker.broadcasts[0]
+    other_broker._dispatch({'topic': topic, 'data': user_ids})
+    assert other_cache.get(f'friends:{alice_id}') is None
+    assert other_cache.get(f'friends:{bob_id}') is None
+    assert other_cache.get(f'friends:{carol_id}') == frozenset()
+
+    # On (re)connecting, missed broadcasts are assumed and everything is dropped
+    other_broker._dispatch({'topic': topic, 'data': None})
+    assert other_cache.get(f'friends:{carol_id}') is None
+
+def test_streams_per_worker_are_capped(client):
+    alice = make_user('alice')
+    db.session.commit()
+    login(client, alice)
+
+    broker = app.extensions['realtime']
+    previous = broker.max_streams
+    broker.max_streams = 1
+    try:
+        first = client.get('/api/stream')
+        assert first.status_code == 200
+        assert broker.open_streams == 1
+
+        # The worker is at its cap, so the client is sent back to polling
+        assert client.get('/api/stream').status_code == 204
+
+        first.close()
+        assert broker.open_streams == 0
+        again = client.get('/api/stream')
+        assert again.status_code == 200
+        again.close()
+    finally:
+        broker.max_streams = previous
+    assert broker.open_streams == 0
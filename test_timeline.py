@@ -0,0 +1,123 @@
+"""
+Tests for the materialized timelines (FEED_FANOUT=write)
+
+Every write path that touches timeline_entries is checked against the
+fan-out-on-read feed built from the posts and friendships tables.
+"""
+
+import os
+import sys
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['ACTIVITY_LOG_MODE'] = 'sync'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import or_
+
+from app import app
+from models import db, User, Post, Friendship, FriendRequest, TimelineEntry
+from test_query_counts import make_user, login
+import feed
+import timeline
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['FEED_FANOUT'] = 'write'
+    with app.app_context():
+        for name in ('fragment_cache', 'friend_graph', 'activity_log_counts'):
+            if app.extensions.get(name) is not None:
+                app.extensions[name].clear()
+        db.create_all()
+        try:
+            yield app.test_client()
+        finally:
+            app.config['FEED_FANOUT'] = 'read'
+            db.session.remove()
+            db.drop_all()
+
+def pull_feed(user_id):
+    """Post ids of a user's feed assembled from posts and friendships, as in FEED_FANOUT=read"""
+    friendships = Friendship.query.filter(or_(Friendship.user1_id == user_id, Friendship.user2_id == user_id))
+    author_ids = [f.user2_id if f.user1_id == user_id else f.user1_id for f in friendships] + [user_id]
+    return [post.id for post in feed.feed_posts_query(author_ids)]
+
+def timeline_feed(user_id):
+    return [post.id for post in timeline.timeline_posts_query(user_id)]
+
+def assert_timelines_match(*user_ids):
+    db.session.expire_all()
+    for user_id in user_ids:
+        assert timeline_feed(user_id) == pull_feed(user_id), f"timeline of user {user_id}"
+
+def create_post(client, user_id, content):
+    login(client, db.session.get(User, user_id))
+    client.post('/create_post', data={'content': content, 'category': 'personal'})
+    return Post.query.filter_by(content=content).one().id
+
+def make_friends(client, sender_id, receiver_id):
+    login(client, db.session.get(User, sender_id))
+    client.post(f'/send-friend-request/{receiver_id}')
+    request_id = FriendRequest.query.filter_by(sender_id=sender_id, receiver_id=receiver_id).one().id
+    login(client, db.session.get(User, receiver_id))
+    client.get(f'/respond-friend-request/{request_id}/accept')
+
+def test_timelines_follow_posts_and_friendships(client):
+    ids = [make_user(name).id for name in ('alice', 'bob', 'carol')]
+    db.session.commit()
+    alice_id, bob_id, carol_id = ids
+
+    # Posts written before a friendship only reach the author's own timeline
+    for user_id in ids:
+        for i in range(2):
+            create_post(client, user_id, f'Early post {i} by {user_id}')
+    assert_timelines_match(*ids)
+    assert len(timeline_feed(alice_id)) == 2
+
+    # Accepting a friend request backfills both timelines with the other's posts
+    make_friends(client, bob_id, alice_id)
+    assert_timelines_match(*ids)
+    assert len(timeline_feed(alice_id)) == 4
+
+    # A new post fans out to the author and their friends only
+    post_id = create_post(client, alice_id, 'Hello friends')
+    assert_timelines_match(*ids)
+    assert timeline_feed(bob_id)[0] == post_id
+    assert post_id not in timeline_feed(carol_id)
+
+    # Deleting a post removes it from every timeline
+    login(client, db.session.get(User, alice_id))
+    client.post(f'/post/{post_id}/delete')
+    assert db.session.get(Post, post_id) is None
+    assert TimelineEntry.query.filter_by(post_id=post_id).count() == 0
+    assert_timelines_match(*ids)
+
+    # Ending a friendship takes each side's posts out of the other's timeline
+    Friendship.query.filter_by(user1_id=min(alice_id, bob_id), user2_id=max(alice_id, bob_id)).delete()
+    timeline.remove_friendship(alice_id, bob_id)
+    db.session.commit()
+    assert_timelines_match(*ids)
+    assert len(timeline_feed(bob_id)) == 2
+
+    html = client.get('/posts').get_data(as_text=True)
+    assert f'Early post 0 by {alice_id}' in html
+    assert f'Early post 0 by {bob_id}' not in html
+
+def test_rebuild_all_matches_the_pull_feed(client):
+    ids = [make_user(name).id for name in ('alice', 'bob', 'carol', 'dave')]
+    db.session.commit()
+    for user_id in ids:
+        create_post(client, user_id, f'Post by {user_id}')
+    make_friends(client, ids[0], ids[1])
+    make_friends(client, ids[2], ids[0])
+
+    # Friendships and posts written behind the timelines' back, e.g. before FEED_FANOUT=write was turned on
+    db.session.add(Friendship(user1_id=ids[2], user2_id=ids[3]))
+    db.session.add(Post(author_id=ids[3], content='Imported post', category='personal'))
+    TimelineEntry.query.filter_by(user_id=ids[1]).delete()
+    db.session.commit()
+
+    rows = timeline.rebuild_all()
+    assert rows == sum(len(pull_feed(user_id)) for user_id in ids)
+    assert_timelines_match(*ids)
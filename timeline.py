@@ -0,0 +1,120 @@
+"""
+Materialized home timelines (fan-out-on-write)
+
+When FEED_FANOUT is 'write', every post is copied into the timeline of its
+author and of each of the author's friends at creation time, so reading a
+home feed is a single range scan over timeline_entries for one user.
+With the default 'read' mode these helpers are no-ops and the feed is
+assembled from the friends' posts at request time.
+"""
+
+from flask import current_app
+from sqlalchemy import select, insert, literal, union_all, or_, and_
+from sqlalchemy.orm import joinedload
+from models import db, User, Post, Friendship, TimelineEntry
+
+def fanout_on_write():
+    """Whether home timelines are materialized at write time"""
+    return current_app.config.get('FEED_FANOUT', 'read') == 'write'
+
+def _friends_of(user_id):
+    """Select the friend IDs of a user as a single `friend_id` column"""
+    return union_all(
+        select(Friendship.user2_id.label('friend_id')).where(Friendship.user1_id == user_id),
+        select(Friendship.user1_id.label('friend_id')).where(Friendship.user2_id == user_id)
+    ).subquery()
+
+def _insert_entries(rows):
+    """INSERT ... SELECT the (user_id, post_id, author_id, created_at) rows into timeline_entries"""
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'created_at'], rows
+        )
+    )
+
+def add_post(post):
+    """Fan a new post out to its author's and friends' timelines (post must be flushed)"""
+    if not fanout_on_write():
+        return
+
+    friends = _friends_of(post.author_id)
+    readers = union_all(
+        select(literal(post.author_id).label('reader_id')),
+        select(friends.c.friend_id)
+    ).subquery()
+
+    _insert_entries(select(
+        readers.c.reader_id,
+        literal(post.id),
+        literal(post.author_id),
+        literal(post.created_at)
+    ))
+
+def remove_post(post_id):
+    """Remove a post from every timeline"""
+    if not fanout_on_write():
+        return
+    TimelineEntry.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+
+def _copy_posts(reader_id, author_id):
+    """Copy all posts of author_id into reader_id's timeline"""
+    _insert_entries(select(
+        literal(reader_id), Post.id, Post.author_id, Post.created_at
+    ).where(Post.author_id == author_id))
+
+def add_friendship(user1_id, user2_id):
+    """Backfill two new friends' timelines with each other's existing posts"""
+    if not fanout_on_write():
+        return
+    _copy_posts(user1_id, user2_id)
+    _copy_posts(user2_id, user1_id)
+
+def remove_friendship(user1_id, user2_id):
+    """Remove each former friend's posts from the other's timeline"""
+    if not fanout_on_write():
+        return
+    TimelineEntry.query.filter(or_(
+        and_(TimelineEntry.user_id == user1_id, TimelineEntry.author_id == user2_id),
+        and_(TimelineEntry.user_id == user2_id, TimelineEntry.author_id == user1_id)
+    )).delete(synchronize_session=False)
+
+def remove_user(user_id):
+    """Remove a user's own timeline and their posts from everyone else's"""
+    if not fanout_on_write():
+        return
+    TimelineEntry.query.filter(or_(
+        TimelineEntry.user_id == user_id,
+        TimelineEntry.author_id == user_id
+    )).delete(synchronize_session=False)
+
+def timeline_posts_query(user_id):
+    """Query for the posts in a user's materialized timeline, newest first"""
+    return Post.query.options(
+        joinedload(Post.author).joinedload(User.profile)
+    ).join(
+        TimelineEntry, TimelineEntry.post_id == Post.id
+    ).filter(
+        TimelineEntry.user_id == user_id
+    ).order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+
+def rebuild_all():
+    """
+    Rebuild every timeline from the posts and friendships tables
+
+    Uses three bulk INSERT ... SELECT statements (own posts, and posts of
+    friends on either side of the friendship) instead of per-user work.
+    Returns the number of timeline rows written.
+    """
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    # Authors see their own posts
+    _insert_entries(select(Post.author_id, Post.id, Post.author_id, Post.created_at))
+
+    # Friends see each other's posts, in both directions of the friendship
+    _insert_entries(select(Friendship.user1_id, Post.id, Post.author_id, Post.created_at)
+                    .join(Post, Post.author_id == Friendship.user2_id))
+    _insert_entries(select(Friendship.user2_id, Post.id, Post.author_id, Post.created_at)
+                    .join(Post, Post.author_id == Friendship.user1_id))
+
+    db.session.commit()
+    return TimelineEntry.query.count()